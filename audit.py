@@ -0,0 +1,351 @@
+"""Audit log of served predictions, with outcome backfill and live accuracy.
+
+Every scored state is buffered in memory and written out in segments: each
+segment is a small columnar store (see store.py) holding the features, the
+served prediction, the model version and the model-call latency::
+
+    Training/data/audit/
+        20261017-101500-4242-0/    one flushed buffer (AUDIT_SCHEMA columns)
+            outcome.npy            final innings total, written by backfill
+        metrics.json               accuracy statistics and finished segments
+
+States tagged with a Cricsheet match id and innings (live.py match tags,
+``match_id``/``innings`` in service.py requests) can be scored once the
+match has been ingested: ``backfill`` reads the final innings totals from the
+delivery store for just the matches still pending, and folds each newly
+resolved row into per-day sufficient statistics (count, sum of absolute and
+squared errors, sum of outcomes and of their squares) per team, venue and
+over bucket. Rolling MAE and R^2 over any number of days are sums of those
+day cells, so neither backfill nor ``accuracy`` rescans resolved rows.
+
+metrics.json is the commit point of a backfill: new outcomes are staged
+next to each segment, metrics.json is replaced listing them, and only then
+are they moved over ``outcome.npy``. A backfill interrupted after the commit
+finishes the moves on its next run; one interrupted before leaves both the
+statistics and the outcomes as they were, so no row is folded twice or lost.
+
+    python audit.py backfill                  # after refresh.py ingested new matches
+    python audit.py report --by city --days 30
+"""
+import argparse
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import store
+from schema import BALLS_PER_INNINGS, FEATURES
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+AUDIT_ROOT = os.path.join(ROOT, 'Training', 'data', 'audit')
+METRICS_FILE = 'metrics.json'
+OUTCOME_FILE = 'outcome.npy'
+STAGED_OUTCOME = '.outcome.npy.tmp'
+
+AUDIT_SCHEMA = {
+    'match_id': 'int32',
+    'innings': 'int8',
+    'time': 'float64',
+    'source': 'category',
+    'model_version': 'category',
+    'batting_team': 'category',
+    'bowling_team': 'category',
+    'city': 'category',
+    'current_score': 'int16',
+    'balls_left': 'int16',
+    'wickets_left': 'int8',
+    'crr': 'float64',
+    'last_five': 'int16',
+    'predicted': 'float32',
+    'latency_us': 'float32',
+    'batch_size': 'int32',
+}
+
+# Accuracy breakdowns: dimension -> audit column ('overs' is derived)
+DIMENSIONS = {'all': None, 'batting_team': 'batting_team', 'bowling_team': 'bowling_team',
+              'city': 'city', 'overs': 'balls_left'}
+OVER_EDGES = [10, 15]
+OVER_BUCKETS = ['5-9', '10-14', '15-20']
+
+# Outcome markers: not known yet, and never will be (untagged or no such innings)
+PENDING = np.nan
+NO_OUTCOME = -1.0
+DAY = 86400
+
+
+def match_key(tag):
+    """Cricsheet match id of a match tag, or -1 for free-form tags."""
+    tag = str(tag) if tag is not None else ''
+    return int(tag) if tag.isdigit() else -1
+
+
+class AuditLog:
+    """Thread-safe buffered writer; one per process (flushes again at exit).
+
+    A background thread writes the buffer as a segment once it holds
+    ``flush_rows`` states, and every ``flush_interval`` seconds otherwise;
+    ``record`` never touches the disk, so it stays off the callers' latency
+    path. A failed write is reported on stderr and never reaches the caller.
+    """
+
+    def __init__(self, root=AUDIT_ROOT, source='unknown', flush_rows=4096, flush_interval=30.0):
+        self.root = root
+        self.source = source
+        self.flush_rows = flush_rows
+        self.lock = threading.Lock()
+        self.buffer = {col: [] for col in AUDIT_SCHEMA}
+        self.rows = 0
+        self.segments = 0
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(flush_interval,), name='audit-flush', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def _run(self, interval):
+        while True:
+            self.wake.wait(interval)
+            self.wake.clear()
+            self.flush()
+
+    def record(self, columns, predicted, latency, model_version=None, match_ids=None, innings=None):
+        """Buffer a scored batch: ``columns`` over ``FEATURES``, one prediction per row.
+
+        ``latency`` is the seconds the batch took to score; every row of the
+        batch is recorded with it.
+        """
+        n = len(predicted)
+        now = time.time()
+        with self.lock:
+            buffer = self.buffer
+            for col in FEATURES:
+                buffer[col].extend(columns[col])
+            buffer['predicted'].extend(predicted)
+            buffer['match_id'].extend(match_ids if match_ids is not None else [-1] * n)
+            buffer['innings'].extend(innings if innings is not None else [1] * n)
+            buffer['time'].extend([now] * n)
+            buffer['source'].extend([self.source] * n)
+            buffer['model_version'].extend([model_version or 'unknown'] * n)
+            buffer['latency_us'].extend([latency * 1e6] * n)
+            buffer['batch_size'].extend([n] * n)
+            self.rows += n
+            full = self.rows >= self.flush_rows
+        if full:
+            # Written by the flush thread, not on the caller's (event loop's) time
+            self.wake.set()
+
+    def flush(self):
+        with self.lock:
+            if not self.rows:
+                return
+            buffer, self.buffer = self.buffer, {col: [] for col in AUDIT_SCHEMA}
+            self.rows = 0
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.segments}"
+            self.segments += 1
+        # Written under a hidden name and renamed, so backfill never sees half a segment
+        tmp = os.path.join(self.root, f'.{name}')
+        try:
+            store.write_arrays(buffer, tmp, AUDIT_SCHEMA)
+            os.rename(tmp, os.path.join(self.root, name))
+        except (OSError, ValueError) as e:
+            print(f"Audit segment {name} not written: {e}", file=sys.stderr)
+
+
+def segments(root=AUDIT_ROOT):
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if not name.startswith('.') and os.path.isdir(os.path.join(root, name)))
+
+
+def read_segment(root, name, columns=None):
+    """One segment as ``{column: ndarray}``, text columns decoded."""
+    path = os.path.join(root, name)
+    meta = store.read_meta(path)
+    arrays = store.read_columns(path, columns)
+    decoded = {}
+    for col, values in arrays.items():
+        categories = meta['columns'][col].get('categories')
+        decoded[col] = np.asarray(categories, dtype=object)[values] if categories is not None else values
+    return decoded
+
+
+def over_bucket(balls_left):
+    overs = (BALLS_PER_INNINGS - np.asarray(balls_left, dtype='int64')) // 6
+    return np.asarray(OVER_BUCKETS, dtype=object)[np.digitize(overs, OVER_EDGES)]
+
+
+def final_totals(keys, data_root=None):
+    """``(totals, ingested)``: ``{(match_id, innings): runs}`` and the ids of the
+    matches among ``keys`` that are in the delivery store."""
+    import refresh
+
+    deliveries = os.path.join(data_root or refresh.DATA_ROOT, refresh.DELIVERIES_DIR)
+    if not os.path.exists(os.path.join(deliveries, store.META_FILE)):
+        return {}, set()
+    parts = store.read_partitions(deliveries)
+    parts = parts[np.isin(parts[:, 0], sorted({mid for mid, _ in keys}))]
+    columns = store.read_columns(deliveries, ['innings', 'runs'])
+    totals = {}
+    for match_id, start, stop in parts:
+        innings = columns['innings'][start:stop]
+        runs = columns['runs'][start:stop]
+        for number in np.unique(innings):
+            totals[(int(match_id), int(number))] = int(runs[innings == number].sum())
+    return totals, {int(mid) for mid in parts[:, 0]}
+
+
+def load_metrics(root=AUDIT_ROOT):
+    try:
+        with open(os.path.join(root, METRICS_FILE), 'r') as f:
+            return json.load(f)
+    except OSError:
+        return {'complete': [], 'stats': {}, 'rows': 0}
+
+
+def save_metrics(root, metrics):
+    tmp = os.path.join(root, f'.{METRICS_FILE}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(metrics, f)
+    os.replace(tmp, os.path.join(root, METRICS_FILE))
+
+
+def fold(stats, keys, day, y, error):
+    """Add rows to ``stats[key][day] = [n, sum |e|, sum e^2, sum y, sum y^2]``."""
+    if not len(y):
+        return
+    key_values, key_index = np.unique(keys.astype(str), return_inverse=True)
+    days, day_index = np.unique(day, return_inverse=True)
+    group = key_index * len(days) + day_index
+    size = len(key_values) * len(days)
+    sums = [np.bincount(group, weights=w, minlength=size)
+            for w in (np.ones(len(y)), np.abs(error), error ** 2, y, y ** 2)]
+    for g in np.flatnonzero(sums[0]):
+        cell = stats.setdefault(str(key_values[g // len(days)]), {}).setdefault(str(int(days[g % len(days)])),
+                                                                              [0.0] * 5)
+        for i, total in enumerate(sums):
+            cell[i] += float(total[g])
+
+
+def commit_outcomes(root, names):
+    """Move the staged outcomes of ``names`` over their ``outcome.npy``."""
+    for name in names:
+        staged = os.path.join(root, name, STAGED_OUTCOME)
+        if os.path.exists(staged):
+            os.replace(staged, os.path.join(root, name, OUTCOME_FILE))
+
+
+def backfill(root=AUDIT_ROOT, data_root=None):
+    """Resolve outcomes of pending audit rows; returns (rows resolved, rows still pending)."""
+    metrics = load_metrics(root)
+    if metrics.get('staged'):
+        # The last backfill committed its statistics but stopped before moving every outcome in
+        commit_outcomes(root, metrics.pop('staged'))
+        save_metrics(root, metrics)
+    complete = set(metrics['complete'])
+    todo = [name for name in segments(root) if name not in complete]
+    keyed = {}
+    for name in todo:
+        path = os.path.join(root, name, OUTCOME_FILE)
+        columns = read_segment(root, name, ['match_id', 'innings'])
+        outcome = np.load(path) if os.path.exists(path) else np.full(len(columns['match_id']), PENDING, 'float32')
+        outcome[columns['match_id'] < 0] = NO_OUTCOME
+        keyed[name] = (columns, outcome)
+    pending_keys = {(int(m), int(i)) for columns, outcome in keyed.values()
+                    for m, i in zip(columns['match_id'][np.isnan(outcome)], columns['innings'][np.isnan(outcome)])}
+    totals, ingested = final_totals(pending_keys, data_root) if pending_keys else ({}, set())
+
+    resolved = still_pending = 0
+    staged = []
+    for name, (columns, outcome) in keyed.items():
+        todo_rows = np.flatnonzero(np.isnan(outcome))
+        new = []
+        for row in todo_rows:
+            key = (int(columns['match_id'][row]), int(columns['innings'][row]))
+            if key in totals:
+                outcome[row] = totals[key]
+                new.append(row)
+            elif key[0] in ingested:
+                # The match is in, but this innings was never played
+                outcome[row] = NO_OUTCOME
+        if new:
+            rows = read_segment(root, name, ['time', 'predicted', 'batting_team', 'bowling_team', 'city',
+                                             'balls_left'])
+            new = np.asarray(new)
+            y = outcome[new].astype('float64')
+            error = y - rows['predicted'][new].astype('float64')
+            day = (rows['time'][new] // DAY).astype('int64')
+            for dimension, col in DIMENSIONS.items():
+                if col is None:
+                    keys = np.full(len(new), 'all', dtype=object)
+                elif dimension == 'overs':
+                    keys = over_bucket(rows[col][new])
+                else:
+                    keys = rows[col][new]
+                fold(metrics['stats'].setdefault(dimension, {}), keys, day, y, error)
+            resolved += len(new)
+        with open(os.path.join(root, name, STAGED_OUTCOME), 'wb') as f:
+            np.save(f, outcome)
+        staged.append(name)
+        left = int(np.isnan(outcome).sum())
+        still_pending += left
+        if not left:
+            metrics['complete'].append(name)
+    metrics['rows'] += resolved
+    if todo:
+        metrics['staged'] = staged
+        save_metrics(root, metrics)
+        commit_outcomes(root, staged)
+        # Cleared so a later interrupted run's uncommitted outcomes are never moved in
+        del metrics['staged']
+        save_metrics(root, metrics)
+    return resolved, still_pending
+
+
+def summarize(cells):
+    n, abs_error, sq_error, y, y2 = (sum(c[i] for c in cells) for i in range(5))
+    if not n:
+        return None
+    total = y2 - y * y / n
+    return {'n': int(n), 'mae': abs_error / n, 'r2': 1 - sq_error / total if total > 0 else None}
+
+
+def accuracy(root=AUDIT_ROOT, by='all', days=None, now=None):
+    """``{value: {'n', 'mae', 'r2'}}`` for predictions made in the last ``days`` days."""
+    stats = load_metrics(root)['stats'].get(by, {})
+    since = (int((now or time.time()) // DAY) - days + 1) if days else None
+    result = {}
+    for value, cells in stats.items():
+        summary = summarize([cell for day, cell in cells.items() if since is None or int(day) >= since])
+        if summary is not None:
+            result[value] = summary
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill outcomes of audited predictions and report accuracy.')
+    parser.add_argument('command', choices=['backfill', 'report'])
+    parser.add_argument('--root', default=AUDIT_ROOT)
+    parser.add_argument('--data-root', default=None, help='refresh.py data directory (default Training/data)')
+    parser.add_argument('--by', default='all', choices=list(DIMENSIONS))
+    parser.add_argument('--days', type=int, default=None, help='rolling window (default all time)')
+    args = parser.parse_args()
+
+    if args.command == 'backfill':
+        start = time.perf_counter()
+        resolved, pending = backfill(args.root, args.data_root)
+        print(f"Resolved {resolved} predictions ({pending} still pending) in {time.perf_counter() - start:.2f}s")
+        return
+    result = accuracy(args.root, args.by, args.days)
+    if not result:
+        print('No resolved predictions yet')
+    for value, summary in sorted(result.items(), key=lambda item: -item[1]['n']):
+        r2 = f"{summary['r2']:.3f}" if summary['r2'] is not None else '-'
+        print(f"{value:<20} n={summary['n']:<8} MAE {summary['mae']:.2f}  R2 {r2}")
+
+
+if __name__ == '__main__':
+    main()
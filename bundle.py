@@ -0,0 +1,268 @@
+"""Versioned, memory-mappable model bundle replacing Model/pipe.pkl.
+
+A bundle is a directory of plain files that any later library version can
+read::
+
+    Model/bundle/
+        manifest.json        format, model version, feature schema, training
+                             data hash, metrics, library versions at export
+        booster.ubj          the XGBoost booster in its native UBJSON format
+        scaler_mean.npy      StandardScaler parameters over the full matrix
+        scaler_scale.npy     (absent for native categorical models)
+        <col>_categories.npy encoder vocabularies (OneHotEncoder drop='first',
+                             or OrdinalEncoder for native categoricals)
+        <col>_table.npy      the ``fastpath`` arrays: scaled one-hot blocks,
+        feature.npy, ...     numeric scaling and the flattened trees
+
+Every ``.npy`` is opened with ``mmap_mode='r'``, so loading reads only the
+manifest and workers forked from one process share the pages. ``predictor()``
+scores with ``fastpath.FastPredictor`` (numpy only, bit-for-bit equal to
+``pipe.predict``); ``booster_predictor()`` uses the native booster instead.
+
+    python bundle.py export                 # Model/pipe.pkl -> Model/bundle
+    python bundle.py check                  # parity, load time and RSS vs the pickle
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import fastpath
+import predict
+from schema import CATEGORICAL, FEATURES, NUMERIC, TARGET
+
+FORMAT = 1
+BUNDLE_PATH = os.path.join(predict.ROOT, 'Model', 'bundle')
+MANIFEST = 'manifest.json'
+BOOSTER_FILE = 'booster.ubj'
+# Overrides the model the apps and services load, e.g. Model/student (distill.py)
+MODEL_ENV = 'T20_MODEL'
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def library_versions():
+    versions = {'python': sys.version.split()[0], 'numpy': np.__version__}
+    for name in ('sklearn', 'xgboost', 'pandas'):
+        module = sys.modules.get(name)
+        if module is not None:
+            versions[name] = module.__version__
+    return versions
+
+
+def save_bundle(pipe, path=BUNDLE_PATH, data_hash=None, metrics=None):
+    """Write ``pipe`` as a bundle directory, replacing any bundle at ``path``."""
+    booster = pipe.named_steps['step3'].get_booster()
+    arrays = fastpath.compile_pipeline(pipe)
+    if fastpath.native_categorical(pipe):
+        encoder = {'type': 'ordinal', 'categorical_splits': True}
+    else:
+        scaler = pipe.named_steps['step2']
+        arrays['scaler_mean'] = scaler.mean_
+        arrays['scaler_scale'] = scaler.scale_
+        encoder = {'type': 'onehot', 'drop': 'first'}
+
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    booster.save_model(os.path.join(tmp, BOOSTER_FILE))
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f'{name}.npy'), np.asarray(array))
+
+    manifest = {
+        'format': FORMAT,
+        'model_version': file_hash(os.path.join(tmp, BOOSTER_FILE))[:12],
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'features': {'categorical': CATEGORICAL, 'numeric': NUMERIC, 'order': FEATURES, 'target': TARGET},
+        'encoder': encoder,
+        'trees': int(len(arrays['roots'])),
+        'depth': int(arrays['depth']),
+        'arrays': sorted(arrays),
+        'training_data_sha256': data_hash,
+        'metrics': metrics or {},
+        'exported_with': library_versions(),
+    }
+    with open(os.path.join(tmp, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    # Swap the finished directory in, so readers never see a partial bundle
+    old = path + '.old'
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+def add_arrays(path, arrays, **manifest):
+    """Add (or replace) arrays and manifest entries of an existing bundle.
+
+    The manifest is replaced last, so readers see either the old bundle or
+    the complete new one.
+    """
+    with open(os.path.join(path, MANIFEST), 'r') as f:
+        current = json.load(f)
+    for name, array in arrays.items():
+        tmp = os.path.join(path, f'.{name}.npy.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, np.asarray(array))
+        os.replace(tmp, os.path.join(path, f'{name}.npy'))
+    current.update(manifest)
+    current['arrays'] = sorted(set(current['arrays']) | set(arrays))
+    tmp = os.path.join(path, f'.{MANIFEST}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(current, f, indent=1)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+    return current
+
+
+class Bundle:
+    def __init__(self, path=BUNDLE_PATH, mmap=True):
+        self.path = path
+        with open(os.path.join(path, MANIFEST), 'r') as f:
+            self.manifest = json.load(f)
+        if self.manifest['format'] > FORMAT:
+            raise ValueError(f"Bundle format {self.manifest['format']} is newer than supported ({FORMAT})")
+        if self.manifest['features']['order'] != FEATURES:
+            raise ValueError(f"Bundle features {self.manifest['features']['order']} do not match {FEATURES}")
+        mode = 'r' if mmap else None
+        self.arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode)
+                       for name in self.manifest['arrays']}
+
+    @property
+    def version(self):
+        return self.manifest['model_version']
+
+    def predictor(self):
+        return fastpath.FastPredictor(self.arrays)
+
+    def booster(self):
+        import xgboost as xgb
+        booster = xgb.Booster()
+        booster.load_model(os.path.join(self.path, BOOSTER_FILE))
+        return booster
+
+    def booster_predictor(self):
+        return BoosterPredictor(self.arrays, self.booster())
+
+
+class BoosterPredictor(fastpath.FastPredictor):
+    """Bundle encoding with the native booster doing the tree evaluation."""
+
+    def __init__(self, arrays, booster):
+        super().__init__(arrays)
+        self.booster = booster
+        best = booster.attributes().get('best_iteration')
+        self.iteration_range = (0, int(best) + 1) if best is not None else (0, 0)
+
+    def predict_matrix(self, X, chunk=None):
+        return self.booster.inplace_predict(X, iteration_range=self.iteration_range)
+
+
+def load_bundle(path=BUNDLE_PATH, mmap=True):
+    return Bundle(path, mmap)
+
+
+def default_model_path():
+    """``T20_MODEL`` if set, the bundle if one has been exported, else the pickled pipeline."""
+    if os.environ.get(MODEL_ENV):
+        return os.path.join(predict.ROOT, os.environ[MODEL_ENV])
+    return BUNDLE_PATH if os.path.exists(os.path.join(BUNDLE_PATH, MANIFEST)) else predict.MODEL_PATH
+
+
+def model_version(path=None):
+    """The ``version`` ``load_predictor(path)`` reports, read without loading the model.
+
+    A bundle's comes from its manifest alone; for a file it is the file hash.
+    """
+    path = path or default_model_path()
+    if os.path.isdir(path):
+        with open(os.path.join(path, MANIFEST), 'r') as f:
+            return json.load(f)['model_version']
+    return file_hash(path)[:12]
+
+
+def load_predictor(path=None):
+    """Predictor for a bundle directory, a fastpath ``.npz`` or a pickled pipeline.
+
+    Its ``version`` is the bundle's model version, or a hash of the file.
+    """
+    path = path or default_model_path()
+    if os.path.isdir(path):
+        loaded = load_bundle(path)
+        model = loaded.predictor()
+        model.version = loaded.version
+        return model
+    model = fastpath.FastPredictor.load(path) if path.endswith('.npz') else predict.BatchPredictor.load(path)
+    model.version = file_hash(path)[:12]
+    return model
+
+
+def evaluate(model, X, y):
+    y = np.asarray(y, dtype='float64')
+    error = y - model.predict(X, check=False)
+    return {'r2': round(float(1 - (error ** 2).sum() / ((y - y.mean()) ** 2).sum()), 6),
+            'mae': round(float(np.abs(error).mean()), 6), 'rows': int(len(y))}
+
+
+# Loading cost in a fresh interpreter: seconds and resident memory afterwards
+LOAD_STATEMENTS = {
+    'pickle': "import predict; model = predict.BatchPredictor.load({path!r})",
+    'bundle': "import bundle; model = bundle.load_bundle({path!r}).predictor()",
+}
+RSS_STATEMENT = ("print(next(int(line.split()[1]) for line in open('/proc/self/status') "
+                 "if line.startswith('VmRSS')))")
+
+
+def load_cost(kind, path):
+    """``(seconds, RSS in KiB)``; ru_maxrss is unusable as it survives fork+exec."""
+    code = ("import time; start = time.perf_counter(); " + LOAD_STATEMENTS[kind].format(path=path) +
+            "; print(time.perf_counter() - start); " + RSS_STATEMENT)
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=predict.ROOT)
+    seconds, rss = out.stdout.split()[-2:]
+    return float(seconds), int(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export or check the versioned model bundle.')
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('--model', default=predict.MODEL_PATH)
+    parser.add_argument('--bundle', default=BUNDLE_PATH)
+    parser.add_argument('--data', default=None, help='training data file to hash (default: dataset_level2.pkl)')
+    args = parser.parse_args()
+
+    X, y = fastpath.held_out_set()
+    if args.command == 'export':
+        import features
+        pipe = predict.load_model(args.model)
+        data = args.data or features.LEVEL2_PKL
+        metrics = evaluate(predict.BatchPredictor(pipe), X, y)
+        manifest = save_bundle(pipe, args.bundle, file_hash(data), metrics)
+        print(f"Wrote {args.bundle} (version {manifest['model_version']}, {manifest['trees']} trees, "
+              f"held-out R2 {metrics['r2']:.4f}, MAE {metrics['mae']:.2f})")
+        return
+
+    pipe = predict.load_model(args.model)
+    loaded = load_bundle(args.bundle)
+    for name, model in [('numpy', loaded.predictor()), ('booster', loaded.booster_predictor())]:
+        print(f"Parity OK ({name}): {fastpath.check_parity(pipe, model, X)} held-out predictions are bit-for-bit equal")
+    for kind, path in [('pickle', args.model), ('bundle', args.bundle)]:
+        seconds, rss = load_cost(kind, path)
+        print(f"{kind}: loaded in {seconds * 1000:.0f} ms, RSS {rss / 1024:.0f} MiB")
+
+
+if __name__ == '__main__':
+    main()
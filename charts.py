@@ -0,0 +1,273 @@
+"""Result-column charts for web.py ('classic' style) and web_new.py ('pitch').
+
+Every figure is memoized on its inputs (and style), so reruns that do not
+change the prediction reuse the finished figure instead of building and
+validating fresh plotly objects; the static styling lives in module-level
+constants built once per process. Figures are shared by all sessions and
+must not be mutated.
+
+Setting ``T20_CHARTS=svg`` switches to a lightweight renderer that draws the
+same charts as inline SVG (a few hundred bytes each) without importing
+plotly at all.
+"""
+import math
+import os
+from functools import lru_cache
+
+import streamlit as st
+
+RENDERER = os.environ.get('T20_CHARTS', 'plotly')
+
+CLEAR = 'rgba(0,0,0,0)'
+STYLES = {
+    'classic': {
+        'height': 250, 'margin': dict(l=20, r=20, t=50, b=20), 'font': 'white', 'muted': 'white',
+        'title_size': 16, 'accent': '#32CD32', 'threshold': '#FFD700', 'track': '#0f3460',
+        'steps': ['rgba(255,0,0,0.3)', 'rgba(255,255,0,0.3)', 'rgba(0,255,0,0.3)'],
+        'bars': ['#FF6B6B', '#32CD32', '#4ECDC4'], 'line': '#4ECDC4', 'center': '#FFD700',
+        'grid': 'rgba(255,255,255,0.1)',
+    },
+    'pitch': {
+        'height': 180, 'margin': dict(l=10, r=10, t=35, b=5), 'font': '#c8d8e0', 'muted': '#8a9ba8',
+        'title_size': 11, 'accent': '#00c95d', 'threshold': '#f5c842', 'track': 'rgba(255,255,255,0.05)',
+        'steps': ['rgba(255,59,59,0.15)', 'rgba(245,200,66,0.15)', 'rgba(0,201,93,0.15)'],
+        'bars': ['rgba(255,59,59,0.8)', 'rgba(0,201,93,0.9)', 'rgba(59,130,246,0.8)'], 'line': '#4ECDC4',
+        'center': '#00c95d', 'grid': 'rgba(255,255,255,0.1)',
+    },
+}
+GAUGE_RANGE = 15
+STEP_BOUNDS = [(0, 6), (6, 10), (10, 15)]
+SCENARIOS = ['Low (P10)', 'Predicted', 'High (P90)']
+PLOTLY_CONFIG = {'classic': {}, 'pitch': {'displayModeBar': False}}
+
+
+# Plotly figures
+
+@lru_cache(maxsize=256)
+def gauge_figure(style, crr, required_rate):
+    import plotly.graph_objects as go
+    s = STYLES[style]
+    steps = [{'range': list(bounds), 'color': color} for bounds, color in zip(STEP_BOUNDS, s['steps'])]
+    if style == 'classic':
+        indicator = go.Indicator(
+            mode="gauge+number+delta", value=crr,
+            delta={'reference': required_rate, 'relative': False},
+            title={'text': "Current Run Rate", 'font': {'size': 16, 'color': 'white'}},
+            gauge={'axis': {'range': [0, GAUGE_RANGE], 'tickwidth': 1, 'tickcolor': "white"},
+                   'bar': {'color': s['accent']}, 'bgcolor': CLEAR, 'borderwidth': 2, 'bordercolor': "#228B22",
+                   'steps': steps,
+                   'threshold': {'line': {'color': s['threshold'], 'width': 4}, 'thickness': 0.75,
+                                 'value': required_rate}})
+    else:
+        indicator = go.Indicator(
+            mode="gauge+number", value=crr,
+            title={'text': "Current RR", 'font': {'size': 11, 'color': s['muted']}},
+            number={'font': {'size': 22, 'color': s['accent']}},
+            gauge={'axis': {'range': [0, GAUGE_RANGE], 'tickcolor': 'rgba(255,255,255,0.2)',
+                            'tickfont': {'color': s['muted'], 'size': 7}},
+                   'bar': {'color': s['accent'], 'thickness': 0.25}, 'bgcolor': CLEAR, 'borderwidth': 0,
+                   'steps': steps,
+                   'threshold': {'line': {'color': s['threshold'], 'width': 3}, 'thickness': 0.8,
+                                 'value': required_rate}})
+    fig = go.Figure(indicator)
+    fig.update_layout(paper_bgcolor=CLEAR, font={'color': s['font']}, height=s['height'], margin=s['margin'])
+    return fig
+
+
+@lru_cache(maxsize=256)
+def donut_figure(style, current_score, runs_to_add, predicted_score):
+    import plotly.graph_objects as go
+    s = STYLES[style]
+    if style == 'classic':
+        pie = go.Pie(labels=['Runs Scored', 'Runs to Add'], values=[current_score, runs_to_add], hole=0.6,
+                     marker_colors=[s['accent'], s['track']], textinfo='label+value',
+                     textfont={'color': 'white'})
+        center = {'text': f'{predicted_score}', 'font_size': 24}
+        title = {'title': {'text': 'Score Breakdown', 'font': {'color': 'white', 'size': 16}}}
+        margin = s['margin']
+    else:
+        percent_complete = int(current_score / predicted_score * 100) if predicted_score else 0
+        pie = go.Pie(labels=['Scored', 'To Add'], values=[current_score, max(0, runs_to_add)], hole=0.65,
+                     marker=dict(colors=[s['accent'], s['track']], line=dict(color=CLEAR, width=0)),
+                     textinfo='none', hovertemplate='%{label}: %{value}<extra></extra>')
+        center = {'text': f'<b>{percent_complete}%</b><br><span style="font-size:9px">Complete</span>',
+                  'font_size': 16}
+        title = {}
+        margin = dict(l=10, r=10, t=10, b=10)
+    fig = go.Figure(data=[pie])
+    fig.update_layout(paper_bgcolor=CLEAR, font={'color': s['font']}, height=s['height'], margin=margin,
+                      showlegend=False,
+                      annotations=[{**center, 'x': 0.5, 'y': 0.5, 'font_color': s['center'], 'showarrow': False}],
+                      **title)
+    return fig
+
+
+@lru_cache(maxsize=256)
+def bars_figure(style, scores):
+    import plotly.graph_objects as go
+    s = STYLES[style]
+    scores = list(scores)
+    if style == 'classic':
+        bar = go.Bar(x=SCENARIOS, y=scores, marker_color=s['bars'], text=scores, textposition='outside',
+                     textfont={'color': 'white', 'size': 14})
+        layout = dict(title={'text': 'Score Projections', 'font': {'color': 'white', 'size': 16}},
+                      margin=s['margin'], yaxis={'gridcolor': s['grid'], 'showgrid': True},
+                      xaxis={'showgrid': False})
+    else:
+        bar = go.Bar(x=SCENARIOS, y=scores, marker=dict(color=s['bars'], line=dict(width=0)), text=scores,
+                     textposition='outside', textfont={'color': s['font'], 'size': 10}, width=0.5)
+        layout = dict(title={'text': 'Score Projections', 'font': {'color': s['muted'], 'size': 11}, 'x': 0.5},
+                      margin=dict(l=10, r=10, t=35, b=25),
+                      yaxis={'visible': False, 'range': [0, max(scores) * 1.18]},
+                      xaxis={'tickfont': {'size': 8, 'color': s['muted']}}, bargap=0.4)
+    fig = go.Figure(data=[bar])
+    fig.update_layout(paper_bgcolor=CLEAR, plot_bgcolor=CLEAR, font={'color': s['font']}, height=s['height'],
+                      **layout)
+    return fig
+
+
+def trend_points(overs, required_rate):
+    """Projected over-by-over run rates for the overs still to come."""
+    return [(i, required_rate * (1 + (i - int(overs)) * 0.05)) for i in range(int(overs) + 1, 21)]
+
+
+@lru_cache(maxsize=256)
+def trend_figure(style, overs, crr, required_rate):
+    import plotly.graph_objects as go
+    s = STYLES[style]
+    points = trend_points(overs, required_rate)
+    fig = go.Figure()
+    fig.add_hline(y=crr, line_dash="dash", line_color=s['accent'], annotation_text=f"Current RR: {crr:.2f}")
+    fig.add_hline(y=required_rate, line_dash="dot", line_color=s['threshold'],
+                  annotation_text=f"Required RR: {required_rate:.2f}")
+    fig.add_trace(go.Scatter(x=[p[0] for p in points], y=[p[1] for p in points], mode='lines+markers',
+                             name='Projected RR', line={'color': s['line'], 'width': 2}, marker={'size': 6}))
+    fig.update_layout(
+        title={'text': 'Projected Run Rate Trend', 'font': {'color': 'white', 'size': 16}},
+        paper_bgcolor=CLEAR, plot_bgcolor=CLEAR, font={'color': s['font']}, height=s['height'],
+        margin=s['margin'], xaxis={'title': 'Overs', 'gridcolor': s['grid']},
+        yaxis={'title': 'Run Rate', 'gridcolor': s['grid']}, showlegend=False)
+    return fig
+
+
+# Lightweight SVG charts
+
+def _svg(style, body, title=None):
+    s = STYLES[style]
+    heading = (f'<text x="150" y="16" text-anchor="middle" font-size="{s["title_size"]}" '
+               f'fill="{s["muted"]}">{title}</text>' if title else '')
+    return (f'<svg viewBox="0 0 300 {s["height"]}" width="100%" height="{s["height"]}" '
+            f'xmlns="http://www.w3.org/2000/svg" font-family="sans-serif">{heading}{body}</svg>')
+
+
+def _arc(cx, cy, r, start, end, color, width):
+    # Arc between two angles in degrees, 180 = left, 0 = right, counter-clockwise up
+    x0, y0 = cx + r * math.cos(math.radians(start)), cy - r * math.sin(math.radians(start))
+    x1, y1 = cx + r * math.cos(math.radians(end)), cy - r * math.sin(math.radians(end))
+    large = 1 if abs(start - end) > 180 else 0
+    sweep = 1 if start > end else 0
+    return (f'<path d="M{x0:.1f},{y0:.1f} A{r},{r} 0 {large} {sweep} {x1:.1f},{y1:.1f}" fill="none" '
+            f'stroke="{color}" stroke-width="{width}"/>')
+
+
+def _angle(value):
+    return 180 - 180 * min(max(value, 0), GAUGE_RANGE) / GAUGE_RANGE
+
+
+@lru_cache(maxsize=256)
+def gauge_svg(style, crr, required_rate):
+    s = STYLES[style]
+    cx, cy, r = 150, s['height'] - 40, min(110, s['height'] - 70)
+    parts = [_arc(cx, cy, r, _angle(a), _angle(b), color, 22) for (a, b), color in zip(STEP_BOUNDS, s['steps'])]
+    parts.append(_arc(cx, cy, r, 180, _angle(crr), s['accent'], 8))
+    t = math.radians(_angle(required_rate))
+    parts.append(f'<line x1="{cx + (r - 13) * math.cos(t):.1f}" y1="{cy - (r - 13) * math.sin(t):.1f}" '
+                 f'x2="{cx + (r + 13) * math.cos(t):.1f}" y2="{cy - (r + 13) * math.sin(t):.1f}" '
+                 f'stroke="{s["threshold"]}" stroke-width="3"/>')
+    parts.append(f'<text x="{cx}" y="{cy}" text-anchor="middle" font-size="26" font-weight="bold" '
+                 f'fill="{s["accent"]}">{crr:.2f}</text>')
+    parts.append(f'<text x="{cx}" y="{cy + 22}" text-anchor="middle" font-size="11" fill="{s["muted"]}">'
+                 f'required {required_rate:.2f}</text>')
+    return _svg(style, ''.join(parts), 'Current Run Rate' if style == 'classic' else 'Current RR')
+
+
+@lru_cache(maxsize=256)
+def donut_svg(style, current_score, runs_to_add, predicted_score):
+    s = STYLES[style]
+    cx, cy, r = 150, s['height'] / 2 + 8, s['height'] / 2 - 36
+    total = current_score + max(0, runs_to_add)
+    share = current_score / total if total else 0
+    parts = [f'<circle cx="{cx}" cy="{cy}" r="{r}" fill="none" stroke="{s["track"]}" stroke-width="18"/>']
+    if share >= 1:
+        parts.append(f'<circle cx="{cx}" cy="{cy}" r="{r}" fill="none" stroke="{s["accent"]}" stroke-width="18"/>')
+    elif share > 0:
+        parts.append(_arc(cx, cy, r, 90, 90 - 360 * share, s['accent'], 18))
+    if style == 'classic':
+        center = str(predicted_score)
+    else:
+        center = f"{int(current_score / predicted_score * 100) if predicted_score else 0}%"
+    parts.append(f'<text x="{cx}" y="{cy + 8}" text-anchor="middle" font-size="22" font-weight="bold" '
+                 f'fill="{s["center"]}">{center}</text>')
+    parts.append(f'<text x="{cx}" y="{s["height"] - 4}" text-anchor="middle" font-size="10" fill="{s["muted"]}">'
+                 f'{current_score} scored &#183; {max(0, runs_to_add)} to add</text>')
+    return _svg(style, ''.join(parts), 'Score Breakdown' if style == 'classic' else None)
+
+
+@lru_cache(maxsize=256)
+def bars_svg(style, scores):
+    s = STYLES[style]
+    top, bottom = 34, s['height'] - 22
+    peak = max(scores) * 1.18 or 1
+    parts = []
+    for i, (label, value, color) in enumerate(zip(SCENARIOS, scores, s['bars'])):
+        x = 30 + i * 90
+        y = bottom - (bottom - top) * value / peak
+        parts.append(f'<rect x="{x + 15}" y="{y:.1f}" width="50" height="{bottom - y:.1f}" rx="3" fill="{color}"/>')
+        parts.append(f'<text x="{x + 40}" y="{y - 5:.1f}" text-anchor="middle" font-size="12" '
+                     f'fill="{s["font"]}">{value}</text>')
+        parts.append(f'<text x="{x + 40}" y="{bottom + 14}" text-anchor="middle" font-size="10" '
+                     f'fill="{s["muted"]}">{label}</text>')
+    return _svg(style, ''.join(parts), 'Score Projections')
+
+
+@lru_cache(maxsize=256)
+def trend_svg(style, overs, crr, required_rate):
+    s = STYLES[style]
+    points = trend_points(overs, required_rate)
+    values = [v for _, v in points] + [crr, required_rate]
+    low, high = min(values) * 0.9, max(values) * 1.1 or 1
+    left, right, top, bottom = 36, 290, 30, s['height'] - 24
+
+    def x(over):
+        return left + (right - left) * (over - 1) / 19
+
+    def y(value):
+        return bottom - (bottom - top) * (value - low) / ((high - low) or 1)
+
+    parts = [f'<line x1="{left}" y1="{y(crr):.1f}" x2="{right}" y2="{y(crr):.1f}" stroke="{s["accent"]}" '
+             f'stroke-dasharray="6 4"/>',
+             f'<line x1="{left}" y1="{y(required_rate):.1f}" x2="{right}" y2="{y(required_rate):.1f}" '
+             f'stroke="{s["threshold"]}" stroke-dasharray="2 3"/>']
+    if points:
+        path = ' '.join(f'{x(o):.1f},{y(v):.1f}' for o, v in points)
+        parts.append(f'<polyline points="{path}" fill="none" stroke="{s["line"]}" stroke-width="2"/>')
+        parts.extend(f'<circle cx="{x(o):.1f}" cy="{y(v):.1f}" r="3" fill="{s["line"]}"/>' for o, v in points)
+    parts.append(f'<text x="{right}" y="{y(crr) - 4:.1f}" text-anchor="end" font-size="10" fill="{s["accent"]}">'
+                 f'Current RR: {crr:.2f}</text>')
+    parts.append(f'<text x="{right}" y="{y(required_rate) - 4:.1f}" text-anchor="end" font-size="10" '
+                 f'fill="{s["threshold"]}">Required RR: {required_rate:.2f}</text>')
+    parts.append(f'<text x="{(left + right) / 2}" y="{s["height"] - 4}" text-anchor="middle" font-size="10" '
+                 f'fill="{s["muted"]}">Overs</text>')
+    return _svg(style, ''.join(parts), 'Projected Run Rate Trend')
+
+
+FIGURES = {'gauge': gauge_figure, 'donut': donut_figure, 'bars': bars_figure, 'trend': trend_figure}
+SVGS = {'gauge': gauge_svg, 'donut': donut_svg, 'bars': bars_svg, 'trend': trend_svg}
+
+
+def show(kind, style, *args):
+    """Draw one chart into the current Streamlit container with the configured renderer."""
+    if RENDERER == 'svg':
+        st.markdown(SVGS[kind](style, *args), unsafe_allow_html=True)
+    else:
+        st.plotly_chart(FIGURES[kind](style, *args), use_container_width=True, config=PLOTLY_CONFIG[style])
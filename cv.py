@@ -0,0 +1,293 @@
+"""Match-grouped train/test splits and cross-validation.
+
+The notebook's ``train_test_split`` shuffles deliveries, so most balls of a
+test innings have near-identical neighbours (same innings, one ball apart)
+in the training rows and the test score mostly measures memorization. Here
+every split keeps whole matches on one side:
+
+    group   k folds of matches, shuffled with a fixed seed
+    time    forward chaining on ``info.dates``: fold i trains on the oldest
+            i + 1 blocks of matches and tests on the next block
+    rows    the notebook's row shuffle, only to show how far off it is
+
+The fitted preprocessing (encoder, scaler) and the encoded matrices of every
+fold are cached under ``.cache/cv`` keyed on the data, the scheme and the
+pipeline mode, so repeated runs (and ``search.py``) only fit the boosters.
+Folds run in a process pool, each worker loading its fold with ``mmap``.
+
+    python cv.py                                  # 5 grouped folds, dataset_level2.pkl
+    python cv.py --source yaml --scheme time --mode native
+    python cv.py --scheme rows --n-estimators 200 # the leaky estimate
+"""
+import argparse
+import os
+import pickle
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import ingest
+import train
+from schema import CATEGORICAL, FEATURES, TARGET
+
+CACHE_DIR = os.path.join(ingest.ROOT, '.cache', 'cv')
+SCHEMES = ['group', 'time', 'rows']
+N_SPLITS = 5
+SEED = 1
+VALIDATION_SIZE = 0.1
+FOLD_ARRAYS = ['X_train', 'y_train', 'groups_train', 'X_test', 'y_test', 'groups_test']
+# Fitted preprocessing and raw test rows of a fold, to time the serving path
+PREPROCESSOR_FILE = 'preprocessor.pkl'
+SAMPLE_FILE = 'sample.pkl'
+
+
+def load_table(source='level2', data_dir=ingest.DATA_DIR):
+    """``(table, data_key)``: the training table with match_id and innings kept."""
+    import features
+    import store
+    if source == 'level2':
+        import bundle
+        table = features.build_features(store.from_level2(store.load_legacy_pickle(features.LEVEL2_PKL)), keys=True)
+        return table, train.key('level2', bundle.file_hash(features.LEVEL2_PKL))
+    import refresh
+    root = refresh.store_root(data_dir)
+    refresh.refresh(data_dir, root)
+    return refresh.load_training_table(root, keys=True), train.key('yaml', train.files_key(data_dir))
+
+
+def match_dates(match_ids, data_dir=ingest.DATA_DIR):
+    """``{match_id: 'YYYY-MM-DD'}``, the first of each match's ``info.dates``.
+
+    Only Cricsheet file ids have dates; dataset_level2.pkl numbers its
+    matches itself.
+    """
+    matches = ingest.load_matches(data_dir, match_ids=np.unique(match_ids).tolist())
+    dates = {}
+    for match_id, match in matches.items():
+        days = match['info'].get('dates') or [None]
+        dates[match_id] = str(days[0])
+    missing = set(np.unique(match_ids).tolist()) - set(dates)
+    if missing:
+        raise ValueError(f"No dates for {len(missing)} matches (e.g. {min(missing)}); "
+                         f"time-ordered splits need --source yaml")
+    return dates
+
+
+def group_folds(match_ids, n_splits=N_SPLITS, seed=SEED):
+    """``[(train_rows, test_rows)]`` with every match in exactly one test fold."""
+    matches = np.random.default_rng(seed).permutation(np.unique(match_ids))
+    fold_of = dict(zip(matches.tolist(), np.arange(len(matches)) % n_splits))
+    fold = np.array([fold_of[m] for m in match_ids.tolist()])
+    return [(np.flatnonzero(fold != k), np.flatnonzero(fold == k)) for k in range(n_splits)]
+
+
+def time_folds(match_ids, dates, n_splits=N_SPLITS):
+    """Forward-chaining folds over ``n_splits + 1`` blocks of matches ordered by date."""
+    matches = sorted(np.unique(match_ids).tolist(), key=lambda m: (dates[m], m))
+    block_of = {m: b for b, chunk in enumerate(np.array_split(matches, n_splits + 1)) for m in chunk.tolist()}
+    block = np.array([block_of[m] for m in match_ids.tolist()])
+    return [(np.flatnonzero(block <= k), np.flatnonzero(block == k + 1)) for k in range(n_splits)]
+
+
+def row_folds(n_rows, n_splits=N_SPLITS, seed=SEED):
+    from sklearn.model_selection import KFold
+    return list(KFold(n_splits, shuffle=True, random_state=seed).split(np.arange(n_rows)))
+
+
+def holdout_split(match_ids, test_size=0.2, dates=None, seed=SEED):
+    """``(train_rows, test_rows)`` holding out ``test_size`` of the matches.
+
+    With ``dates`` the held-out matches are the most recent ones.
+    """
+    matches = np.unique(match_ids)
+    if dates is not None:
+        order = np.array(sorted(matches.tolist(), key=lambda m: (dates[m], m)))
+    else:
+        order = np.random.default_rng(seed).permutation(matches)
+    held = np.isin(match_ids, order[len(order) - int(round(len(order) * test_size)):])
+    return np.flatnonzero(~held), np.flatnonzero(held)
+
+
+def folds(table, scheme='group', n_splits=N_SPLITS, seed=SEED, data_dir=ingest.DATA_DIR):
+    match_ids = table['match_id'].to_numpy()
+    if scheme == 'group':
+        return group_folds(match_ids, n_splits, seed)
+    if scheme == 'time':
+        return time_folds(match_ids, match_dates(match_ids, data_dir), n_splits)
+    if scheme == 'rows':
+        return row_folds(len(match_ids), n_splits, seed)
+    raise ValueError(f"Unknown scheme {scheme!r}; expected one of {SCHEMES}")
+
+
+def preprocessor(table, mode='notebook'):
+    """The pipeline's steps before the booster, with the full vocabularies.
+
+    A city seen only in the test matches would otherwise be unknown to the
+    encoder; the vocabulary carries no target information.
+    """
+    pipe = train.make_native_pipeline() if mode == 'native' else train.make_pipeline()
+    pre = pipe[:-1]
+    vocab = [sorted(table[col].unique().tolist()) for col in CATEGORICAL]
+    return pre.set_params(step1__trf__categories=vocab)
+
+
+def fold_matrices(table, splits, mode='notebook', cache_key=None, cache_dir=CACHE_DIR):
+    """Directories with the encoded arrays of every fold (``FOLD_ARRAYS``).
+
+    The preprocessing is fit on the training rows of each fold only and
+    pickled next to the arrays, with the first raw test rows.
+    """
+    root = os.path.join(cache_dir, cache_key or train.key(len(table), mode))
+    X, y = table[FEATURES], table[TARGET].to_numpy(dtype='float64')
+    groups = table['match_id'].to_numpy()
+    paths = []
+    for k, (train_rows, test_rows) in enumerate(splits):
+        path = os.path.join(root, f'fold{k}')
+        paths.append(path)
+        if os.path.exists(os.path.join(path, SAMPLE_FILE)):
+            continue
+        pre = preprocessor(table, mode)
+        arrays = {'X_train': pre.fit_transform(X.iloc[train_rows]), 'y_train': y[train_rows],
+                  'groups_train': groups[train_rows], 'X_test': pre.transform(X.iloc[test_rows]),
+                  'y_test': y[test_rows], 'groups_test': groups[test_rows]}
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, f'{name}.npy'), np.asarray(array, dtype='float32' if name[0] == 'X' else None))
+        for name, value in [(PREPROCESSOR_FILE, pre), (SAMPLE_FILE, X.iloc[test_rows[:train.LATENCY_ROWS]])]:
+            with open(os.path.join(tmp, name), 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+    return paths
+
+
+def load_fold(path):
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in FOLD_ARRAYS}
+
+
+def make_regressor(mode='notebook', params=None, n_jobs=None):
+    """The pipeline's booster on its own, for the cached encoded matrices."""
+    pipe = train.make_native_pipeline(**(params or {})) if mode == 'native' else train.make_pipeline(**(params or {}))
+    return pipe.named_steps['step3'].set_params(n_jobs=n_jobs)
+
+
+def fit_regressor(model, X, y, groups, validation_size=VALIDATION_SIZE, seed=SEED):
+    """Fit ``model``; with early stopping the validation rows are whole matches."""
+    if model.get_params().get('early_stopping_rounds') is None:
+        return model.fit(X, y)
+    fit_rows, val_rows = holdout_split(np.asarray(groups), validation_size, seed=seed)
+    train.start_from_mean(model, y[fit_rows])
+    return model.fit(X[fit_rows], y[fit_rows], eval_set=[(X[val_rows], y[val_rows])], verbose=False)
+
+
+def trees_used(model):
+    best = model.get_booster().attributes().get('best_iteration')
+    return int(best) + 1 if best is not None else int(model.get_params()['n_estimators'])
+
+
+def load_pickle(path, name):
+    with open(os.path.join(path, name), 'rb') as f:
+        return pickle.load(f)
+
+
+def run_fold(path, mode='notebook', params=None, n_jobs=None, keep_model=False):
+    """Fit and score one cached fold; runs in a worker process.
+
+    With ``keep_model`` the result also holds the fold's pipeline (fitted
+    preprocessing and booster) under ``'pipe'``, for ``profile_fold``.
+    """
+    fold = load_fold(path)
+    start = time.perf_counter()
+    model = fit_regressor(make_regressor(mode, params, n_jobs), np.asarray(fold['X_train']),
+                          np.asarray(fold['y_train']), fold['groups_train'])
+    seconds = time.perf_counter() - start
+    y, pred = np.asarray(fold['y_test']), model.predict(np.asarray(fold['X_test']))
+    error = y - pred
+    result = {'mae': float(np.abs(error).mean()), 'r2': float(1 - (error ** 2).sum() / ((y - y.mean()) ** 2).sum()),
+              'train_rows': int(len(fold['y_train'])), 'test_rows': int(len(y)),
+              'test_matches': int(len(np.unique(fold['groups_test']))), 'trees': trees_used(model),
+              'fit_seconds': round(seconds, 3)}
+    if keep_model:
+        from sklearn.pipeline import Pipeline
+        result['pipe'] = Pipeline(load_pickle(path, PREPROCESSOR_FILE).steps + [('step3', model.set_params(n_jobs=1))])
+    return result
+
+
+def profile_fold(path, pipe):
+    """``train.profile`` of a fold's pipeline on the fold's raw test rows.
+
+    Run it outside the pool: latency timed next to running fits measures
+    the contention, not the model.
+    """
+    return train.profile(pipe, load_pickle(path, SAMPLE_FILE))
+
+
+def _run_fold(args):
+    return run_fold(*args)
+
+
+def cross_validate(paths, mode='notebook', params=None, workers=None):
+    """Per-fold results for the cached folds in ``paths``, fitted in parallel.
+
+    Each of the ``workers`` processes gets an equal share of the cores for
+    XGBoost's own threads.
+    """
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(paths)))
+    jobs = [(path, mode, params, max(1, cores // workers)) for path in paths]
+    if workers == 1:
+        return [run_fold(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_run_fold, jobs))
+
+
+def summarize(results):
+    mae = np.array([r['mae'] for r in results])
+    r2 = np.array([r['r2'] for r in results])
+    return {'mae': round(float(mae.mean()), 4), 'mae_std': round(float(mae.std()), 4),
+            'r2': round(float(r2.mean()), 4), 'r2_std': round(float(r2.std()), 4),
+            'trees': int(round(np.mean([r['trees'] for r in results]))), 'folds': len(results)}
+
+
+def evaluate(source='level2', scheme='group', mode='notebook', params=None, n_splits=N_SPLITS, seed=SEED,
+             workers=None, data_dir=ingest.DATA_DIR, cache_dir=CACHE_DIR):
+    """``(summary, per-fold results)`` of ``mode`` with ``params`` under ``scheme``."""
+    table, data_key = load_table(source, data_dir)
+    splits = folds(table, scheme, n_splits, seed, data_dir)
+    paths = fold_matrices(table, splits, mode, train.key(data_key, scheme, n_splits, seed, mode), cache_dir)
+    results = cross_validate(paths, mode, params, workers)
+    return summarize(results), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cross-validate the score model with matches kept whole.')
+    parser.add_argument('--source', choices=['level2', 'yaml'], default='level2')
+    parser.add_argument('--data-dir', default=ingest.DATA_DIR)
+    parser.add_argument('--scheme', choices=SCHEMES, default='group')
+    parser.add_argument('--mode', choices=sorted(train.MODES), default='notebook')
+    parser.add_argument('--folds', type=int, default=N_SPLITS)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--n-estimators', type=int, default=None)
+    parser.add_argument('--learning-rate', type=float, default=None)
+    parser.add_argument('--max-depth', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None, help='folds fitted at once (default: one per core)')
+    args = parser.parse_args()
+
+    given = {'n_estimators': args.n_estimators, 'learning_rate': args.learning_rate, 'max_depth': args.max_depth}
+    params = {k: v for k, v in given.items() if v is not None}
+    start = time.perf_counter()
+    summary, results = evaluate(args.source, args.scheme, args.mode, params, args.folds, args.seed, args.workers,
+                                args.data_dir)
+    for k, r in enumerate(results):
+        print(f"fold {k}: MAE {r['mae']:6.2f}  R2 {r['r2']:.4f}  {r['test_matches']:>4} matches "
+              f"({r['test_rows']} rows)  {r['trees']} trees  fit {r['fit_seconds']:.1f}s")
+    print(f"{args.scheme} CV ({args.mode}): MAE {summary['mae']:.2f} +- {summary['mae_std']:.2f}, "
+          f"R2 {summary['r2']:.4f} +- {summary['r2_std']:.4f}; total {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
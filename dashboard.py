@@ -0,0 +1,234 @@
+"""Multi-match live dashboard.
+
+Follows a live.py event file (see live.py for the format) on one background
+thread shared by every browser session, and shows a card per match. A second
+shared thread ticks: it collects the states of all matches that moved, scores
+them with one batched model call and publishes the cards. Scored states go to
+the audit log (see audit.py) once per tick, however many viewers are open;
+a tick that fails is counted and logged, and the next one runs as usual.
+Each session only renders the latest cards and reruns itself every tick
+(at most every ``MAX_POLL`` seconds), so sidebar input and new cards show
+up within one poll.
+
+    streamlit run dashboard.py -- --events live_events.jsonl --tick 1
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+import streamlit as st
+
+import audit
+from live import HEADER, LiveInnings
+from predcache import PredictionCache
+from schema import CATEGORICAL, FEATURES
+
+# Longest a session waits before rendering the feed again
+MAX_POLL = 2.0
+
+
+class Feed:
+    """Background tail of an event file, keeping the state and card of every match.
+
+    Every ``tick`` seconds the matches that moved are scored together with
+    ``model``; ``cards()`` returns the latest results.
+    """
+
+    def __init__(self, path, model, tick=1.0, interval=0.25):
+        self.path = path
+        self.model = model
+        self.tick = tick
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.innings = {}
+        self.numbers = {}
+        self.versions = {}
+        self.scored = {}
+        self.last_tick = None
+        self.errors = 0
+        self.failed_ticks = 0
+        self.last_failure = None
+        self.thread = threading.Thread(target=self._run, name='dashboard-feed', daemon=True)
+        self.thread.start()
+        self.scorer = threading.Thread(target=self._score, name='dashboard-score', daemon=True)
+        self.scorer.start()
+
+    def _run(self):
+        while True:
+            try:
+                f = open(self.path, 'rb')
+            except OSError:
+                time.sleep(self.interval)
+                continue
+            with f:
+                partial = b''
+                while True:
+                    line = f.readline()
+                    if not line:
+                        time.sleep(self.interval)
+                        continue
+                    if not line.endswith(b'\n'):
+                        partial += line
+                        continue
+                    self._apply(partial + line)
+                    partial = b''
+
+    def _apply(self, line):
+        try:
+            event = json.loads(line)
+            match = str(event.pop('match', ''))
+            with self.lock:
+                if all(k in event for k in HEADER):
+                    self.innings[match] = LiveInnings(*(event[k] for k in HEADER))
+                    self.numbers[match] = int(event.get('innings', 1))
+                else:
+                    innings = self.innings[match]
+                    for key, ball in event.items():
+                        innings.add(key, ball['runs']['total'], 'wicket' in ball or 'wickets' in ball)
+                self.versions[match] = self.versions.get(match, 0) + 1
+        except (ValueError, KeyError, TypeError):
+            self.errors += 1
+
+    def snapshot(self):
+        """``{match: (version, innings summary, features or None)}``."""
+        snapshot = {}
+        with self.lock:
+            for match, inn in self.innings.items():
+                state = inn.state()
+                summary = {'score': inn.score, 'wickets': inn.wickets, 'balls': inn.balls_bowled,
+                           'innings': self.numbers[match], **state}
+                snapshot[match] = (self.versions[match], summary, state if inn.ready else None)
+        return snapshot
+
+    def _score(self):
+        while True:
+            try:
+                self.score_tick()
+            except Exception as e:
+                # One bad tick (a failed predict, a model reload) must not stop scoring for every viewer
+                failure = f'{type(e).__name__}: {e}'
+                with self.lock:
+                    self.failed_ticks += 1
+                    self.last_failure = failure
+                print(f"dashboard: scoring tick failed: {failure}", file=sys.stderr)
+            time.sleep(self.tick)
+
+    def score_tick(self):
+        """Score every match that moved since the last tick in one batch."""
+        start = time.perf_counter()
+        snapshot = self.snapshot()
+        with self.lock:
+            changed = [m for m in sorted(snapshot) if self.scored.get(m, (None,))[0] != snapshot[m][0]]
+        categories = self.model.categories
+        notes, ready = {}, []
+        for m in changed:
+            state = snapshot[m][2]
+            unknown = [state[col] for col in CATEGORICAL if state[col] not in categories[col]] if state else []
+            if state is None:
+                notes[m] = 'projection after 30 balls'
+            elif unknown:
+                notes[m] = f"no projection: {', '.join(unknown)} not in the model"
+            else:
+                ready.append(m)
+        projected = {}
+        if ready:
+            states = {col: [snapshot[m][2][col] for m in ready] for col in FEATURES}
+            scores = self.model.predict(states, check=False, match_ids=[audit.match_key(m) for m in ready],
+                                        innings=[snapshot[m][1]['innings'] for m in ready])
+            projected = dict(zip(ready, (int(s) for s in scores)))
+        with self.lock:
+            for m in changed:
+                self.scored[m] = (snapshot[m][0], snapshot[m][1], projected.get(m), notes.get(m))
+            if changed:
+                self.last_tick = (len(changed), len(ready), time.perf_counter() - start)
+
+    def cards(self):
+        """``({match: (version, summary, projected or None, note or None)}, last tick)``.
+
+        The last tick is ``(matches updated, matches scored, seconds)``.
+        """
+        with self.lock:
+            return dict(self.scored), self.last_tick
+
+    def failures(self):
+        """``(failed ticks, the last failure or None)``."""
+        with self.lock:
+            return self.failed_ticks, self.last_failure
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', default='live_events.jsonl')
+    parser.add_argument('--tick', type=float, default=1.0)
+    args, _ = parser.parse_known_args(sys.argv[1:])
+    return args
+
+
+@st.cache_resource
+def load_model():
+    return PredictionCache(audit=audit.AuditLog(source='dashboard'))
+
+
+@st.cache_resource
+def load_feed(path, tick, _model):
+    # One feed (and scoring thread) per event file, shared by every session
+    return Feed(path, _model, tick)
+
+
+def card(match, summary, projected, note):
+    overs = f"{summary['balls'] // 6}.{summary['balls'] % 6}"
+    projection = (f'<div class="proj">{projected}</div><div class="label">projected</div>'
+                  if projected is not None else f'<div class="label">{note}</div>')
+    return f"""
+    <div class="card">
+        <div class="teams">{summary['batting_team']} <span>v</span> {summary['bowling_team']}</div>
+        <div class="meta">{summary['city']} &middot; {match}</div>
+        <div class="score">{summary['score']}/{summary['wickets']} <span>({overs} ov)</span></div>
+        <div class="meta">CRR {summary['crr']:.2f} &middot; last 5 overs {summary['last_five']}</div>
+        {projection}
+    </div>
+    """
+
+
+st.set_page_config(page_title="T20 Live Dashboard", page_icon="🏏", layout="wide")
+st.markdown("""
+<style>
+.card { background: #10261a; border: 1px solid #1f5c36; border-radius: 12px; padding: 0.9rem 1rem;
+        margin-bottom: 0.8rem; color: #d8e6dc; }
+.card .teams { font-weight: 700; font-size: 1.05rem; }
+.card .teams span, .card .score span { color: #8aa596; font-weight: 400; }
+.card .meta, .card .label { color: #8aa596; font-size: 0.78rem; }
+.card .score { font-size: 1.6rem; font-weight: 700; margin-top: 0.3rem; }
+.card .proj { font-size: 2rem; font-weight: 700; color: #f5c842; line-height: 1.1; margin-top: 0.4rem; }
+</style>
+""", unsafe_allow_html=True)
+
+args = parse_args()
+feed = load_feed(args.events, args.tick, load_model())
+
+st.title("T20 Live Dashboard")
+per_row = st.sidebar.slider("Cards per row", 2, 6, 4)
+status = st.sidebar.empty()
+
+cards, last_tick = feed.cards()
+matches = sorted(cards)
+if not matches:
+    st.info(f"Waiting for events in {args.events}")
+for row in range(0, len(matches), per_row):
+    for column, match in zip(st.columns(per_row), matches[row:row + per_row]):
+        version, summary, projected, note = cards[match]
+        column.markdown(card(match, summary, projected, note), unsafe_allow_html=True)
+if last_tick:
+    updated, scored, seconds = last_tick
+    status.caption(f"{len(matches)} matches · last tick {updated} updated, {scored} scored "
+                   f"in {seconds * 1000:.0f} ms")
+failed, failure = feed.failures()
+if failed:
+    st.sidebar.warning(f"{failed} scoring ticks failed; last: {failure}")
+
+# Sessions only render what the feed's scoring thread published; widget
+# input is applied by the rerun at the end of the wait
+time.sleep(min(args.tick, MAX_POLL))
+st.rerun()
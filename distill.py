@@ -0,0 +1,225 @@
+"""Distil the production model into a small student for numpy-only serving.
+
+The notebook's booster (1000 trees of depth 12) is far larger than eight
+features need. The student is a shallow native-categorical booster
+(``train.make_native_pipeline``, depth 6, a few hundred trees) fitted to
+the teacher's predictions rather than to the runs actually scored, over two
+kinds of states drawn from the teacher's input distribution:
+
+    real        the rows of dataset_level2.pkl
+    synthetic   real states moved a few balls along the innings, with the
+                scoring pace, last-five-overs runs and wickets nudged
+                around them; states no innings can reach (more runs in the
+                last five overs than in total, more than six a ball) are
+                dropped, so the student also follows the teacher between
+                the states seen in training
+
+One state in five (``HOLDOUT``), real or synthetic, is kept out of the fit
+and fidelity is reported on them: the share of the teacher's variance the
+student reproduces (R2), mean, P99 and maximum absolute difference, and the
+MAE of both models against the actual scores. States rather than matches
+are held out because the student stands in for the teacher on the states
+it is asked about, not on matches it never saw: dataset_level2.pkl is the
+teacher's training data, and the teacher has memorized its innings (its
+MAE there is a fraction of a run). No compact model carries those
+per-innings residuals, which is why the P99 gap stays in the tens of runs
+and is reported rather than gated. Size and latency are measured on the
+fast path for both models.
+
+The student is written as a regular bundle (``Model/student``) only when it
+reproduces at least ``MIN_FIDELITY_R2`` of the teacher's variance on the
+held-out states and is both smaller and faster in batches than the teacher
+(``--force`` writes it anyway). Its ``predictor()`` is
+``fastpath.FastPredictor``, so serving needs numpy only; point the apps at
+it with ``T20_MODEL=Model/student``.
+
+    python distill.py                            # Model/bundle -> Model/student
+    python distill.py --max-depth 5 --n-estimators 200 --synthetic 2
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+import bundle
+import fastpath
+import predict
+import train
+from schema import BALLS_PER_INNINGS, CATEGORICAL, FEATURES, LAST_FIVE_BALLS
+
+STUDENT_PATH = os.path.join(predict.ROOT, 'Model', 'student')
+# A cap; early stopping on held-out states of the teacher's predictions
+# decides the tree count
+STUDENT_PARAMS = {'n_estimators': 400, 'learning_rate': 0.1, 'max_depth': 6, 'early_stopping_rounds': 30}
+SYNTHETIC = 1.0
+# Lowest R2 against the teacher on held-out states written without --force;
+# the notebook's linear regression reached 0.68 against the actual scores
+MIN_FIDELITY_R2 = 0.6
+# Synthetic states: balls moved along the innings, and the spread of the pace scaling
+SHIFT_BALLS = 6
+PACE = 0.2
+MAX_RUNS_PER_BALL = 6
+HOLDOUT = 0.2
+SEED = 1
+
+
+def real_states():
+    """The level2 training table, with match ids."""
+    import features
+    import store
+    return features.build_features(store.from_level2(store.load_legacy_pickle(features.LEVEL2_PKL)), keys=True)
+
+
+def synthetic_states(table, factor=SYNTHETIC, seed=SEED):
+    """Up to ``factor`` times as many states as ``table``, each a perturbed real state.
+
+    A drawn row moves up to ``SHIFT_BALLS`` balls along its innings with its
+    run rate kept, then the score and the last-five-overs runs are scaled
+    by up to ``PACE`` either way and a wicket may be added or given back.
+    Unreachable states are dropped.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(len(table) * factor)
+    base = table.iloc[rng.integers(len(table), size=n)].reset_index(drop=True)
+    states = base[CATEGORICAL].copy()
+
+    # Rows start once a full last-five-overs window has been bowled
+    balls_left = np.clip(base['balls_left'].to_numpy() + rng.integers(-SHIFT_BALLS, SHIFT_BALLS + 1, n),
+                         0, BALLS_PER_INNINGS - LAST_FIVE_BALLS)
+    balls_bowled = BALLS_PER_INNINGS - balls_left
+    rate = base['current_score'].to_numpy() / (BALLS_PER_INNINGS - base['balls_left'].to_numpy())
+    score = np.round(rate * balls_bowled * rng.uniform(1 - PACE, 1 + PACE, n))
+    last_five = np.minimum(np.round(base['last_five'].to_numpy() * rng.uniform(1 - PACE, 1 + PACE, n)), score)
+    states['current_score'] = score.astype('int64')
+    states['balls_left'] = balls_left
+    states['wickets_left'] = np.clip(base['wickets_left'].to_numpy() + rng.integers(-1, 2, n), 0, 10)
+    states['crr'] = np.round(score * 6 / balls_bowled, 2)
+    states['last_five'] = last_five
+    reachable = (score <= MAX_RUNS_PER_BALL * balls_bowled) & (last_five <= MAX_RUNS_PER_BALL * LAST_FIVE_BALLS)
+    return states.loc[reachable, FEATURES].reset_index(drop=True)
+
+
+def fidelity(student, teacher, y=None):
+    """R2 against and absolute differences from the teacher, and MAE against ``y`` if given."""
+    error = student.astype('float64') - teacher
+    gap = np.abs(error)
+    r2 = 1 - (error ** 2).sum() / ((teacher - teacher.mean()) ** 2).sum()
+    result = {'r2': round(float(r2), 4), 'mean_abs_diff': round(float(gap.mean()), 4), 'p99_abs_diff': round(float(np.percentile(gap, 99)), 4),
+              'max_abs_diff': round(float(gap.max()), 4), 'rows': int(len(gap))}
+    if y is not None:
+        result['mae'] = round(float(np.abs(y - student).mean()), 4)
+        result['teacher_mae'] = round(float(np.abs(y - teacher).mean()), 4)
+    return result
+
+
+def speed(model, X):
+    """Fast path size and latency, as ``train.profile`` reports them."""
+    batch = X.iloc[:train.LATENCY_ROWS]
+    predict_rows = lambda rows: model.predict(rows, check=False)
+    return {'trees': int(len(model.roots)), 'depth': model.depth, 'nodes': int(len(model.feature)),
+            'fastpath_bytes': int(sum(np.asarray(a).nbytes for a in model.arrays.values())),
+            'row_us': round(train.latency(predict_rows, X.iloc[[0]], 200) * 1e6, 1),
+            'batch_us_per_row': round(train.latency(predict_rows, batch, 5) / len(batch) * 1e6, 2)}
+
+
+def distill(teacher, params=None, factor=SYNTHETIC, holdout=HOLDOUT, seed=SEED):
+    """``(student pipe, report)`` for a teacher predictor (``bundle.load_predictor``)."""
+    import pandas as pd
+
+    table = real_states()
+    X = pd.concat([table[FEATURES], synthetic_states(table, factor, seed)], ignore_index=True)
+    is_real = np.arange(len(X)) < len(table)
+    start = time.perf_counter()
+    target = teacher.predict(X, check=False).astype('float64')
+    teacher_seconds = time.perf_counter() - start
+
+    # States, not matches, are held out: see the module docstring
+    held_out = np.random.default_rng(seed).random(len(X)) < holdout
+    # Every fixture gets a code, whichever side of the split its states fell on
+    vocab = [sorted(X[col].unique().tolist()) for col in CATEGORICAL]
+    start = time.perf_counter()
+    # Each state is its own group, so early stopping also validates on unseen states
+    pipe = train.fit_native(X[~held_out], target[~held_out], {**STUDENT_PARAMS, **(params or {})},
+                            np.arange(int((~held_out).sum())), random_state=seed, categories=vocab)
+    fit_seconds = time.perf_counter() - start
+
+    student = fastpath.FastPredictor.from_pipeline(pipe)
+    cap = int(pipe.named_steps['step3'].get_params()['n_estimators'])
+    predicted = student.predict(X[held_out], check=False)
+    real_test, synthetic_test = is_real[held_out], ~is_real[held_out]
+    actual = table['runs_x'].to_numpy(dtype='float64')[held_out[is_real]]
+    small, big = speed(student, X[held_out]), speed(teacher, X[held_out])
+    report = {
+        'all': fidelity(predicted, target[held_out]),
+        'real': fidelity(predicted[real_test], target[held_out][real_test], actual),
+        'synthetic': fidelity(predicted[synthetic_test], target[held_out][synthetic_test]),
+        'train_rows': int((~held_out).sum()), 'teacher_seconds': round(teacher_seconds, 2),
+        'fit_seconds': round(fit_seconds, 2), 'tree_cap': cap, 'early_stopped': len(student.roots) < cap,
+        'teacher_saw_held_out': True, 'student': small, 'teacher': big,
+        'speedup': {'row': round(big['row_us'] / small['row_us'], 2),
+                    'batch': round(big['batch_us_per_row'] / small['batch_us_per_row'], 2),
+                    'size': round(big['fastpath_bytes'] / small['fastpath_bytes'], 2)},
+    }
+    return pipe, report
+
+
+def rejected(report, min_r2=MIN_FIDELITY_R2):
+    """Why the student should not replace the teacher, or None."""
+    reasons = []
+    if report['all']['r2'] < min_r2:
+        reasons.append(f"R2 against the teacher {report['all']['r2']:.3f} is below {min_r2:.2f}")
+    if report['speedup']['size'] <= 1:
+        reasons.append('it is not smaller than the teacher')
+    if report['speedup']['batch'] <= 1:
+        reasons.append('it is not faster than the teacher in batches')
+    return '; '.join(reasons) or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distil the score model into a small numpy-only student bundle.')
+    parser.add_argument('--teacher', default=None, help='bundle directory or fastpath .npz (default: Model/bundle)')
+    parser.add_argument('--out', default=STUDENT_PATH)
+    parser.add_argument('--n-estimators', type=int, default=None)
+    parser.add_argument('--learning-rate', type=float, default=None)
+    parser.add_argument('--max-depth', type=int, default=None)
+    parser.add_argument('--synthetic', type=float, default=SYNTHETIC, help='synthetic states per real state')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--min-r2', type=float, default=MIN_FIDELITY_R2,
+                        help='lowest R2 against the teacher on held-out states for which the student is written')
+    parser.add_argument('--force', action='store_true', help='write the student whatever its fidelity, size and speed')
+    args = parser.parse_args()
+
+    given = {'n_estimators': args.n_estimators, 'learning_rate': args.learning_rate, 'max_depth': args.max_depth}
+    params = {k: v for k, v in given.items() if v is not None}
+    teacher = bundle.load_predictor(args.teacher)
+    pipe, report = distill(teacher, params, args.synthetic, seed=args.seed)
+
+    real, student, big, faster = report['real'], report['student'], report['teacher'], report['speedup']
+    print(f"Student: {student['trees']} trees of depth {student['depth']} ({student['nodes']} nodes, "
+          f"{student['fastpath_bytes'] / 2 ** 10:.0f} KiB) vs {big['trees']} trees ({big['nodes']} nodes, "
+          f"{big['fastpath_bytes'] / 2 ** 20:.1f} MiB); fit {report['fit_seconds']:.1f}s on {report['train_rows']} states")
+    for name in ['all', 'real', 'synthetic']:
+        r = report[name]
+        print(f"Fidelity ({name}, {r['rows']} held-out states): R2 {r['r2']:.3f}, |student - teacher| "
+              f"mean {r['mean_abs_diff']:.2f}, P99 {r['p99_abs_diff']:.2f}, max {r['max_abs_diff']:.2f} runs")
+    print(f"MAE vs actual scores: student {real['mae']:.2f}, teacher {real['teacher_mae']:.2f} "
+          f"(the teacher was trained on these matches and memorized them)")
+    if not report['early_stopped']:
+        print(f"WARNING: the student used all {report['tree_cap']} trees of the cap; early stopping never fired, "
+              f"raise --n-estimators")
+    print(f"Latency: {student['row_us']:.0f} us vs {big['row_us']:.0f} us per single row ({faster['row']:.1f}x), "
+          f"{student['batch_us_per_row']:.2f} vs {big['batch_us_per_row']:.2f} us per row in batches "
+          f"({faster['batch']:.1f}x); {faster['size']:.1f}x smaller")
+    reason = rejected(report, args.min_r2)
+    if reason and not args.force:
+        parser.exit(1, f"Not written: {reason}; adjust --max-depth / --n-estimators, or pass --force\n")
+
+    import features
+    bundle.save_bundle(pipe, args.out, bundle.file_hash(features.LEVEL2_PKL), real)
+    bundle.add_arrays(args.out, {}, distilled_from=teacher.version, distillation=report)
+    print(f"Wrote {args.out}; serve it with T20_MODEL={os.path.relpath(args.out, predict.ROOT)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""Compiled numpy predictor that bypasses sklearn and XGBoost at inference.
+
+``export`` folds the pipeline's OneHotEncoder(drop='first') and
+StandardScaler into one float32 lookup table per categorical column (the
+already-scaled one-hot block for each category) plus a mean/scale pair for
+the numeric columns, and flattens the booster's trees into node arrays.
+Prediction is then a handful of numpy gathers per tree level, evaluated for
+every tree at once, and needs neither sklearn, xgboost nor pandas.
+
+Pipelines trained with native categoricals (``train.py --mode native``:
+OrdinalEncoder, no scaler) compile the same way: each table holds the
+category code, and a categorical split is a bitset of the codes sent left.
+
+The arithmetic mirrors the pipeline step by step (scaling in float64, cast
+to float32, ``x < split`` comparisons in float32, leaves summed in tree
+order onto the base score in float32), so predictions are bit-for-bit equal
+to ``pipe.predict``.
+
+    python fastpath.py export Model/pipe.npz    # compile Model/pipe.pkl
+    python fastpath.py check                    # parity on the held-out split
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import predict
+from intervals import Intervals
+from schema import CATEGORICAL, NUMERIC
+
+FAST_PATH = predict.MODEL_PATH[:-len('.pkl')] + '.npz'
+
+
+def compile_trees(booster):
+    """Flatten a booster into concatenated node arrays.
+
+    Leaves point to themselves as both children, so walking a fixed number of
+    levels leaves every row parked on its leaf.
+    """
+    model = json.loads(booster.save_raw('json'))
+    learner = model['learner']
+    trees = learner['gradient_booster']['model']['trees']
+    best = booster.attributes().get('best_iteration')
+    if best is not None:
+        trees = trees[:int(best) + 1]
+
+    feature, threshold, left, right, default_left, roots = [], [], [], [], [], []
+    category_left = []
+    offset, depth = 0, 0
+    for tree in trees:
+        lc = np.asarray(tree['left_children'], dtype='int64')
+        rc = np.asarray(tree['right_children'], dtype='int64')
+        nodes = np.arange(len(lc))
+        leaf = lc == -1
+        left.append(np.where(leaf, nodes, lc) + offset)
+        right.append(np.where(leaf, nodes, rc) + offset)
+        feature.append(np.where(leaf, 0, tree['split_indices']))
+        categorical = np.asarray(tree['split_type'], dtype=bool)
+        # A NaN split never holds for ``x < split``; the bitset decides instead
+        threshold.append(np.where(categorical, np.nan, tree['split_conditions']).astype('float32'))
+        default_left.append(np.asarray(tree['default_left'], dtype=bool))
+        category_left.append(_category_left(tree, categorical))
+        roots.append(offset)
+        offset += len(lc)
+        depth = max(depth, _depth(lc, rc))
+
+    arrays = {
+        'feature': np.concatenate(feature).astype('int32'),
+        # For leaves the split condition holds the leaf value
+        'threshold': np.concatenate(threshold),
+        'left': np.concatenate(left).astype('int32'),
+        'right': np.concatenate(right).astype('int32'),
+        'default_left': np.concatenate(default_left),
+        'roots': np.asarray(roots, dtype='int32'),
+        'depth': np.asarray(depth, dtype='int32'),
+        'base_score': np.asarray(float(learner['learner_model_param']['base_score']), dtype='float32'),
+    }
+    category_left = np.concatenate(category_left)
+    if category_left.any():
+        arrays['category_left'] = category_left
+    return arrays
+
+
+def _category_left(tree, categorical):
+    """Per node, a uint64 with bit ``c`` set when category code ``c`` goes left.
+
+    XGBoost stores the categories sent right; numeric splits get no bits.
+    """
+    right = np.zeros(len(categorical), dtype='uint64')
+    for node, start, size in zip(tree['categories_nodes'], tree['categories_segments'], tree['categories_sizes']):
+        codes = tree['categories'][start:start + size]
+        if codes and max(codes) >= 64:
+            raise ValueError('The fast path supports categorical splits on at most 64 categories')
+        for code in codes:
+            right[node] |= np.uint64(1) << np.uint64(code)
+    return np.where(categorical, ~right, np.uint64(0))
+
+
+def _depth(left, right):
+    depth, level = 0, [0]
+    while True:
+        level = [c for n in level for c in (left[n], right[n]) if c != -1]
+        if not level:
+            return depth
+        depth += 1
+
+
+def compile_pipeline(pipe):
+    """Return the arrays of a ``FastPredictor`` for a fitted pipeline."""
+    encoder = pipe.named_steps['step1'].named_transformers_['trf']
+    if native_categorical(pipe):
+        return _compile_native(pipe, encoder)
+    scaler = pipe.named_steps['step2']
+    mean, scale = scaler.mean_, scaler.scale_
+    if encoder.drop_idx_ is None or not (encoder.drop_idx_ == 0).all():
+        raise ValueError("Expected OneHotEncoder(drop='first')")
+
+    arrays = {}
+    column = 0
+    for name, categories in zip(CATEGORICAL, encoder.categories_):
+        width = len(categories) - 1
+        onehot = np.zeros((len(categories), width))
+        onehot[np.arange(1, len(categories)), np.arange(width)] = 1.0
+        # The StandardScaler applied to every possible one-hot block
+        arrays[f'{name}_categories'] = np.asarray(categories, dtype=str)
+        arrays[f'{name}_table'] = ((onehot - mean[column:column + width]) / scale[column:column + width]).astype('float32')
+        column += width
+    arrays['numeric_mean'] = mean[column:]
+    arrays['numeric_scale'] = scale[column:]
+    arrays.update(compile_trees(pipe.named_steps['step3'].get_booster()))
+    return arrays
+
+
+def native_categorical(pipe):
+    """True for pipelines whose booster splits on category codes (OrdinalEncoder)."""
+    return not hasattr(pipe.named_steps['step1'].named_transformers_['trf'], 'drop_idx_')
+
+
+def _compile_native(pipe, encoder):
+    # Codes in a one-column table and an identity scaling: the booster sees
+    # the OrdinalEncoder output and the raw numeric columns
+    arrays = {}
+    for name, categories in zip(CATEGORICAL, encoder.categories_):
+        arrays[f'{name}_categories'] = np.asarray(categories, dtype=str)
+        arrays[f'{name}_table'] = np.arange(len(categories), dtype='float32')[:, None]
+    arrays['numeric_mean'] = np.zeros(len(NUMERIC))
+    arrays['numeric_scale'] = np.ones(len(NUMERIC))
+    arrays.update(compile_trees(pipe.named_steps['step3'].get_booster()))
+    return arrays
+
+
+class FastPredictor(predict.BatchPredictor):
+    """Drop-in replacement for ``predict.BatchPredictor`` on compiled arrays."""
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.categories = {col: set(arrays[f'{col}_categories'].tolist()) for col in CATEGORICAL}
+        self.index = {col: {c: i for i, c in enumerate(arrays[f'{col}_categories'].tolist())}
+                      for col in CATEGORICAL}
+        self.tables = [arrays[f'{col}_table'] for col in CATEGORICAL]
+        self.mean = arrays['numeric_mean']
+        self.scale = arrays['numeric_scale']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.default_left = arrays['default_left']
+        self.roots = arrays['roots']
+        # children[2 * n] is the right child of node n, children[2 * n + 1] the left
+        self.children = np.stack([self.right, self.left], axis=1).ravel()
+        self.category_left = arrays.get('category_left')
+        self.depth = int(arrays['depth'])
+        self.base_score = np.float32(arrays['base_score'])
+        self.intervals = Intervals.from_arrays(arrays)
+
+    @classmethod
+    def from_pipeline(cls, pipe):
+        return cls(compile_pipeline(pipe))
+
+    @classmethod
+    def load(cls, path=FAST_PATH):
+        with np.load(path) as data:
+            return cls({k: data[k] for k in data.files})
+
+    def save(self, path=FAST_PATH):
+        with open(path, 'wb') as f:
+            np.savez(f, **self.arrays)
+
+    def encode(self, columns):
+        """Scaled float32 model matrix for ``{feature: array}`` columns."""
+        blocks = []
+        for col, table in zip(CATEGORICAL, self.tables):
+            index = self.index[col]
+            try:
+                codes = [index[v] for v in columns[col]]
+            except KeyError as e:
+                raise ValueError(f"Unknown {col}: {e.args[0]}")
+            blocks.append(table[codes])
+        numeric = np.column_stack([np.asarray(columns[col], dtype='float64') for col in NUMERIC])
+        blocks.append(((numeric - self.mean) / self.scale).astype('float32'))
+        return np.hstack(blocks)
+
+    def predict_matrix(self, X, chunk=2048):
+        """Walk every tree for every row of an encoded matrix."""
+        if len(X) > chunk:
+            return np.concatenate([self.predict_matrix(X[i:i + chunk]) for i in range(0, len(X), chunk)])
+        # Gather features from the flattened matrix: one index op per level
+        flat = np.ascontiguousarray(X).ravel()
+        offsets = (np.arange(len(X)) * X.shape[1])[:, None]
+        missing = np.isnan(flat).any()
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.depth):
+            x = flat[offsets + self.feature[node]]
+            go_left = x < self.threshold[node]
+            if self.category_left is not None:
+                codes = (np.nan_to_num(x) if missing else x).clip(0, 63).astype('uint64')
+                go_left |= ((self.category_left[node] >> codes) & np.uint64(1)).astype(bool)
+            if missing:
+                go_left |= np.isnan(x) & self.default_left[node]
+            node = self.children[2 * node + go_left]
+        leaves = self.threshold[node]
+        # Sequential float32 accumulation in tree order, as XGBoost does
+        total = np.concatenate([np.full((len(X), 1), self.base_score, dtype='float32'), leaves], axis=1)
+        return np.cumsum(total, axis=1, dtype='float32')[:, -1]
+
+    def predict(self, states, check=True):
+        columns = predict.to_columns(states)
+        if check:
+            predict.validate(columns, self.categories)
+        return self.predict_matrix(self.encode(columns))
+
+
+def held_out_set():
+    """The notebook's test split, rebuilt from dataset_level2.pkl."""
+    from sklearn.model_selection import train_test_split
+
+    import features
+    import store
+    df = features.build_features(store.from_level2(store.load_legacy_pickle(features.LEVEL2_PKL)))
+    X = df.drop(columns=['runs_x'])
+    y = df['runs_x']
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=1)
+    return X_test, y_test
+
+
+def check_parity(pipe, fast, X):
+    """Assert bit-for-bit equal predictions; returns the number of rows checked."""
+    expected = pipe.predict(X)
+    actual = fast.predict(X)
+    mismatched = np.flatnonzero(expected.view('int32') != actual.view('int32'))
+    if len(mismatched):
+        i = mismatched[0]
+        raise AssertionError(f"{len(mismatched)} of {len(X)} predictions differ, e.g. row {i}: "
+                             f"{expected[i]!r} != {actual[i]!r}")
+    return len(X)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile the pipeline into a numpy-only predictor.')
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('output', nargs='?', default=FAST_PATH)
+    parser.add_argument('--model', default=predict.MODEL_PATH)
+    args = parser.parse_args()
+
+    pipe = predict.load_model(args.model)
+    fast = FastPredictor.from_pipeline(pipe)
+    if args.command == 'export':
+        fast.save(args.output)
+        print(f"Wrote {args.output} ({len(fast.roots)} trees, depth {fast.depth})")
+        return
+
+    X, _ = held_out_set()
+    print(f"Parity OK: {check_parity(pipe, fast, X)} held-out predictions are bit-for-bit equal")
+    row = X.iloc[[0]]
+    for name, fn in [('pipe.predict', pipe.predict), ('fast path', fast.predict)]:
+        fn(row)
+        start = time.perf_counter()
+        for _ in range(200):
+            fn(row)
+        print(f"{name}: {(time.perf_counter() - start) / 200 * 1e6:.0f} us per single-row prediction")
+
+
+if __name__ == '__main__':
+    main()
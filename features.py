@@ -0,0 +1,179 @@
+"""Training features from the ball-by-ball delivery table.
+
+Computes current_score, balls_left, wickets_left, crr, last_five and the
+innings total (``runs_x``) with grouped, vectorized operations, replacing
+the notebook's ``.apply(lambda ...)`` string splits and the per-match
+``rolling(window=30)`` loop. Every step is a cumulative sum or a shift over
+(match_id, innings) groups, so the cost is linear in the number of deliveries.
+
+    python features.py --check    # parity with the notebook on dataset_level2.pkl
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import store
+from schema import (BALLS_PER_INNINGS, CATEGORICAL, FEATURES, LAST_FIVE_BALLS,
+                    MIN_CITY_DELIVERIES, TARGET, TEAMS)
+
+KEYS = ['match_id', 'innings']
+LEVEL2_PKL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Training', 'dataset_level2.pkl')
+
+
+def fill_city(deliveries):
+    """Missing cities become the first word of the venue, as in the notebook."""
+    city = deliveries['city'].astype(object)
+    missing = city.isna().to_numpy()
+    if missing.any():
+        venue = deliveries['venue'].astype(object)[missing]
+        city[missing] = venue.str.split().str[0].to_numpy()
+    return city
+
+
+def _select(deliveries, teams, innings):
+    # Team / innings filter plus the city fill, shared by the builders below
+    df = deliveries
+    mask = df['batting_team'].isin(teams) & df['bowling_team'].isin(teams)
+    if innings is not None:
+        mask &= df['innings'].isin(innings)
+    df = df.loc[mask.to_numpy()]
+    return df.assign(city=fill_city(df).to_numpy())
+
+
+def city_counts(deliveries, teams=TEAMS, innings=(1,)):
+    """Deliveries per (filled) city, as used for the eligible-city cut."""
+    return _select(deliveries[['batting_team', 'bowling_team', 'innings', 'city', 'venue']],
+                   teams, innings)['city'].value_counts()
+
+
+def filter_cities(table, counts, min_city_deliveries=MIN_CITY_DELIVERIES):
+    """Keep rows whose city has more than ``min_city_deliveries`` deliveries."""
+    eligible = counts.index[counts > min_city_deliveries]
+    return table[table['city'].isin(eligible).to_numpy()].reset_index(drop=True)
+
+
+def build_features(deliveries, teams=TEAMS, min_city_deliveries=MIN_CITY_DELIVERIES,
+                   innings=(1,), keys=False):
+    """Return the training table: ``FEATURES`` plus the ``runs_x`` target.
+
+    ``deliveries`` has the store schema (match_id, innings, batting_team,
+    bowling_team, city, venue, over, ball, runs, wicket). ``innings`` selects
+    which innings to use (the notebook only used the first). With
+    ``keys=True`` the match_id and innings columns are kept as well. Like the
+    notebook, rows from the first 29 balls of an innings are dropped because
+    they have no complete last-five-overs window. ``min_city_deliveries=None``
+    skips the eligible-city cut (see ``filter_cities``).
+    """
+    df = _select(deliveries, teams, innings)
+    if min_city_deliveries is not None:
+        counts = df['city'].value_counts()
+        df = df[df['city'].isin(counts.index[counts > min_city_deliveries])]
+
+    # Make every innings one contiguous, ordered run of rows
+    df = df.sort_values(KEYS, kind='stable').reset_index(drop=True)
+    match_id = df['match_id'].to_numpy()
+    inn = df['innings'].to_numpy()
+    start = np.r_[True, (match_id[1:] != match_id[:-1]) | (inn[1:] != inn[:-1])]
+    group = np.cumsum(start) - 1
+    first = np.flatnonzero(start)
+    position = np.arange(len(df)) - first[group]
+
+    runs = df['runs'].to_numpy().astype('int64')
+    total = np.cumsum(runs)
+    before = np.r_[0, total][first][group]
+    current_score = total - before
+
+    wickets = np.cumsum(df['wicket'].to_numpy().astype('int64'))
+    wickets = wickets - np.r_[0, wickets][first][group]
+
+    balls_bowled = df['over'].to_numpy().astype('int64') * 6 + df['ball'].to_numpy().astype('int64')
+    balls_left = np.maximum(BALLS_PER_INNINGS - balls_bowled, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crr = np.round(current_score * 6 / balls_bowled, 2)
+
+    # Runs in the trailing 30-ball window: difference of the running total
+    lagged = np.r_[np.zeros(LAST_FIVE_BALLS, dtype='int64'), current_score][:len(df)]
+    lagged[position < LAST_FIVE_BALLS] = 0
+    last_five = (current_score - lagged).astype('float64')
+    last_five[position < LAST_FIVE_BALLS - 1] = np.nan
+    innings_total = np.add.reduceat(runs, first)[group] if len(df) else runs
+
+    out = pd.DataFrame({
+        'batting_team': df['batting_team'].to_numpy(),
+        'bowling_team': df['bowling_team'].to_numpy(),
+        'city': df['city'].to_numpy(),
+        'current_score': current_score,
+        'balls_left': balls_left,
+        'wickets_left': 10 - wickets,
+        'crr': crr,
+        'last_five': last_five,
+        TARGET: innings_total,
+    })
+    if keys:
+        out.insert(0, 'innings', inn)
+        out.insert(0, 'match_id', match_id)
+    out = out[~np.isnan(last_five)].reset_index(drop=True)
+    for col in CATEGORICAL:
+        out[col] = out[col].astype(object)
+    return out
+
+
+def notebook_features(df):
+    """The feature cells of Training.ipynb, kept verbatim as a parity reference."""
+    df = df.copy()
+    cities = np.where(df['city'].isnull(), df['venue'].str.split().apply(lambda x: x[0]), df['city'])
+    df['city'] = cities
+    df.drop(columns=['venue'], inplace=True)
+    eligible_cities = df['city'].value_counts()[df['city'].value_counts() > 600].index.tolist()
+    df = df[df['city'].isin(eligible_cities)]
+    df['current_score'] = df.groupby('match_id')['runs'].cumsum()
+    df['over'] = df['ball'].apply(lambda x: str(x).split(".")[0])
+    df['ball_no'] = df['ball'].apply(lambda x: str(x).split(".")[1])
+    df['balls_bowled'] = (df['over'].astype('int') * 6) + df['ball_no'].astype('int')
+    df['balls_left'] = 120 - df['balls_bowled']
+    df['balls_left'] = df['balls_left'].apply(lambda x: 0 if x < 0 else x)
+    df['player_dismissed'] = df['player_dismissed'].apply(lambda x: 0 if x == '0' else 1)
+    df['player_dismissed'] = df['player_dismissed'].astype('int')
+    df['player_dismissed'] = df.groupby('match_id')['player_dismissed'].cumsum()
+    df['wickets_left'] = 10 - df['player_dismissed']
+    df['crr'] = round((df['current_score'] * 6) / df['balls_bowled'], 2)
+    groups = df.groupby('match_id')
+    last_five = []
+    for id in df['match_id'].unique():
+        last_five.extend(groups.get_group(id).rolling(window=30)['runs'].sum().values.tolist())
+    df['last_five'] = last_five
+    final_df = df.groupby('match_id')['runs'].sum().reset_index().merge(df, on='match_id')
+    final_df = final_df[FEATURES + [TARGET]]
+    final_df.dropna(inplace=True)
+    return final_df.reset_index(drop=True)
+
+
+def check_parity(path=LEVEL2_PKL):
+    """Compare ``build_features`` with the notebook cells on ``dataset_level2.pkl``."""
+    level2 = store.load_legacy_pickle(path)
+    # The notebook's groupby/merge order is match_id order
+    level2 = level2.sort_values('match_id', kind='stable').reset_index(drop=True)
+    expected = notebook_features(level2)
+    actual = build_features(store.from_level2(level2))
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    return len(actual)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build training features from a delivery store.')
+    parser.add_argument('--check', nargs='?', const=LEVEL2_PKL, metavar='PKL',
+                        help='check parity with the notebook cells on dataset_level2.pkl')
+    parser.add_argument('--store', help='delivery store directory to build features from')
+    args = parser.parse_args()
+
+    if args.check:
+        print(f"Parity OK: {check_parity(args.check)} rows match the notebook")
+    if args.store:
+        df = build_features(store.read_store(args.store))
+        print(df.describe(include='all').T)
+
+
+if __name__ == '__main__':
+    main()
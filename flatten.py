@@ -0,0 +1,120 @@
+"""Flatten parsed Cricsheet matches into the ball-by-ball delivery table.
+
+Replaces the notebook's ``matches.iterrows()`` loop, the per-match
+``delivery_df.append`` and ``delivery_df.apply(bowl, axis=1)``. Per-delivery
+values are gathered in a single pass over all matches, per-innings values
+(match, teams, city, venue) are expanded with ``np.repeat`` and the bowling
+team is picked with one ``np.where``. Both innings are kept; super overs are
+dropped.
+
+    python flatten.py Training/deliveries   # ingest + flatten + write store
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import store
+
+INNINGS = {'1st innings': 1, '2nd innings': 2}
+
+
+def keep_match(match):
+    """The notebook's match filters: men's games scheduled for 20 overs."""
+    info = match.get('info', {})
+    return info.get('gender') == 'male' and info.get('overs') == 20
+
+
+def flatten_matches(matches, match_filter=keep_match):
+    """Return one row per delivery for every match in ``{match_id: match}``.
+
+    Columns: match_id, innings, batting_team, bowling_team, city, venue,
+    ball (the raw Cricsheet key, e.g. ``12.3``), over, ball_no, batsman,
+    bowler, runs, wicket.
+    """
+    # Per-delivery columns
+    balls, batsmen, bowlers, runs, wickets = [], [], [], [], []
+    # Per-innings columns, expanded with np.repeat at the end
+    inn_match, inn_number, inn_team, inn_team1, inn_team2, inn_city, inn_venue, inn_len = \
+        [], [], [], [], [], [], [], []
+
+    for match_id, match in matches.items():
+        if match_filter is not None and not match_filter(match):
+            continue
+        info = match['info']
+        teams = info.get('teams', [None, None])
+        for innings in match.get('innings', []):
+            for name, data in innings.items():
+                number = INNINGS.get(name)
+                deliveries = data.get('deliveries') or []
+                if number is None or not deliveries:
+                    continue
+                count = 0
+                for delivery in deliveries:
+                    for key, ball in delivery.items():
+                        balls.append(key)
+                        batsmen.append(ball['batsman'])
+                        bowlers.append(ball['bowler'])
+                        runs.append(ball['runs']['total'])
+                        wickets.append('wicket' in ball or 'wickets' in ball)
+                        count += 1
+                inn_match.append(match_id)
+                inn_number.append(number)
+                inn_team.append(data.get('team'))
+                inn_team1.append(teams[0])
+                inn_team2.append(teams[-1])
+                inn_city.append(info.get('city'))
+                inn_venue.append(info.get('venue'))
+                inn_len.append(count)
+
+    def expand(values, dtype=object):
+        return np.repeat(np.asarray(values, dtype=dtype), inn_len)
+
+    batting_team = expand(inn_team)
+    team1, team2 = expand(inn_team1), expand(inn_team2)
+    ball = np.asarray(balls, dtype='float64')
+    over, ball_no = store.split_ball(ball)
+
+    return pd.DataFrame({
+        'match_id': expand(inn_match, 'int32'),
+        'innings': expand(inn_number, 'int8'),
+        'batting_team': batting_team,
+        'bowling_team': np.where(batting_team == team1, team2, team1),
+        'city': expand(inn_city),
+        'venue': expand(inn_venue),
+        'ball': ball,
+        'over': over,
+        'ball_no': ball_no,
+        'batsman': np.asarray(batsmen, dtype=object),
+        'bowler': np.asarray(bowlers, dtype=object),
+        'runs': np.asarray(runs, dtype='int16'),
+        'wicket': np.asarray(wickets, dtype=bool),
+    })
+
+
+def to_store_frame(deliveries):
+    """Rename the flattened columns to ``store.DELIVERY_SCHEMA``."""
+    return deliveries.drop(columns=['ball']).rename(columns={'ball_no': 'ball'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flatten the YAML matches into a columnar delivery store.')
+    parser.add_argument('root', help='output store directory')
+    parser.add_argument('--data-dir', default=ingest.DATA_DIR)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    matches = ingest.load_matches(args.data_dir, workers=args.workers)
+    loaded = time.perf_counter()
+    deliveries = flatten_matches(matches)
+    flattened = time.perf_counter()
+    meta = store.write_store(to_store_frame(deliveries), args.root)
+    print(f"ingest {loaded - start:.2f}s, flatten {flattened - loaded:.2f}s, "
+          f"{meta['rows']} deliveries from {deliveries['match_id'].nunique()} matches -> {args.root}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""Prediction history shared by all app sessions, in SQLite (WAL mode).
+
+Replaces history.json, which every prediction rewrote whole, so concurrent
+sessions clobbered each other's entries. Here each prediction is one INSERT
+into an append-only table: writers never rewrite earlier rows, WAL lets
+readers run alongside a writer, and every thread gets its own connection.
+
+Reads are keyset-paginated (``page(..., before=id)``) over a per-session view
+or the global one; ``fixture`` looks predictions up by teams, city and time.
+"Clear" hides a session's earlier rows from its own view and deletes nothing.
+
+    python history.py migrate history.json   # import an old JSON history
+    python history.py bench --threads 8      # concurrent writers, then counts
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(ROOT, 'history.db')
+LEGACY_JSON = os.path.join(ROOT, 'history.json')
+
+FIELDS = ['batting_team', 'bowling_team', 'city', 'current_score', 'overs', 'wickets', 'last_five',
+          'predicted_score']
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    created REAL NOT NULL,
+    batting_team TEXT NOT NULL,
+    bowling_team TEXT NOT NULL,
+    city TEXT NOT NULL,
+    current_score INTEGER NOT NULL,
+    overs REAL NOT NULL,
+    wickets INTEGER NOT NULL,
+    last_five INTEGER NOT NULL,
+    predicted_score INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS predictions_session ON predictions (session, id);
+CREATE INDEX IF NOT EXISTS predictions_fixture ON predictions (batting_team, bowling_team, city, created);
+CREATE INDEX IF NOT EXISTS predictions_created ON predictions (created);
+CREATE TABLE IF NOT EXISTS cleared (session TEXT PRIMARY KEY, last_id INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _item(row):
+    item = dict(row)
+    item['timestamp'] = time.strftime('%H:%M:%S', time.localtime(item['created']))
+    return item
+
+
+class History:
+    """Thread-safe handle on the history database; share one per process."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.local = threading.local()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            # Autocommit: every single-statement write is its own atomic transaction
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def add(self, session, item, created=None):
+        """Append one prediction (a dict over ``FIELDS``); returns its id."""
+        cursor = self.connection().execute(
+            f"INSERT INTO predictions (session, created, {', '.join(FIELDS)}) "
+            f"VALUES (?, ?, {', '.join('?' * len(FIELDS))})",
+            [session, time.time() if created is None else created] + [item[k] for k in FIELDS])
+        return cursor.lastrowid
+
+    def get(self, id):
+        row = self.connection().execute('SELECT * FROM predictions WHERE id = ?', (id,)).fetchone()
+        return _item(row) if row is not None else None
+
+    def page(self, session=None, limit=10, before=None):
+        """Newest-first page of a session's view (or the global one with ``session=None``).
+
+        Returns ``(items, cursor)``; pass ``cursor`` as ``before`` for the next
+        page. It is None on the last page.
+        """
+        where, params = ['id < ?'], [before if before is not None else 2 ** 63 - 1]
+        if session is not None:
+            where += ['session = ?', 'id > COALESCE((SELECT last_id FROM cleared WHERE session = ?), 0)']
+            params += [session, session]
+        rows = self.connection().execute(
+            f"SELECT * FROM predictions WHERE {' AND '.join(where)} ORDER BY id DESC LIMIT ?",
+            params + [limit + 1]).fetchall()
+        items = [_item(row) for row in rows[:limit]]
+        return items, (items[-1]['id'] if len(rows) > limit else None)
+
+    def fixture(self, batting_team, bowling_team, city, since=None, limit=50):
+        """Newest predictions for one fixture, optionally only those after ``since`` (epoch seconds)."""
+        rows = self.connection().execute(
+            "SELECT * FROM predictions WHERE batting_team = ? AND bowling_team = ? AND city = ? "
+            "AND created >= ? ORDER BY created DESC LIMIT ?",
+            (batting_team, bowling_team, city, since or 0, limit)).fetchall()
+        return [_item(row) for row in rows]
+
+    def count(self, session=None):
+        if session is None:
+            return self.connection().execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+        return self.connection().execute(
+            "SELECT COUNT(*) FROM predictions WHERE session = ? "
+            "AND id > COALESCE((SELECT last_id FROM cleared WHERE session = ?), 0)",
+            (session, session)).fetchone()[0]
+
+    def clear(self, session):
+        """Hide the session's predictions so far from its own view."""
+        self.connection().execute(
+            "INSERT INTO cleared (session, last_id) VALUES (?, (SELECT COALESCE(MAX(id), 0) FROM predictions)) "
+            "ON CONFLICT (session) DO UPDATE SET last_id = excluded.last_id", (session,))
+
+    def migrate_json(self, path=LEGACY_JSON, session='legacy'):
+        """Import a history.json list once (newest first, as the apps wrote it)."""
+        if not os.path.exists(path):
+            return 0
+        db = self.connection()
+        key = f'migrated:{os.path.abspath(path)}'
+        if db.execute('SELECT 1 FROM meta WHERE key = ?', (key,)).fetchone():
+            return 0
+        try:
+            with open(path, 'r') as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            items = []
+        # The JSON only kept a time of day, so order the rows before the file's mtime
+        mtime = os.path.getmtime(path)
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            # Checked again under the write lock: another process may have migrated meanwhile
+            if db.execute('SELECT 1 FROM meta WHERE key = ?', (key,)).fetchone():
+                db.execute('ROLLBACK')
+                return 0
+            for age, item in reversed(list(enumerate(items))):
+                self.add(session, item, created=mtime - age)
+            db.execute('INSERT INTO meta (key, value) VALUES (?, ?)', (key, str(len(items))))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return len(items)
+
+
+def bench(path, threads=8, per_thread=500):
+    """Concurrent appends from many threads; returns (seconds, rows written, rows found)."""
+    history = History(path)
+    before = history.count()
+    item = {'batting_team': 'India', 'bowling_team': 'Australia', 'city': 'Mumbai', 'current_score': 50,
+            'overs': 8.0, 'wickets': 2, 'last_five': 35, 'predicted_score': 151}
+
+    def write(n):
+        for _ in range(per_thread):
+            history.add(f'bench-{n}', item)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=write, args=(n,)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - start, threads * per_thread, history.count() - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prediction history database tools.')
+    parser.add_argument('command', choices=['migrate', 'bench'])
+    parser.add_argument('json', nargs='?', default=LEGACY_JSON)
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=500, help='rows per thread for bench')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        print(f"Imported {History(args.db).migrate_json(args.json)} predictions from {args.json}")
+        return
+    seconds, written, found = bench(args.db, args.threads, args.rows)
+    print(f"{written} appends from {args.threads} threads in {seconds:.2f}s "
+          f"({written / seconds:.0f}/s), {found} rows found")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Parallel, cached loader for the Cricsheet YAML match files.
+
+Replaces the serial ``safe_load`` + ``DataFrame.append`` loop from
+Training/Training.ipynb. Files are parsed with the libyaml C loader when it
+is available, in a process pool, and every parsed match is cached on disk
+keyed by its path, mtime and content hash so that a re-run only parses the
+files that are new or changed.
+
+    python ingest.py                     # parse / refresh Dataset/t20s
+    python ingest.py --workers 8 --no-cache
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(ROOT, 'Dataset', 't20s')
+CACHE_DIR = os.path.join(ROOT, '.cache', 'matches')
+INDEX_FILE = 'index.json'
+
+
+def match_files(data_dir=DATA_DIR):
+    """Return ``{match_id: path}`` for every YAML file, ordered by match id.
+
+    The match id is the Cricsheet file id (``1001349.yaml`` -> ``1001349``),
+    so it does not depend on ``os.listdir`` ordering.
+    """
+    files = {}
+    for name in os.listdir(data_dir):
+        stem, ext = os.path.splitext(name)
+        if ext in ('.yaml', '.yml') and stem.isdigit():
+            files[int(stem)] = os.path.join(data_dir, name)
+    return dict(sorted(files.items()))
+
+
+def _file_digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _cache_path(cache_dir, match_id):
+    return os.path.join(cache_dir, f'{match_id}.pkl')
+
+
+def load_manifest(path):
+    """Read a ``{match_id: file entry}`` manifest; missing or corrupt -> ``{}``."""
+    try:
+        with open(path, 'r') as f:
+            return {int(k): v for k, v in json.load(f).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, entries):
+    # Write to a temp file first so an interrupted run never leaves a
+    # truncated manifest behind
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({str(k): v for k, v in sorted(entries.items())}, f)
+    os.replace(tmp, path)
+
+
+def file_entry(path, st=None, digest=None):
+    """Manifest entry for a match file: path, mtime, size and SHA-1."""
+    st = st or os.stat(path)
+    if digest is None:
+        with open(path, 'rb') as f:
+            digest = _file_digest(f.read())
+    return {'path': path, 'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'sha1': digest}
+
+
+def file_unchanged(entry, path, st=None):
+    """True if ``path`` still matches its manifest ``entry``.
+
+    Same path, mtime and size is trusted as is; otherwise (e.g. after a fresh
+    checkout) the content hash decides, and ``entry`` is refreshed in place.
+    """
+    if entry is None:
+        return False
+    st = st or os.stat(path)
+    if entry['path'] == path and entry['mtime_ns'] == st.st_mtime_ns and entry['size'] == st.st_size:
+        return True
+    with open(path, 'rb') as f:
+        if _file_digest(f.read()) != entry['sha1']:
+            return False
+    entry.update(path=path, mtime_ns=st.st_mtime_ns, size=st.st_size)
+    return True
+
+
+def _parse_file(args):
+    # Runs in a worker process: parse one YAML file and write its cache entry
+    match_id, path, cache_dir = args
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = _file_digest(data)
+    try:
+        match = yaml.load(data, Loader=SafeLoader)
+    except (yaml.YAMLError, UnicodeDecodeError) as e:
+        return match_id, digest, None, f'{type(e).__name__}: {e}'
+    if cache_dir is not None:
+        tmp = _cache_path(cache_dir, match_id) + f'.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(match, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, _cache_path(cache_dir, match_id))
+    return match_id, digest, match, None
+
+
+def load_matches(data_dir=DATA_DIR, cache_dir=CACHE_DIR, workers=None, match_ids=None, verbose=False):
+    """Parse every match file in ``data_dir`` and return ``{match_id: match}``.
+
+    ``match`` is the dict ``yaml.safe_load`` would return for the file. Files
+    whose cache entry is still valid are read from ``cache_dir`` instead of
+    being re-parsed; pass ``cache_dir=None`` to disable the cache. Files that
+    cannot be decoded are skipped, like the notebook did. ``match_ids``
+    restricts loading to a subset of the files.
+    """
+    files = match_files(data_dir)
+    if match_ids is not None:
+        wanted = set(match_ids)
+        files = {k: v for k, v in files.items() if k in wanted}
+    index = {}
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        index = load_manifest(os.path.join(cache_dir, INDEX_FILE))
+
+    matches = {}
+    stale = []
+    for match_id, path in files.items():
+        st = os.stat(path)
+        cached = cache_dir is not None and os.path.exists(_cache_path(cache_dir, match_id))
+        if cached and file_unchanged(index.get(match_id), path, st):
+            with open(_cache_path(cache_dir, match_id), 'rb') as f:
+                matches[match_id] = pickle.load(f)
+        else:
+            stale.append((match_id, path, cache_dir))
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(stale) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_parse_file, stale, chunksize=max(1, len(stale) // (workers * 4))))
+    else:
+        results = [_parse_file(args) for args in stale]
+
+    for match_id, digest, match, error in results:
+        if error is not None:
+            print(f"Error processing {files[match_id]}. Skipping. ({error})")
+            index.pop(match_id, None)
+            continue
+        matches[match_id] = match
+        index[match_id] = file_entry(files[match_id], digest=digest)
+
+    if cache_dir is not None:
+        save_manifest(os.path.join(cache_dir, INDEX_FILE), index)
+    if verbose:
+        print(f"{len(files)} files: {len(files) - len(stale)} cached, {len(stale)} parsed")
+    return {k: matches[k] for k in sorted(matches)}
+
+
+def load_match_frame(data_dir=DATA_DIR, cache_dir=CACHE_DIR, workers=None):
+    """Return the notebook's ``final_df``: one ``json_normalize``-d row per match.
+
+    Built with a single ``json_normalize`` call instead of appending one
+    frame per file. ``match_id`` holds the Cricsheet file id.
+    """
+    import pandas as pd
+
+    matches = load_matches(data_dir, cache_dir, workers)
+    df = pd.json_normalize(list(matches.values()))
+    df['match_id'] = list(matches.keys())
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse and cache the Cricsheet YAML match files.')
+    parser.add_argument('data_dir', nargs='?', default=DATA_DIR)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true', help='parse every file, ignore the cache')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    matches = load_matches(args.data_dir, None if args.no_cache else args.cache_dir,
+                           args.workers, verbose=True)
+    print(f"Loaded {len(matches)} matches in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Calibrated P10/P90 prediction intervals (split conformal, per over bucket).
+
+The point model's error depends mostly on how much of the innings is left,
+so the interval is the point prediction plus two residual quantiles looked up
+by the over being bowled. The quantiles come from matches the model has not
+seen: a copy of the pipeline is refit on 80% of the matches (grouped by
+match_id, since rows of one innings are near-duplicates) and its signed
+residuals on the other 20% are taken per over with the conformal rank
+correction. Coverage is checked by calibrating on half of those matches and
+counting hits on the other half.
+
+``calibrate`` stores ``interval_levels`` and ``interval_offsets`` in the
+model bundle; ``fastpath.FastPredictor`` picks them up, and the bounds are a
+table lookup and an add on the point predictions, done in the same call.
+
+    python intervals.py calibrate           # refit, calibrate, add to Model/bundle
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from schema import BALLS_PER_INNINGS, FEATURES, LAST_FIVE_BALLS, TARGET
+
+LEVELS = (0.1, 0.9)
+FIRST_OVER = LAST_FIVE_BALLS // 6
+BUCKETS = BALLS_PER_INNINGS // 6 - FIRST_OVER
+# Buckets with fewer calibration rows use the residuals of all overs
+MIN_BUCKET_ROWS = 50
+
+
+def over_bucket(balls_left):
+    """Bucket of the over being bowled: 0 for the 6th over (or earlier) up to the 20th."""
+    overs = (BALLS_PER_INNINGS - np.asarray(balls_left, dtype='int64')) // 6
+    return np.clip(overs, FIRST_OVER, FIRST_OVER + BUCKETS - 1) - FIRST_OVER
+
+
+def conformal_quantile(residuals, level):
+    """Order statistic of ``residuals`` with the split-conformal rank correction."""
+    r = np.sort(residuals)
+    n = len(r)
+    if level >= 0.5:
+        rank = min(math.ceil(level * (n + 1)), n)
+    else:
+        rank = max(math.floor(level * (n + 1)), 1)
+    return r[rank - 1]
+
+
+def conformal_offsets(residuals, buckets, levels=LEVELS):
+    """``(BUCKETS, len(levels))`` residual quantiles (actual minus predicted)."""
+    residuals = np.asarray(residuals, dtype='float64')
+    offsets = np.empty((BUCKETS, len(levels)), dtype='float32')
+    for b in range(BUCKETS):
+        r = residuals[buckets == b]
+        if len(r) < MIN_BUCKET_ROWS:
+            r = residuals
+        offsets[b] = [conformal_quantile(r, level) for level in levels]
+    return offsets
+
+
+class Intervals:
+    def __init__(self, levels, offsets):
+        self.levels = tuple(float(level) for level in levels)
+        self.offsets = np.asarray(offsets, dtype='float32')
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """The intervals stored with a bundle's arrays, or None for an uncalibrated one."""
+        if 'interval_offsets' not in arrays:
+            return None
+        return cls(arrays['interval_levels'], arrays['interval_offsets'])
+
+    def arrays(self):
+        return {'interval_levels': np.asarray(self.levels, dtype='float64'), 'interval_offsets': self.offsets}
+
+    def bounds(self, predicted, balls_left, current_score=None):
+        """``(low, high)`` arrays around ``predicted`` (float32, like the point predictions).
+
+        With ``current_score`` the low bound is raised to it: runs already
+        scored cannot be lost, and the clip only adds coverage.
+        """
+        offsets = self.offsets[over_bucket(balls_left)]
+        predicted = np.asarray(predicted, dtype='float32')
+        low = predicted + offsets[:, 0]
+        if current_score is not None:
+            low = np.maximum(low, np.asarray(current_score, dtype='float32'))
+        return low, predicted + offsets[:, -1]
+
+
+def calibration_residuals(pipe, held_out=0.2, seed=1, fit=None):
+    """Refit a clone of ``pipe`` without ``held_out`` of the matches; residuals on those.
+
+    ``fit(X, y, groups)`` returns the refit model, for pipelines that
+    ``clone().fit`` cannot retrain (early stopping needs a validation set of
+    whole matches, taken from the match ids in ``groups``). Returns
+    ``(residuals, balls_left, match_ids)`` for the held-out rows.
+    """
+    from sklearn.base import clone
+    from sklearn.model_selection import GroupShuffleSplit
+
+    import features
+    import store
+    df = features.build_features(store.from_level2(store.load_legacy_pickle(features.LEVEL2_PKL)), keys=True)
+    X, y, groups = df[FEATURES], df[TARGET], df['match_id'].to_numpy()
+    rows, held = next(GroupShuffleSplit(n_splits=1, test_size=held_out, random_state=seed).split(X, y, groups))
+    fit = fit or (lambda X, y, groups: clone(pipe).fit(X, y))
+    model = fit(X.iloc[rows], y.iloc[rows], groups[rows])
+    residuals = y.iloc[held].to_numpy() - model.predict(X.iloc[held])
+    return residuals, X['balls_left'].iloc[held].to_numpy(), groups[held]
+
+
+def coverage(residuals, buckets, match_ids, levels=LEVELS, seed=1):
+    """Calibrate on half of the matches, return the share of the rest inside the interval."""
+    matches = np.unique(match_ids)
+    first = np.isin(match_ids, np.random.default_rng(seed).permutation(matches)[:len(matches) // 2])
+    offsets = conformal_offsets(residuals[first], buckets[first], levels)
+    lower, upper = offsets[buckets[~first], 0], offsets[buckets[~first], -1]
+    rest = residuals[~first]
+    return float(((rest >= lower) & (rest <= upper)).mean())
+
+
+def calibrate(pipe, levels=LEVELS, held_out=0.2, seed=1, fit=None):
+    """``(Intervals, report)`` for ``pipe``, from residuals on unseen matches."""
+    residuals, balls_left, match_ids = calibration_residuals(pipe, held_out, seed, fit)
+    buckets = over_bucket(balls_left)
+    intervals = Intervals(levels, conformal_offsets(residuals, buckets, levels))
+    report = {'levels': list(intervals.levels), 'method': 'split conformal per over, grouped by match',
+              'calibration_rows': int(len(residuals)), 'calibration_matches': int(len(np.unique(match_ids))),
+              'coverage': round(coverage(residuals, buckets, match_ids, levels, seed), 4),
+              'mean_width': round(float((intervals.offsets[buckets, -1] - intervals.offsets[buckets, 0]).mean()), 2)}
+    return intervals, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate prediction intervals into the model bundle.')
+    parser.add_argument('command', choices=['calibrate'])
+    parser.add_argument('--model', default=None, help='pipeline to refit (default Model/pipe.pkl)')
+    parser.add_argument('--bundle', default=None, help='bundle to update (default Model/bundle)')
+    parser.add_argument('--held-out', type=float, default=0.2, help='share of matches used for calibration')
+    args = parser.parse_args()
+
+    import bundle
+    import predict
+    start = time.perf_counter()
+    intervals, report = calibrate(predict.load_model(args.model or predict.MODEL_PATH), held_out=args.held_out)
+    bundle.add_arrays(args.bundle or bundle.BUNDLE_PATH, intervals.arrays(), intervals=report)
+    print(f"Calibrated on {report['calibration_rows']} rows of {report['calibration_matches']} unseen matches "
+          f"in {time.perf_counter() - start:.0f}s: P{LEVELS[0] * 100:.0f}-P{LEVELS[1] * 100:.0f} coverage "
+          f"{report['coverage']:.1%} (target {LEVELS[1] - LEVELS[0]:.0%}), mean width {report['mean_width']:.1f} runs")
+    for b, (low, high) in enumerate(intervals.offsets):
+        print(f"  over {FIRST_OVER + b + 1:>2}: {low:+6.1f} / {high:+6.1f}")
+
+
+if __name__ == '__main__':
+    main()
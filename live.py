@@ -0,0 +1,290 @@
+"""Live-match mode: ball-by-ball events in, one projection per delivery out.
+
+Events are JSON lines. A delivery is the Cricsheet YAML delivery mapping,
+optionally tagged with the match it belongs to; a header line starts (or
+restarts) an innings, and may give its number (default 1)::
+
+    {"match": "AUSvSL", "batting_team": "Australia", "bowling_team": "Sri Lanka", "city": "Melbourne"}
+    {"match": "AUSvSL", "0.1": {"batsman": "AJ Finch", "bowler": "SL Malinga", "runs": {"total": 0}}}
+    {"match": "AUSvSL", "0.2": {"batsman": "AJ Finch", "bowler": "SL Malinga", "runs": {"total": 4},
+                                "wicket": {"kind": "bowled", "player_out": "AJ Finch"}}}
+
+``LiveInnings`` keeps the running state with O(1) work per ball (a 30-ball
+ring buffer and its running sum give last_five). From the 30th delivery on,
+every delivery emits a JSON line with the state and projected score. All
+deliveries read in one pass of the event loop, across every tracked match,
+are scored with a single model call; a match whose header names a team or
+city the model does not know is skipped with a note on stderr. Scored
+states go to the audit log; a match tag that is a Cricsheet match id lets
+``audit.py backfill`` score them against the final total once the match is
+ingested.
+
+    python live.py --fixture "Australia,Sri Lanka,Melbourne" < events.jsonl
+    python live.py --file events.jsonl --follow
+    python live.py --listen 127.0.0.1:9000        # many feeders, one line per event
+    python live.py --check                        # replayed states equal features.py
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import stat
+import sys
+import time
+from collections import deque
+
+import audit
+from schema import BALLS_PER_INNINGS, FEATURES, LAST_FIVE_BALLS
+
+HEADER = ('batting_team', 'bowling_team', 'city')
+
+
+def split_key(key):
+    """Over and ball of a delivery key, read as ``store.split_ball`` does."""
+    ball = float(key)
+    over = math.floor(ball)
+    frac = round((ball - over) * 100)
+    return over, frac // 10 if frac % 10 == 0 else frac
+
+
+class LiveInnings:
+    """Running state of one innings, updated in O(1) per delivery."""
+
+    def __init__(self, batting_team, bowling_team, city, window=LAST_FIVE_BALLS):
+        self.batting_team = batting_team
+        self.bowling_team = bowling_team
+        self.city = city
+        self.score = 0
+        self.wickets = 0
+        self.balls_bowled = 0
+        self.deliveries = 0
+        self.recent = deque(maxlen=window)
+        self.last_five = 0
+
+    def add(self, key, runs, wicket):
+        over, ball = split_key(key)
+        if len(self.recent) == self.recent.maxlen:
+            self.last_five -= self.recent[0]
+        self.recent.append(runs)
+        self.last_five += runs
+        self.score += runs
+        self.wickets += bool(wicket)
+        self.balls_bowled = over * 6 + ball
+        self.deliveries += 1
+
+    @property
+    def ready(self):
+        # Like the training table: no projection before a full 30-ball window
+        return self.deliveries >= self.recent.maxlen
+
+    def state(self):
+        """The model features for the current state (see ``schema.FEATURES``)."""
+        return {
+            'batting_team': self.batting_team,
+            'bowling_team': self.bowling_team,
+            'city': self.city,
+            'current_score': self.score,
+            'balls_left': max(BALLS_PER_INNINGS - self.balls_bowled, 0),
+            'wickets_left': 10 - self.wickets,
+            # Rounded as np.round does (scale, round half to even, unscale)
+            'crr': round(self.score * 6 / self.balls_bowled * 100) / 100 if self.balls_bowled else 0.0,
+            'last_five': self.last_five,
+        }
+
+
+class LiveTracker:
+    """Tracks many innings and scores their new deliveries in batches."""
+
+    def __init__(self, model, fixture=None, out=sys.stdout, audit=None):
+        self.model = model
+        self.out = out
+        self.audit = audit
+        self.innings = {}
+        self.numbers = {}
+        self.pending = []
+        # Matches whose header names a team or city the model has no code for
+        self.skipped = set()
+        if fixture:
+            unknown = self.unknown(dict(zip(HEADER, fixture)))
+            if unknown:
+                raise ValueError(f"Fixture not in the model: {', '.join(unknown)}")
+            self.innings[None] = LiveInnings(*fixture)
+
+    def unknown(self, header):
+        """The header's teams and city that are not in the model's vocabulary."""
+        categories = self.model.categories
+        return [f'{col} {header[col]!r}' for col in HEADER if header[col] not in categories[col]]
+
+    def handle(self, event):
+        match = event.pop('match', None)
+        if all(k in event for k in HEADER):
+            unknown = self.unknown(event)
+            if unknown:
+                # Checked here, so one bad fixture never reaches a shared batch
+                self.innings.pop(match, None)
+                self.skipped.add(match)
+                print(f"No projections for match {match!r}: {', '.join(unknown)} not in the model", file=sys.stderr)
+                return
+            self.skipped.discard(match)
+            self.innings[match] = LiveInnings(*(event[k] for k in HEADER))
+            self.numbers[match] = int(event.get('innings', 1))
+            return
+        if match in self.skipped:
+            return
+        innings = self.innings.get(match)
+        if innings is None:
+            raise ValueError(f"Delivery for unknown match {match!r}; send a header line first")
+        for key, ball in event.items():
+            innings.add(key, ball['runs']['total'], 'wicket' in ball or 'wickets' in ball)
+            if innings.ready:
+                self.pending.append((match, key, innings.state(), self.numbers.get(match, 1)))
+
+    def flush(self):
+        """Score every pending delivery in one call and write the projections."""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        columns = {col: [state[col] for _, _, state, _ in pending] for col in FEATURES}
+        start = time.perf_counter()
+        scores = self.model.predict(columns, check=False)
+        if self.audit is not None:
+            self.audit.record(columns, scores.astype('int64'), time.perf_counter() - start, self.model.version,
+                              [audit.match_key(match) for match, _, _, _ in pending],
+                              [number for _, _, _, number in pending])
+        lines = []
+        for (match, key, state, _), score in zip(pending, scores):
+            line = {'match': match, 'ball': key, **{k: state[k] for k in FEATURES[3:]},
+                    'projected_score': int(score)}
+            lines.append(json.dumps(line))
+        self.out.write('\n'.join(lines) + '\n')
+        self.out.flush()
+
+
+async def consume(reader, tracker, flush):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        feed(line, tracker, flush)
+
+
+def feed(line, tracker, flush):
+    line = line.strip()
+    if not line:
+        return
+    try:
+        tracker.handle(json.loads(line))
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Skipped event {line[:80]!r}: {e}", file=sys.stderr)
+        return
+    # Deliveries read before the loop gets back to this callback share one model call
+    flush()
+
+
+async def tail(f, tracker, flush, follow, interval=0.2):
+    # Regular files never block, so poll them for growth instead
+    partial = b''
+    while True:
+        chunk = f.readline()
+        if chunk.endswith(b'\n'):
+            feed(partial + chunk, tracker, flush)
+            partial = b''
+        elif not follow and not chunk:
+            feed(partial, tracker, flush)
+            return
+        else:
+            partial += chunk
+            await asyncio.sleep(interval)
+
+
+async def run(tracker, source, follow=False):
+    loop = asyncio.get_running_loop()
+    scheduled = []
+
+    def flush():
+        if not scheduled:
+            scheduled.append(loop.call_soon(flush_now))
+
+    def flush_now():
+        scheduled.clear()
+        tracker.flush()
+
+    if source.get('listen'):
+        host, port = source['listen'].rsplit(':', 1)
+        server = await asyncio.start_server(lambda r, w: consume(r, tracker, flush), host, int(port))
+        async with server:
+            await server.serve_forever()
+    elif source.get('file'):
+        with open(source['file'], 'rb') as f:
+            await tail(f, tracker, flush, follow)
+    elif stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode):
+        await tail(sys.stdin.buffer, tracker, flush, follow)
+    else:
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        await consume(reader, tracker, flush)
+    await asyncio.sleep(0)
+    tracker.flush()
+
+
+def check():
+    """Replay every innings through ``LiveInnings`` and compare with ``build_features``."""
+    import numpy as np
+
+    import features
+    import flatten
+    import ingest
+
+    deliveries = flatten.to_store_frame(flatten.flatten_matches(ingest.load_matches()))
+    expected = features.build_features(deliveries, min_city_deliveries=None, innings=(1, 2), keys=True)
+    deliveries = deliveries.assign(city=features.fill_city(deliveries).to_numpy())
+    keys = set(zip(expected['match_id'], expected['innings']))
+    states = []
+    for (match_id, innings), rows in deliveries.groupby(['match_id', 'innings'], sort=True):
+        if (match_id, innings) not in keys:
+            continue
+        first = rows.iloc[0]
+        live = LiveInnings(first['batting_team'], first['bowling_team'], first['city'])
+        for over, ball, runs, wicket in zip(rows['over'], rows['ball'], rows['runs'], rows['wicket']):
+            live.add(f'{over}.{ball}', int(runs), wicket)
+            if live.ready:
+                states.append(live.state())
+    for col in FEATURES:
+        actual = np.asarray([s[col] for s in states])
+        if not (actual == expected[col].to_numpy()).all():
+            raise AssertionError(f"{col} differs from features.build_features")
+    return len(states)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Project final scores live from ball-by-ball events.')
+    parser.add_argument('--fixture', help='"Batting,Bowling,City" for events without a match header')
+    parser.add_argument('--file', help='read events from a file instead of stdin')
+    parser.add_argument('--follow', action='store_true', help='keep reading as the file grows')
+    parser.add_argument('--listen', metavar='HOST:PORT', help='accept event streams on a TCP socket')
+    parser.add_argument('--model', default=None, help='bundle directory, .npz or pipe.pkl')
+    parser.add_argument('--audit-dir', default=audit.AUDIT_ROOT)
+    parser.add_argument('--no-audit', action='store_true', help='do not record scored states')
+    parser.add_argument('--check', action='store_true', help='check replayed states against features.py')
+    args = parser.parse_args()
+
+    if args.check:
+        print(f"Parity OK: {check()} live states equal the training features")
+        return
+
+    import bundle
+    fixture = tuple(part.strip() for part in args.fixture.split(',')) if args.fixture else None
+    log = None if args.no_audit else audit.AuditLog(args.audit_dir, source='live')
+    try:
+        tracker = LiveTracker(bundle.load_predictor(args.model), fixture, audit=log)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        asyncio.run(run(tracker, {'listen': args.listen, 'file': args.file}, args.follow))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Local load test for service.py.
+
+Opens ``--concurrency`` keep-alive connections and sends random match states
+to ``/predict`` at a fixed total rate (or as fast as possible with
+``--rate 0``), then reports throughput and latency percentiles.
+
+    python service.py &
+    python loadtest.py --rate 300 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from schema import CITIES, TEAMS
+
+
+def random_state():
+    batting, bowling = random.sample(TEAMS, 2)
+    overs = round(random.uniform(5, 19.5), 1)
+    return {'batting_team': batting, 'bowling_team': bowling, 'city': random.choice(CITIES),
+            'current_score': int(overs * random.uniform(5, 10)), 'overs': overs,
+            'wickets': random.randint(0, 8), 'last_five': random.randint(20, 70)}
+
+
+async def client(host, port, interval, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    # Random phase so the clients do not fire in lock-step bursts
+    next_send = time.perf_counter() + random.uniform(0, interval)
+    try:
+        while time.perf_counter() < deadline:
+            if interval:
+                next_send += interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            body = json.dumps(random_state()).encode()
+            start = time.perf_counter()
+            writer.write(f"POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            status = (await reader.readline()).split()[1]
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status != b'200':
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def run(host, port, concurrency, rate, duration):
+    latencies, errors = [], []
+    interval = concurrency / rate if rate else 0
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, interval, start + duration, latencies, errors)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    if not latencies:
+        print('No requests completed')
+        return
+    print(f"{len(latencies)} requests in {elapsed:.1f}s ({len(latencies) / elapsed:.0f} req/s), {len(errors)} errors")
+    print('latency ms: ' + '  '.join(f"p{q}={percentile(latencies, q) * 1000:.2f}" for q in (50, 90, 99, 99.9))
+          + f"  max={max(latencies) * 1000:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the prediction service.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--rate', type=float, default=300, help='total requests/second, 0 = unthrottled')
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.host, args.port, args.concurrency, args.rate, args.duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""Out-of-core training on the delivery store, a few hundred matches at a time.
+
+``train.py`` holds the parsed matches, the delivery frame and the training
+table in memory together, so its peak RSS grows with every season added.
+Here nothing larger than one chunk of whole matches (``CHUNK_MATCHES``) is
+materialized:
+
+    scan       one pass over six columns of the store (``refresh.py``'s
+               Training/data/deliveries): deliveries per city, and the
+               first-innings deliveries and city of every match
+    matrix     the training and validation matches, each chunk turned into
+               features (``features.build_features``) and encoded, feed
+               external-memory DMatrix pages cached under .cache/outofcore
+    fit        hist trees with ``train.NATIVE_PARAMS``, early stopping on
+               the validation matches
+    evaluate   R2 / MAE summed over the held-out matches, chunk by chunk
+    export     Model/pipe.pkl and Model/bundle, as ``train.py`` writes them,
+               unless the test R2 is below ``MIN_R2``
+
+Features only look back within an innings, so building them per chunk of
+whole matches gives the same rows as building them at once. The scan tells
+which matches have training rows, so the test and validation matches are
+the ones ``train.py --split group --mode native`` picks on the same store;
+``--check`` trains that in-memory model too and compares the metrics.
+
+XGBoost 1.7 mistrains categorical features from external-memory pages
+(the first round starts at an RMSE of thousands of runs), so the
+OrdinalEncoder codes go in as numeric features: trees split on code ranges
+instead of category sets. The fast path and the bundle compile such
+boosters unchanged. Each stage prints its wall time and peak RSS.
+
+    python refresh.py && python outofcore.py
+    python outofcore.py --refresh --chunk-matches 100 --out /tmp/ooc
+    python outofcore.py --check --out ''           # parity with train.py
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+import cv
+import features
+import ingest
+import refresh
+import store
+import train
+from schema import FEATURES, LAST_FIVE_BALLS, MIN_CITY_DELIVERIES, TARGET, TEAMS
+
+CACHE_DIR = os.path.join(ingest.ROOT, '.cache', 'outofcore')
+CHUNK_MATCHES = 200
+SCAN_COLUMNS = ['match_id', 'batting_team', 'bowling_team', 'innings', 'city', 'venue']
+# Codes as numeric features, see the module docstring
+CODE_FEATURES = {'enable_categorical': False, 'feature_types': ['q'] * len(FEATURES)}
+# A test R2 below this is a broken fit, not a weak model: grouped CV gives 0.3-0.45
+MIN_R2 = 0.2
+# Largest differences from train.py --split group --mode native accepted by --check
+PARITY_MAE = 1.0
+PARITY_R2 = 0.05
+
+
+def scan(root, chunk_matches=CHUNK_MATCHES):
+    """``(city counts, matches)`` over the whole store, chunk by chunk.
+
+    The counts are ``features.city_counts``; ``matches`` has the filled
+    city and the number of first-innings deliveries (between two ``TEAMS``)
+    of every match.
+    """
+    import pandas as pd
+
+    counts, matches = pd.Series(dtype='int64'), []
+    for part in store.iter_chunks(root, chunk_matches, SCAN_COLUMNS):
+        chosen = part['batting_team'].isin(TEAMS) & part['bowling_team'].isin(TEAMS) & (part['innings'] == 1)
+        part = part.loc[chosen.to_numpy()]
+        city = features.fill_city(part)
+        counts = counts.add(city.value_counts(), fill_value=0)
+        frame = pd.DataFrame({'match_id': part['match_id'].to_numpy(), 'city': city.to_numpy()})
+        matches.append(frame.groupby('match_id')['city'].agg(['first', 'size']))
+    matches = pd.concat(matches) if matches else pd.DataFrame(columns=['first', 'size'])
+    return counts.astype('int64'), matches.rename(columns={'first': 'city', 'size': 'deliveries'})
+
+
+def training_matches(matches, cities):
+    """Sorted ids of the matches ``features.build_features`` keeps rows for.
+
+    Rows start at the innings' 30th ball, once the last-five-overs window
+    is complete.
+    """
+    kept = (matches['deliveries'] >= LAST_FIVE_BALLS) & matches['city'].isin(cities)
+    return np.sort(matches.index[kept.to_numpy()].to_numpy())
+
+
+def feature_chunks(root, cities, match_ids, chunk_matches=CHUNK_MATCHES):
+    """Training rows of ``match_ids`` in ``cities``, one DataFrame per chunk."""
+    for part in store.iter_chunks(root, chunk_matches, match_ids=match_ids):
+        table = features.build_features(part, min_city_deliveries=None)
+        table = table[table['city'].isin(cities).to_numpy()]
+        if len(table):
+            yield table
+
+
+def split_matches(match_ids, test_size=train.TEST_SIZE, validation_size=train.VALIDATION_SIZE,
+                  seed=train.RANDOM_STATE):
+    """``(fit, validation, test)`` match ids; each match lands in exactly one.
+
+    Given the sorted ids of the matches with training rows, these are the
+    matches ``train.split(by='group')`` and ``train.fit_native`` pick.
+    """
+    rest, test = cv.holdout_split(match_ids, test_size, seed=seed)
+    fit, validation = cv.holdout_split(match_ids[rest], validation_size, seed=seed)
+    return match_ids[rest][fit], match_ids[rest][validation], match_ids[test]
+
+
+def make_encoder(cities, sample):
+    """The native pipeline's OrdinalEncoder with the vocabularies fixed up front."""
+    teams = sorted(TEAMS)
+    encoder = train.make_native_pipeline().named_steps['step1']
+    return encoder.set_params(trf__categories=[teams, teams, sorted(cities)]).fit(sample[FEATURES])
+
+
+def external_matrix(chunks, encoder, cache_prefix):
+    """``(DMatrix, stats)`` paging ``chunks()`` to disk under ``cache_prefix``.
+
+    ``stats`` holds the row count and the target sum, tallied while the
+    pages are built.
+    """
+    import xgboost as xgb
+
+    feature_types = CODE_FEATURES['feature_types']
+    stats = {'rows': 0, 'target_sum': 0.0}
+
+    class Chunks(xgb.DataIter):
+        def __init__(self):
+            self.chunks = None
+            self.first_pass = True
+            super().__init__(cache_prefix=cache_prefix)
+
+        def next(self, input_data):
+            if self.chunks is None:
+                self.chunks = chunks()
+            table = next(self.chunks, None)
+            if table is None:
+                self.first_pass = False
+                return 0
+            y = table[TARGET].to_numpy(dtype='float32')
+            if self.first_pass:
+                stats['rows'] += len(y)
+                stats['target_sum'] += float(y.sum(dtype='float64'))
+            input_data(data=np.asarray(encoder.transform(table[FEATURES]), dtype='float32'), label=y,
+                       feature_types=feature_types)
+            return 1
+
+        def reset(self):
+            self.chunks = None
+
+    return xgb.DMatrix(Chunks(), enable_categorical=CODE_FEATURES['enable_categorical']), stats
+
+
+def booster_params(params, base_score):
+    """``xgb.train`` parameters for the native mode's sklearn-style ``params``."""
+    return {'objective': 'reg:squarederror', 'tree_method': 'hist', 'eta': params['learning_rate'],
+            'max_depth': params['max_depth'], 'max_bin': params['max_bin'], 'seed': params['random_state'],
+            'base_score': base_score}
+
+
+def fit(matrices, params):
+    """The fitted pipeline (OrdinalEncoder, booster on the codes) trained from the external-memory pages."""
+    import xgboost as xgb
+    from sklearn.pipeline import Pipeline
+
+    (dtrain, stats), (dvalid, _), encoder = matrices
+    start = time.perf_counter()
+    # As train.start_from_mean: boost from the mean score, not from 0.5
+    booster = xgb.train(booster_params(params, stats['target_sum'] / stats['rows']), dtrain,
+                        num_boost_round=params['n_estimators'], evals=[(dvalid, 'validation')],
+                        early_stopping_rounds=params['early_stopping_rounds'], verbose_eval=False)
+    seconds = round(time.perf_counter() - start, 3)
+    model = train.make_native_pipeline(**params, **CODE_FEATURES).named_steps['step3']
+    model.load_model(bytearray(booster.save_raw('ubj')))
+    return Pipeline(steps=[('step1', encoder), ('step3', model)]), seconds, stats['rows']
+
+
+def evaluate(fitted, chunks):
+    """Metrics as ``train.evaluate`` reports them, accumulated over ``chunks()``."""
+    import fastpath
+
+    pipe, fit_seconds, train_rows = fitted
+    fast = fastpath.FastPredictor.from_pipeline(pipe)
+    n, total, squares, abs_error, sq_error, sample = 0, 0.0, 0.0, 0.0, 0.0, None
+    for table in chunks():
+        y = table[TARGET].to_numpy(dtype='float64')
+        error = y - fast.predict(table[FEATURES], check=False)
+        n += len(y)
+        total += y.sum()
+        squares += (y ** 2).sum()
+        abs_error += np.abs(error).sum()
+        sq_error += (error ** 2).sum()
+        if sample is None:
+            sample = table[FEATURES].reset_index(drop=True)
+    return {'r2': round(float(1 - sq_error / (squares - total ** 2 / n)), 6), 'mae': round(float(abs_error / n), 6),
+            'train_rows': int(train_rows), 'test_rows': int(n), 'fit_seconds': fit_seconds,
+            **train.profile(pipe, sample)}
+
+
+def run(root=refresh.DATA_ROOT, out_dir=train.MODEL_DIR, params=None, chunk_matches=CHUNK_MATCHES,
+        min_city_deliveries=MIN_CITY_DELIVERIES, trace=False, cache_dir=CACHE_DIR, min_r2=MIN_R2):
+    """Train from the stores under ``root``; returns ``(metrics, report)``.
+
+    Nothing is exported when the test R2 is below ``min_r2``
+    (``metrics['exported']`` is False).
+    """
+    import bundle
+
+    params = {**train.NATIVE_PARAMS, **(params or {})}
+    deliveries = os.path.join(root, refresh.DELIVERIES_DIR)
+    data_hash = bundle.file_hash(os.path.join(deliveries, store.PARTITIONS_FILE))
+    runner = train.Runner(cache_dir=cache_dir, use_cache=False, trace=trace)
+
+    counts, matches = runner.stage('scan', data_hash, lambda: scan(deliveries, chunk_matches), cache=False)
+    cities = counts.index[counts > min_city_deliveries].tolist()
+    fit_ids, valid_ids, test_ids = split_matches(training_matches(matches, cities))
+    chunks = lambda ids: lambda: feature_chunks(deliveries, cities, ids, chunk_matches)
+
+    pages = os.path.join(cache_dir, 'pages')
+    shutil.rmtree(pages, ignore_errors=True)
+    os.makedirs(pages)
+    try:
+        def build():
+            encoder = make_encoder(cities, next(chunks(fit_ids)()))
+            return (external_matrix(chunks(fit_ids), encoder, os.path.join(pages, 'fit')),
+                    external_matrix(chunks(valid_ids), encoder, os.path.join(pages, 'validation')), encoder)
+
+        training_key = train.key(data_hash, 'outofcore', 'codes', params, min_city_deliveries)
+        matrices = lambda: runner.stage('matrix', training_key, build, cache=False)
+        fitted = runner.stage('fit', training_key, lambda m: fit(m, params), matrices, cache=False)
+    finally:
+        shutil.rmtree(pages, ignore_errors=True)
+    metrics = runner.stage('evaluate', training_key, lambda f: evaluate(f, chunks(test_ids)), lambda: fitted,
+                           cache=False)
+    metrics['exported'] = bool(out_dir) and metrics['r2'] >= min_r2
+    if out_dir and not metrics['exported']:
+        print(f"export    skipped: test R2 {metrics['r2']:.4f} is below {min_r2}, {out_dir} is unchanged")
+    elif out_dir:
+        runner.stage('export', training_key, lambda: train.export(fitted[0], metrics, out_dir, training_key, data_hash),
+                     cache=False)
+    return metrics, runner.report
+
+
+def in_memory_metrics(root=refresh.DATA_ROOT, params=None):
+    """``train.py --split group --mode native`` metrics on the same store, held in memory."""
+    table = refresh.load_training_table(root, keys=True)
+    data = train.split(table, by='group')
+    fitted = train.fit(data, {**train.NATIVE_PARAMS, **(params or {})}, 'native', table['match_id'])
+    return train.evaluate(fitted, data)
+
+
+def check_parity(metrics, expected, mae=PARITY_MAE, r2=PARITY_R2):
+    """Problems found comparing out-of-core ``metrics`` with the in-memory ``expected``."""
+    problems = []
+    if metrics['test_rows'] != expected['test_rows']:
+        problems.append(f"test rows {metrics['test_rows']} != {expected['test_rows']}")
+    if abs(metrics['mae'] - expected['mae']) > mae:
+        problems.append(f"MAE {metrics['mae']:.2f} vs {expected['mae']:.2f}")
+    if abs(metrics['r2'] - expected['r2']) > r2:
+        problems.append(f"R2 {metrics['r2']:.4f} vs {expected['r2']:.4f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the score model from the delivery store in bounded memory.')
+    parser.add_argument('--root', default=None,
+                        help='directory of the refresh.py stores (default: the stores of --data-dir)')
+    parser.add_argument('--refresh', action='store_true', help='run refresh.py on --data-dir first')
+    parser.add_argument('--data-dir', default=ingest.DATA_DIR)
+    parser.add_argument('--out', default=train.MODEL_DIR, help="directory for pipe.pkl and bundle/ ('' to skip)")
+    parser.add_argument('--chunk-matches', type=int, default=CHUNK_MATCHES, help='matches per chunk')
+    parser.add_argument('--n-estimators', type=int, default=None)
+    parser.add_argument('--learning-rate', type=float, default=None)
+    parser.add_argument('--max-depth', type=int, default=None)
+    parser.add_argument('--early-stopping-rounds', type=int, default=None)
+    parser.add_argument('--min-r2', type=float, default=MIN_R2, help='lowest test R2 that is exported')
+    parser.add_argument('--check', action='store_true',
+                        help='also train train.py --split group --mode native in memory and compare')
+    parser.add_argument('--trace', action='store_true', help='also trace Python allocations (slower)')
+    args = parser.parse_args()
+    root = args.root or refresh.store_root(args.data_dir)
+
+    given = {'n_estimators': args.n_estimators, 'learning_rate': args.learning_rate, 'max_depth': args.max_depth,
+             'early_stopping_rounds': args.early_stopping_rounds}
+    params = {**train.NATIVE_PARAMS, **{k: v for k, v in given.items() if v is not None}}
+    start = time.perf_counter()
+    if args.refresh:
+        refresh.refresh(args.data_dir, root)
+    metrics, report = run(root, args.out, params, args.chunk_matches, trace=args.trace, min_r2=args.min_r2)
+    total = time.perf_counter() - start
+    peak = max((entry['peak_rss'] or 0) for entry in report)
+    print(f"Test R2 {metrics['r2']:.4f}, MAE {metrics['mae']:.2f} on {metrics['test_rows']} rows of held-out "
+          f"matches; {metrics['trees']} trees, fit {metrics['fit_seconds']:.1f}s on {metrics['train_rows']} rows; "
+          f"peak RSS {peak / 2 ** 20:.0f} MiB; total {total:.1f}s")
+
+    os.makedirs(os.path.dirname(train.RUNS_LOG), exist_ok=True)
+    with open(train.RUNS_LOG, 'a') as f:
+        f.write(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'source': 'store', 'mode': 'outofcore',
+                            'split': 'group', 'chunk_matches': args.chunk_matches, 'params': params,
+                            'metrics': metrics, 'seconds': round(total, 3), 'stages': report}) + '\n')
+
+    problems = []
+    if args.check:
+        expected = in_memory_metrics(root, params)
+        print(f"In memory (train.py --split group --mode native): R2 {expected['r2']:.4f}, MAE {expected['mae']:.2f} "
+              f"on {expected['test_rows']} rows; {expected['trees']} trees, fit {expected['fit_seconds']:.1f}s")
+        problems = check_parity(metrics, expected)
+        print('Parity OK' if not problems else 'Parity FAILED: ' + '; '.join(problems))
+    if (args.out and not metrics['exported']) or problems:
+        parser.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Process-wide LRU/TTL cache of predictions keyed on the match state.
+
+The same (teams, city, score, balls_left, wickets, crr, last_five) states
+recur across reruns and across users during a live match. ``PredictionCache``
+memoizes the model output for each exact feature tuple, scores all
+misses of a batch in one model call, and reloads the model (dropping every
+cached entry) when the model file changes on disk. It is thread-safe, so one
+instance can be shared by all Streamlit sessions via ``st.cache_resource``.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import bundle
+import predict
+from schema import CATEGORICAL, FEATURES, NUMERIC
+
+
+def state_key(state):
+    """Hashable key for one state (a mapping over ``FEATURES``).
+
+    Numbers are keyed on their exact values, so two states share an entry
+    only when the model sees the same inputs for both.
+    """
+    return tuple(str(state[col]) for col in CATEGORICAL) + tuple(float(state[col]) for col in NUMERIC)
+
+
+class PredictionCache:
+    """Bounded LRU cache with per-entry TTL in front of a predictor.
+
+    ``loader(path)`` returns an object with ``predict(columns, check)`` and
+    ``categories``; the default handles bundles, fastpath exports and pickles
+    (``bundle.load_predictor``). ``model_path`` defaults to the exported bundle
+    if there is one. Its mtime is checked at most every ``check_interval``
+    seconds. With an ``audit`` log (``audit.AuditLog``) the states the model
+    scored are recorded, once per distinct state of a batch; cache hits are
+    not, so reruns and repeat viewers do not count a state again.
+    """
+
+    def __init__(self, model_path=None, loader=bundle.load_predictor,
+                 maxsize=4096, ttl=600, check_interval=1.0, audit=None):
+        self.model_path = model_path or bundle.default_model_path()
+        self.loader = loader
+        self.audit = audit
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = self.misses = self.evictions = self.reloads = 0
+        self.model = None
+        self.model_mtime = None
+        self.checked = 0.0
+        self._reload()
+
+    def _reload(self):
+        mtime = os.stat(self.model_path).st_mtime_ns
+        self.model = self.loader(self.model_path)
+        self.model_mtime = mtime
+        self.entries.clear()
+
+    def _check_model(self, now):
+        if now - self.checked < self.check_interval:
+            return
+        self.checked = now
+        try:
+            changed = os.stat(self.model_path).st_mtime_ns != self.model_mtime
+        except OSError:
+            return
+        if changed:
+            self._reload()
+            self.reloads += 1
+
+    def predict(self, states, check=True, match_ids=None, innings=None):
+        """Predictions for a batch of states, scoring only the cache misses.
+
+        ``match_ids`` and ``innings`` only tag the audit records.
+        """
+        return self._predict(states, check, match_ids, innings)[0]
+
+    def _predict(self, states, check, match_ids, innings):
+        """``(predictions, model)``: the model is the one every prediction came from."""
+        columns = predict.to_columns(states)
+        rows = [dict(zip(FEATURES, values)) for values in zip(*(columns[col] for col in FEATURES))]
+        now = time.monotonic()
+        results = [None] * len(rows)
+        missing = {}
+        with self.lock:
+            self._check_model(now)
+            for i, row in enumerate(rows):
+                key = state_key(row)
+                entry = self.entries.get(key)
+                if entry is not None and entry[1] > now:
+                    self.entries.move_to_end(key)
+                    results[i] = entry[0]
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.misses += 1
+            model = self.model
+
+        if missing:
+            first = [indexes[0] for indexes in missing.values()]
+            batch = {col: [columns[col][i] for i in first] for col in FEATURES}
+            start = time.perf_counter()
+            scores = model.predict(batch, check)
+            if self.audit is not None:
+                self.audit.record(batch, scores, time.perf_counter() - start, model.version,
+                                  [match_ids[i] for i in first] if match_ids is not None else None,
+                                  [innings[i] for i in first] if innings is not None else None)
+            with self.lock:
+                for (key, indexes), score in zip(missing.items(), scores):
+                    for i in indexes:
+                        results[i] = score
+                    if model is self.model:
+                        self.entries[key] = (score, now + self.ttl)
+                        self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return results, model
+
+    def predict_one(self, batting_team, bowling_team, city, current_score, balls_left,
+                    wickets_left, crr, last_five):
+        values = (batting_team, bowling_team, city, current_score, balls_left, wickets_left, crr, last_five)
+        return self.predict({col: [v] for col, v in zip(FEATURES, values)})[0]
+
+    def predict_interval(self, states, check=True, match_ids=None, innings=None):
+        """Like ``predict``, plus ``(low, high)`` bounds (None if the model has no intervals)."""
+        columns = predict.to_columns(states)
+        # The bounds come from the model that made the points, even if a reload happened since
+        predicted, model = self._predict(columns, check, match_ids, innings)
+        intervals = model.intervals
+        if intervals is None:
+            return predicted, None, None
+        low, high = intervals.bounds(predicted, columns['balls_left'], columns['current_score'])
+        return predicted, low.tolist(), high.tolist()
+
+    def predict_interval_one(self, batting_team, bowling_team, city, current_score, balls_left,
+                             wickets_left, crr, last_five):
+        """``(predicted, low, high)`` for one state; the bounds are None without intervals."""
+        values = (batting_team, bowling_team, city, current_score, balls_left, wickets_left, crr, last_five)
+        predicted, low, high = self.predict_interval({col: [v] for col, v in zip(FEATURES, values)})
+        return predicted[0], low and low[0], high and high[0]
+
+    @property
+    def categories(self):
+        return self.model.categories
+
+    @property
+    def version(self):
+        return self.model.version
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries),
+                    'evictions': self.evictions, 'reloads': self.reloads,
+                    'hit_rate': self.hits / total if total else 0.0}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
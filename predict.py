@@ -0,0 +1,169 @@
+"""Batch scoring of many match states with the Model/pipe.pkl pipeline.
+
+The web apps build a one-row DataFrame per prediction. Here a whole batch of
+states is validated once and scored with a single ``pipe.predict`` call::
+
+    import predict
+    model = predict.BatchPredictor.load()
+    scores = model.predict({
+        'batting_team': ['India', 'England'], 'bowling_team': ['Australia', 'India'],
+        'city': ['Mumbai', 'London'], 'current_score': [50, 88], 'balls_left': [72, 60],
+        'wickets_left': [8, 7], 'crr': [6.25, 8.8], 'last_five': [35, 41],
+    })
+
+States can be a mapping of column -> sequence, a DataFrame, a list of dicts
+or a list of tuples in ``schema.FEATURES`` order.
+"""
+import os
+import pickle
+
+import numpy as np
+
+from schema import BALLS_PER_INNINGS, CATEGORICAL, FEATURES, NUMERIC
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(ROOT, 'Model', 'pipe.pkl')
+
+# What the web form asks for; the model features are derived from these
+INPUTS = ['batting_team', 'bowling_team', 'city', 'current_score', 'overs', 'wickets', 'last_five']
+
+# Inclusive bounds for the numeric inputs; crr is only required to be finite
+LIMITS = {
+    'current_score': (0, 1000),
+    'balls_left': (0, BALLS_PER_INNINGS),
+    'wickets_left': (0, 10),
+    'last_five': (0, 1000),
+}
+
+
+def load_model(path=MODEL_PATH):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def to_columns(states):
+    """Normalize a batch of states to ``{feature: ndarray}``."""
+    if hasattr(states, 'columns'):
+        return {col: states[col].to_numpy() for col in FEATURES}
+    if hasattr(states, 'keys'):
+        return {col: np.asarray(states[col]) for col in FEATURES}
+    states = list(states)
+    if states and hasattr(states[0], 'keys'):
+        return {col: np.asarray([s[col] for s in states]) for col in FEATURES}
+    rows = list(zip(*states)) if states else [()] * len(FEATURES)
+    return {col: np.asarray(values) for col, values in zip(FEATURES, rows)}
+
+
+def from_inputs(batting_team, bowling_team, city, current_score, overs, wickets, last_five):
+    """Build feature columns from the web form inputs (scalars or arrays).
+
+    Derives balls_left, wickets_left and crr exactly as web.py / web_new.py do.
+    """
+    overs = np.asarray(overs, dtype='float64')
+    current_score = np.asarray(current_score)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crr = np.where(overs > 0, current_score / overs, 0.0)
+    return {
+        'batting_team': np.atleast_1d(batting_team),
+        'bowling_team': np.atleast_1d(bowling_team),
+        'city': np.atleast_1d(city),
+        'current_score': np.atleast_1d(current_score),
+        'balls_left': np.atleast_1d(np.maximum(0, (BALLS_PER_INNINGS - overs * 6).astype('int64'))),
+        'wickets_left': np.atleast_1d(10 - np.asarray(wickets)),
+        'crr': np.atleast_1d(crr),
+        'last_five': np.atleast_1d(last_five),
+    }
+
+
+def projection(predicted_score, current_score, overs):
+    """Runs to add and required rate for predicted scores, as the UI shows them."""
+    predicted_score = np.asarray(predicted_score)
+    overs_left = (BALLS_PER_INNINGS - (np.asarray(overs, dtype='float64') * 6).astype('int64')) / 6
+    runs_to_add = predicted_score - np.asarray(current_score)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        required_rate = np.where(overs_left > 0, runs_to_add / overs_left, 0.0)
+    return runs_to_add, required_rate
+
+
+def known_categories(pipe):
+    """``{column: set of categories}`` the pipeline's one-hot encoder was fitted on."""
+    encoder = pipe.named_steps['step1'].named_transformers_['trf']
+    return {col: set(cats) for col, cats in zip(CATEGORICAL, encoder.categories_)}
+
+
+def validate(columns, categories=None):
+    """Check a batch of feature columns once; raises ValueError on bad input."""
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"Feature columns have different lengths: {sorted(lengths)}")
+    if categories:
+        for col in CATEGORICAL:
+            unknown = set(np.unique(columns[col]).tolist()) - categories[col]
+            if unknown:
+                raise ValueError(f"Unknown {col}: {sorted(map(str, unknown))}")
+    same = columns['batting_team'] == columns['bowling_team']
+    if same.any():
+        raise ValueError(f"Batting and bowling team are the same in {int(same.sum())} state(s)")
+    for col in NUMERIC:
+        values = np.asarray(columns[col], dtype='float64')
+        if not np.isfinite(values).all():
+            raise ValueError(f"{col} must be finite")
+        if col in LIMITS:
+            low, high = LIMITS[col]
+            if ((values < low) | (values > high)).any():
+                raise ValueError(f"{col} must be between {low} and {high}")
+
+
+def predict_batch(pipe, states, categories=None, check=True):
+    """Score a batch of states with one ``pipe.predict`` call."""
+    import pandas as pd
+
+    columns = to_columns(states)
+    if check:
+        validate(columns, categories)
+    return pipe.predict(pd.DataFrame(columns, columns=FEATURES))
+
+
+class BatchPredictor:
+    """A loaded pipeline plus its encoder vocabulary, for repeated batch scoring."""
+
+    version = None  # set by bundle.load_predictor
+    intervals = None  # intervals.Intervals of a calibrated bundle
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.categories = known_categories(pipe)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        return cls(load_model(path))
+
+    def predict(self, states, check=True):
+        return predict_batch(self.pipe, states, self.categories, check)
+
+    def predict_interval(self, states, check=True):
+        """Point predictions and their ``(low, high)`` interval bounds.
+
+        The bounds are None when the model has no calibrated intervals.
+        """
+        columns = to_columns(states)
+        predicted = self.predict(columns, check)
+        if self.intervals is None:
+            return predicted, None, None
+        low, high = self.intervals.bounds(predicted, columns['balls_left'], columns['current_score'])
+        return predicted, low, high
+
+    def score(self, inputs, check=True):
+        """Score web-form inputs (``{field: sequence}`` over ``INPUTS``).
+
+        Returns ``{'predicted_score', 'runs_to_add', 'required_rate'}`` arrays,
+        with the predicted score truncated to an int like the UI does, plus
+        ``'low'`` and ``'high'`` interval bounds if the model is calibrated.
+        """
+        predicted, low, high = self.predict_interval(from_inputs(*(inputs[k] for k in INPUTS)), check)
+        predicted = predicted.astype('int64')
+        runs_to_add, required_rate = projection(predicted, inputs['current_score'], inputs['overs'])
+        scores = {'predicted_score': predicted, 'runs_to_add': runs_to_add, 'required_rate': required_rate}
+        if low is not None:
+            scores['low'], scores['high'] = low.astype('int64'), high.astype('int64')
+        return scores
@@ -0,0 +1,221 @@
+"""Precomputed projection tables for constant-time, model-free lookups.
+
+For a fixture (batting team, bowling team, city) the model only sees four
+free inputs: score, balls_left, wickets_left and last_five (crr follows from
+score and balls_left). ``build`` scores a dense grid over them once per
+fixture and stores it as a float16 ``.npy`` array. ``ProjectionTable``
+memory-maps those arrays and answers lookups by bilinear interpolation along
+score and last_five, exact on balls_left and wickets_left. Lookups need only
+numpy: no pandas, sklearn or xgboost import.
+
+The index records the ``model_version`` the tables were built with. A build
+with another model starts a fresh index, and ``ProjectionTable`` refuses
+tables built for a model other than the one it is told to expect, so a
+retrain or a ``T20_MODEL`` switch never serves stale projections.
+``service.py --projections`` answers requests for the tabled fixtures from
+the tables and sends only the rest to the model.
+
+    python projection.py build --fixture "India,Australia,Mumbai" --fixture "England,India,London"
+    python projection.py lookup India Australia Mumbai --score 50 --overs 8 --wickets 2 --last-five 35
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from schema import BALLS_PER_INNINGS
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TABLE_DIR = os.path.join(ROOT, 'Model', 'projections')
+INDEX_FILE = 'index.json'
+
+# Grid axes: (start, stop, step), inclusive. balls_left stops at 90 because
+# the model is only used from the fifth over on.
+GRID = {
+    'current_score': (0, 400, 5),
+    'balls_left': (0, 90, 1),
+    'wickets_left': (0, 10, 1),
+    'last_five': (0, 120, 5),
+}
+AXES = list(GRID)
+
+
+def axis(name, grid=GRID):
+    start, stop, step = grid[name]
+    return np.arange(start, stop + 1, step)
+
+
+def fixture_file(batting_team, bowling_team, city):
+    return '__'.join(part.replace(' ', '_') for part in (batting_team, bowling_team, city)) + '.npy'
+
+
+def build_fixture(model, batting_team, bowling_team, city, grid=GRID):
+    """Score the whole grid for one fixture; returns a float16 array over ``AXES``."""
+    mesh = np.meshgrid(*(axis(name, grid) for name in AXES), indexing='ij')
+    score, balls_left, wickets_left, last_five = (m.ravel() for m in mesh)
+    n = len(score)
+    # crr as the training features define it
+    crr = np.round(score * 6 / (BALLS_PER_INNINGS - balls_left), 2)
+    columns = {
+        'batting_team': np.full(n, batting_team, dtype=object),
+        'bowling_team': np.full(n, bowling_team, dtype=object),
+        'city': np.full(n, city, dtype=object),
+        'current_score': score, 'balls_left': balls_left, 'wickets_left': wickets_left,
+        'crr': crr, 'last_five': last_five,
+    }
+    predictions = model.predict(columns, check=False)
+    return np.asarray(predictions, dtype='float16').reshape(mesh[0].shape)
+
+
+def build(model, fixtures, table_dir=TABLE_DIR, grid=GRID, verbose=False):
+    """Build (or rebuild) the tables for ``fixtures`` under ``table_dir``.
+
+    Tables already indexed are kept only if they share the grid and the
+    model version; otherwise the index starts over with ``fixtures``.
+    """
+    os.makedirs(table_dir, exist_ok=True)
+    index_path = os.path.join(table_dir, INDEX_FILE)
+    index = {'grid': grid, 'axes': AXES, 'model_version': model.version, 'fixtures': {}}
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            existing = json.load(f)
+        if (existing['grid'] == {k: list(v) for k, v in grid.items()}
+                and existing.get('model_version') == model.version):
+            index = existing
+
+    for batting_team, bowling_team, city in fixtures:
+        start = time.perf_counter()
+        table = build_fixture(model, batting_team, bowling_team, city, grid)
+        name = fixture_file(batting_team, bowling_team, city)
+        tmp = os.path.join(table_dir, f'.{name}.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, table)
+        os.replace(tmp, os.path.join(table_dir, name))
+        index['fixtures'][f'{batting_team}|{bowling_team}|{city}'] = name
+        if verbose:
+            print(f"{batting_team} v {bowling_team} at {city}: {table.size} states in "
+                  f"{time.perf_counter() - start:.1f}s")
+
+    tmp = index_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, index_path)
+    return index
+
+
+class ProjectionTable:
+    """O(1) projected-score lookups from memory-mapped fixture tables.
+
+    With ``model_version`` (``bundle.model_version()``, which only reads
+    the manifest) tables built for any other model raise ``ValueError``.
+    """
+
+    def __init__(self, table_dir=TABLE_DIR, model_version=None):
+        self.table_dir = table_dir
+        with open(os.path.join(table_dir, INDEX_FILE), 'r') as f:
+            self.index = json.load(f)
+        built = self.index.get('model_version')
+        if model_version is not None and built != model_version:
+            raise ValueError(f"Projection tables in {table_dir} were built for model {built}, not {model_version}; "
+                             f"rebuild them with `python projection.py build`")
+        self.model_version = built
+        self.grid = {name: tuple(self.index['grid'][name]) for name in AXES}
+        self.tables = {}
+
+    def fixtures(self):
+        return [tuple(key.split('|')) for key in self.index['fixtures']]
+
+    def covers(self, batting_team, bowling_team, city, current_score, last_five):
+        """Whether the fixture is tabled and the state lies on its grid (lookups clamp outside it)."""
+        if f'{batting_team}|{bowling_team}|{city}' not in self.index['fixtures']:
+            return False
+        for name, value in (('current_score', current_score), ('last_five', last_five)):
+            start, stop, step = self.grid[name]
+            if not start <= value <= start + (stop - start) // step * step:
+                return False
+        return True
+
+    def table(self, batting_team, bowling_team, city):
+        key = f'{batting_team}|{bowling_team}|{city}'
+        table = self.tables.get(key)
+        if table is None:
+            if key not in self.index['fixtures']:
+                raise KeyError(f"No projection table for {batting_team} v {bowling_team} at {city}")
+            table = np.load(os.path.join(self.table_dir, self.index['fixtures'][key]), mmap_mode='r')
+            self.tables[key] = table
+        return table
+
+    def _position(self, name, value):
+        # Clamped grid cell and fractional offset along one axis
+        start, stop, step = self.grid[name]
+        cells = (stop - start) // step
+        x = (min(max(value, start), start + cells * step) - start) / step
+        i = min(int(x), cells - 1)
+        return i, x - i
+
+    def lookup(self, batting_team, bowling_team, city, current_score, balls_left, wickets_left, last_five):
+        """Projected final score, interpolated along score and last_five."""
+        table = self.table(batting_team, bowling_team, city)
+        b = int(min(max(balls_left, self.grid['balls_left'][0]), self.grid['balls_left'][1]))
+        w = int(min(max(wickets_left, 0), 10))
+        s, fs = self._position('current_score', current_score)
+        l, fl = self._position('last_five', last_five)
+        cell = table[s:s + 2, b, w, l:l + 2].astype('float64')
+        return float((1 - fs) * ((1 - fl) * cell[0, 0] + fl * cell[0, 1]) +
+                     fs * ((1 - fl) * cell[1, 0] + fl * cell[1, 1]))
+
+    def lookup_inputs(self, batting_team, bowling_team, city, current_score, overs, wickets, last_five):
+        """``lookup`` from the web form inputs (overs and wickets fallen)."""
+        balls_left = max(0, int(BALLS_PER_INNINGS - overs * 6))
+        return self.lookup(batting_team, bowling_team, city, current_score, balls_left, 10 - wickets, last_five)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query precomputed projection tables.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    b = sub.add_parser('build')
+    b.add_argument('--fixture', action='append', default=[], help='"Batting,Bowling,City"')
+    b.add_argument('--all', action='store_true', help='every team pair at every known city')
+    b.add_argument('--model', default=None, help='bundle directory, Model/pipe.pkl or a fastpath .npz')
+    b.add_argument('--score-step', type=int, default=GRID['current_score'][2])
+    b.add_argument('--last-five-step', type=int, default=GRID['last_five'][2])
+    b.add_argument('--dir', default=TABLE_DIR)
+    q = sub.add_parser('lookup')
+    q.add_argument('batting_team')
+    q.add_argument('bowling_team')
+    q.add_argument('city')
+    q.add_argument('--score', type=float, required=True)
+    q.add_argument('--overs', type=float, required=True)
+    q.add_argument('--wickets', type=int, required=True)
+    q.add_argument('--last-five', type=float, required=True)
+    q.add_argument('--dir', default=TABLE_DIR)
+    q.add_argument('--model', default=None, help='model the tables must have been built with (default: served model)')
+    args = parser.parse_args()
+
+    import bundle
+    if args.command == 'lookup':
+        version = bundle.model_version(args.model)
+        start = time.perf_counter()
+        try:
+            tables = ProjectionTable(args.dir, version)
+        except ValueError as e:
+            parser.exit(1, f"{e}\n")
+        score = tables.lookup_inputs(args.batting_team, args.bowling_team, args.city,
+                                     args.score, args.overs, args.wickets, args.last_five)
+        print(f"Projected score: {score:.1f} ({(time.perf_counter() - start) * 1000:.2f} ms incl. open)")
+        return
+
+    from schema import CITIES, TEAMS
+    model = bundle.load_predictor(args.model)
+    fixtures = [tuple(part.strip() for part in f.split(',')) for f in args.fixture]
+    if args.all:
+        fixtures += [(a, b, c) for a in TEAMS for b in TEAMS if a != b for c in CITIES]
+    grid = dict(GRID, current_score=GRID['current_score'][:2] + (args.score_step,),
+                last_five=GRID['last_five'][:2] + (args.last_five_step,))
+    build(model, fixtures, args.dir, grid, verbose=True)
+
+
+if __name__ == '__main__':
+    main()
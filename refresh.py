@@ -0,0 +1,124 @@
+"""Incremental refresh of the delivery store and the persisted training table.
+
+Keeps a manifest of the match files already processed (path, mtime, size,
+SHA-1). A refresh only ingests, flattens and builds features for files that
+are new or changed, and appends their rows to the stores under
+``Training/data``::
+
+    Training/data/
+        manifest.json    processed match files
+        deliveries/      ball-by-ball store (store.DELIVERY_SCHEMA)
+        features/        per-delivery training rows (store.FEATURE_SCHEMA)
+
+Matches are identified by their Cricsheet file id, so nothing depends on
+``os.listdir`` order. The eligible-city cut depends on all matches, so it is
+applied when the table is loaded (``load_training_table``), not stored.
+
+    python refresh.py              # pick up new files in Dataset/t20s
+    python refresh.py --rebuild    # start from scratch
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import time
+
+import features
+import flatten
+import ingest
+import store
+from schema import CATEGORICAL, FEATURES, MIN_CITY_DELIVERIES, TARGET
+
+DATA_ROOT = os.path.join(ingest.ROOT, 'Training', 'data')
+MANIFEST_FILE = 'manifest.json'
+DELIVERIES_DIR = 'deliveries'
+FEATURES_DIR = 'features'
+
+
+def store_root(data_dir=ingest.DATA_DIR):
+    """``DATA_ROOT`` for ``ingest.DATA_DIR``, else stores of their own for ``data_dir``.
+
+    A refresh drops the matches missing from its data directory, so two
+    directories must never share stores.
+    """
+    if os.path.abspath(data_dir) == os.path.abspath(ingest.DATA_DIR):
+        return DATA_ROOT
+    digest = hashlib.sha1(os.path.abspath(data_dir).encode()).hexdigest()[:16]
+    return os.path.join(ingest.ROOT, '.cache', 'stores', digest)
+
+
+def refresh(data_dir=ingest.DATA_DIR, root=None, workers=None, rebuild=False):
+    """Bring the stores under ``root`` (default ``store_root(data_dir)``) up to date with ``data_dir``.
+
+    Returns ``(added, removed)``: the match ids (re)processed and the ids
+    whose files disappeared.
+    """
+    root = root or store_root(data_dir)
+    if rebuild and os.path.exists(root):
+        shutil.rmtree(root)
+    os.makedirs(root, exist_ok=True)
+    manifest_path = os.path.join(root, MANIFEST_FILE)
+    manifest = ingest.load_manifest(manifest_path)
+
+    files = ingest.match_files(data_dir)
+    pending = [mid for mid, path in files.items() if not ingest.file_unchanged(manifest.get(mid), path)]
+    removed = [mid for mid in manifest if mid not in files]
+
+    if pending or removed:
+        matches = ingest.load_matches(data_dir, workers=workers, match_ids=pending)
+        deliveries = flatten.to_store_frame(flatten.flatten_matches(matches))
+        # Both innings are stored; load_training_table picks the ones to train on
+        table = features.build_features(deliveries, min_city_deliveries=None, innings=(1, 2), keys=True)
+        # Changed files are dropped first, so a match that is now filtered out
+        # (or failed to parse) does not keep stale rows
+        stale = pending + removed
+        store.append_store(deliveries, os.path.join(root, DELIVERIES_DIR), store.DELIVERY_SCHEMA, drop=stale)
+        store.append_store(table, os.path.join(root, FEATURES_DIR), store.FEATURE_SCHEMA, drop=stale)
+        for mid in removed:
+            manifest.pop(mid)
+        for mid in matches:
+            manifest[mid] = ingest.file_entry(files[mid])
+
+    # Also persists mtime updates made by file_unchanged
+    ingest.save_manifest(manifest_path, manifest)
+    return pending, removed
+
+
+def load_training_table(root=DATA_ROOT, innings=(1,), min_city_deliveries=MIN_CITY_DELIVERIES, keys=False):
+    """Load the persisted training table with the notebook's filters applied.
+
+    Equivalent to ``features.build_features`` over every processed match.
+    """
+    table = store.read_store(os.path.join(root, FEATURES_DIR))
+    table = table[table['innings'].isin(innings).to_numpy()]
+    deliveries = store.read_store(os.path.join(root, DELIVERIES_DIR),
+                                  columns=['batting_team', 'bowling_team', 'innings', 'city', 'venue'])
+    table = features.filter_cities(table, features.city_counts(deliveries, innings=innings), min_city_deliveries)
+    for col in CATEGORICAL:
+        table[col] = table[col].astype(object)
+    table['last_five'] = table['last_five'].astype('float64')
+    columns = FEATURES + [TARGET]
+    return table[(['match_id', 'innings'] + columns) if keys else columns]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incrementally refresh the training data stores.')
+    parser.add_argument('--data-dir', default=ingest.DATA_DIR)
+    parser.add_argument('--root', default=None, help='store directory (default: Training/data for Dataset/t20s, '
+                        'else a cache directory of its own for --data-dir)')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--rebuild', action='store_true', help='drop the stores and rebuild from scratch')
+    args = parser.parse_args()
+
+    root = args.root or store_root(args.data_dir)
+    start = time.perf_counter()
+    added, removed = refresh(args.data_dir, root, args.workers, args.rebuild)
+    elapsed = time.perf_counter() - start
+    features_root = os.path.join(root, FEATURES_DIR)
+    rows = store.read_meta(features_root)['rows'] if os.path.exists(os.path.join(features_root, store.META_FILE)) else 0
+    print(f"{len(added)} new/changed, {len(removed)} removed match files in {elapsed:.2f}s; "
+          f"training table has {rows} rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Feature schema shared by the training and serving code.
+
+Kept free of pandas/numpy imports so lightweight entry points can use it.
+"""
+
+# Model inputs, in the order the serialized pipeline (Model/pipe.pkl) expects
+CATEGORICAL = ['batting_team', 'bowling_team', 'city']
+NUMERIC = ['current_score', 'balls_left', 'wickets_left', 'crr', 'last_five']
+FEATURES = CATEGORICAL + NUMERIC
+TARGET = 'runs_x'
+
+# Teams kept for training; the rest have too few matches
+TEAMS = [
+    'Australia',
+    'India',
+    'Bangladesh',
+    'New Zealand',
+    'South Africa',
+    'England',
+    'West Indies',
+    'Afghanistan',
+    'Pakistan',
+    'Sri Lanka'
+]
+
+# Cities the production model was trained on (the web apps' venue list)
+CITIES = ['Colombo', 'Mirpur', 'Johannesburg', 'Dubai', 'Auckland', 'Cape Town',
+          'London', 'Pallekele', 'Barbados', 'Sydney', 'Melbourne', 'Durban',
+          'St Lucia', 'Wellington', 'Lauderhill', 'Hamilton', 'Centurion',
+          'Manchester', 'Abu Dhabi', 'Mumbai', 'Nottingham', 'Southampton',
+          'Mount Maunganui', 'Chittagong', 'Kolkata', 'Lahore', 'Delhi',
+          'Nagpur', 'Chandigarh', 'Adelaide', 'Bangalore', 'St Kitts',
+          'Cardiff', 'Christchurch', 'Trinidad']
+
+# Cities need more than this many deliveries to be kept for training
+MIN_CITY_DELIVERIES = 600
+
+# Deliveries in the rolling "last five overs" window
+LAST_FIVE_BALLS = 30
+BALLS_PER_INNINGS = 120
@@ -0,0 +1,200 @@
+"""Parallel hyperparameter search on grouped CV with a latency-aware choice.
+
+Trials are random draws from ``SPACE`` (plus the notebook's configuration
+as a reference), scored with successive halving over the cached folds of
+``cv.py``:
+
+    rung 0   every trial on fold 0
+    rung 1   the survivors on folds 1 and 2
+    rung 2   the survivors on the remaining folds
+
+After each rung a trial is pruned unless its mean MAE so far is within
+``PRUNE_SLACK`` runs of the best trial's, so trials that can still end up
+near the best are kept however small they are. Every (trial, fold) pair is
+a job in one process pool; XGBoost threads are split between the workers.
+
+Surviving trials are timed on the serving path (``fastpath`` compiled from
+the fold's preprocessing and booster): one single-row prediction and a
+batch of ``train.LATENCY_ROWS`` rows. The timing runs one trial at a time
+in this process once the pool is done, so no fit competes for the cores. The report marks the Pareto front of
+MAE, single-row and batch latency, and picks the smallest model (fewest
+tree nodes) whose MAE is within ``TOLERANCE`` runs of the best, since
+production pays for latency, not for the last fraction of a run.
+
+    python search.py                               # 24 native trials, level2 data
+    python search.py --trials 60 --modes native notebook --workers 4
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import cv
+import ingest
+import train
+
+RUNS_LOG = os.path.join(ingest.ROOT, 'Training', 'data', 'search_runs.jsonl')
+SPACE = {
+    'n_estimators': [100, 200, 400, 800, 1500],
+    'learning_rate': [0.03, 0.05, 0.1, 0.2, 0.3],
+    'max_depth': [2, 3, 4, 5, 6, 8, 10, 12],
+}
+# The folds scored in each rung of successive halving
+RUNGS = [[0], [1, 2], [3, 4]]
+TOLERANCE = 1.0
+PRUNE_SLACK = 2.0
+TRIALS = 24
+SEED = 1
+
+
+def sample_trials(n, modes=('native',), seed=SEED):
+    """``n`` distinct ``(mode, params)`` draws, plus each mode's default params."""
+    rng = np.random.default_rng(seed)
+    trials = [(mode, {}) for mode in modes]
+    seen = set()
+    for _ in range(n * 20):
+        if len(trials) >= n + len(modes):
+            break
+        mode = modes[rng.integers(len(modes))]
+        params = {name: values[rng.integers(len(values))] for name, values in SPACE.items()}
+        if (mode, tuple(params.values())) not in seen:
+            seen.add((mode, tuple(params.values())))
+            trials.append((mode, params))
+    return trials
+
+
+def _run_job(args):
+    trial, fold, path, mode, params, n_jobs, keep_model = args
+    return trial, fold, cv.run_fold(path, mode, params, n_jobs, keep_model)
+
+
+def run_rung(jobs, workers):
+    """Results of ``(trial, fold, path, mode, params, keep_model)`` jobs, in a process pool."""
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(jobs)))
+    jobs = [(t, k, path, mode, params, max(1, cores // workers), keep) for t, k, path, mode, params, keep in jobs]
+    if workers == 1:
+        return [_run_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_run_job, jobs))
+
+
+def survivors(scores, alive, slack=PRUNE_SLACK):
+    """Trials whose mean MAE so far is within ``slack`` runs of the best."""
+    means = {t: float(np.mean([r['mae'] for r in scores[t]])) for t in alive}
+    best = min(means.values())
+    return [t for t in alive if means[t] <= best + slack]
+
+
+def pareto_front(trials, keys=('mae', 'row_us', 'batch_us_per_row')):
+    """Indices of the trials no other trial beats (or ties) on every key."""
+    front = []
+    for i, a in enumerate(trials):
+        dominated = any(all(b[k] <= a[k] for k in keys) and any(b[k] < a[k] for k in keys)
+                        for j, b in enumerate(trials) if j != i)
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def choose(trials, tolerance=TOLERANCE):
+    """The smallest model (fewest nodes, then fastest) within ``tolerance`` of the best MAE."""
+    best = min(t['mae'] for t in trials)
+    near = [t for t in trials if t['mae'] <= best + tolerance]
+    return min(near, key=lambda t: (t['nodes'], t['row_us']))
+
+
+def search(trials, source='level2', seed=SEED, workers=None, data_dir=ingest.DATA_DIR, slack=PRUNE_SLACK):
+    """One summary per trial; pruned trials have ``pruned_after`` instead of a profile."""
+    n_splits = cv.N_SPLITS
+    table, data_key = cv.load_table(source, data_dir)
+    splits = cv.folds(table, 'group', n_splits, seed)
+    paths = {mode: cv.fold_matrices(table, splits, mode, train.key(data_key, 'group', n_splits, seed, mode))
+             for mode in sorted({mode for mode, _ in trials})}
+
+    scores = {t: [] for t in range(len(trials))}
+    profiles, pruned = {}, {}
+    alive = list(scores)
+    for rung, rung_folds in enumerate(RUNGS):
+        last = rung == len(RUNGS) - 1
+        jobs = [(t, k, paths[trials[t][0]][k], trials[t][0], trials[t][1], last and k == rung_folds[0])
+                for t in alive for k in rung_folds]
+        start = time.perf_counter()
+        for t, k, result in run_rung(jobs, workers):
+            if 'pipe' in result:
+                profiles[t] = (paths[trials[t][0]][k], result.pop('pipe'))
+            scores[t].append(result)
+        kept = alive if last else survivors(scores, alive, slack)
+        print(f"rung {rung}: {len(alive)} trials on folds {rung_folds}, kept {len(kept)} "
+              f"({time.perf_counter() - start:.1f}s)", flush=True)
+        for t in set(alive) - set(kept):
+            pruned[t] = rung
+        alive = kept
+
+    start = time.perf_counter()
+    profiles = {t: cv.profile_fold(path, pipe) for t, (path, pipe) in profiles.items()}
+    print(f"timed {len(profiles)} trials serially ({time.perf_counter() - start:.1f}s)", flush=True)
+
+    summaries = []
+    for t, (mode, params) in enumerate(trials):
+        summary = {'trial': t, 'mode': mode, 'params': {**train.MODES[mode], **params},
+                   'mae': round(float(np.mean([r['mae'] for r in scores[t]])), 4),
+                   'folds': len(scores[t]), 'fit_seconds': round(sum(r['fit_seconds'] for r in scores[t]), 2)}
+        if t in profiles:
+            summary.update({k: profiles[t][k] for k in ('trees', 'depth', 'nodes', 'booster_bytes', 'fastpath_bytes',
+                                                        'row_us', 'batch_us_per_row')})
+        else:
+            summary['pruned_after'] = pruned[t]
+        summaries.append(summary)
+    return summaries
+
+
+def describe(params, mode):
+    defaults = train.MODES[mode]
+    changed = {k: v for k, v in params.items() if k in SPACE or defaults.get(k) != v}
+    return ' '.join(f'{k}={v}' for k, v in sorted(changed.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search model settings on grouped CV, trading MAE for latency.')
+    parser.add_argument('--source', choices=['level2', 'yaml'], default='level2')
+    parser.add_argument('--data-dir', default=ingest.DATA_DIR)
+    parser.add_argument('--modes', nargs='+', choices=sorted(train.MODES), default=['native'])
+    parser.add_argument('--trials', type=int, default=TRIALS, help='random trials besides the default settings')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='MAE (runs) traded for a smaller model')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--workers', type=int, default=None, help='jobs run at once (default: one per core)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    trials = sample_trials(args.trials, args.modes, args.seed)
+    results = search(trials, args.source, seed=args.seed, workers=args.workers, data_dir=args.data_dir)
+    done = [r for r in results if 'pruned_after' not in r]
+    front = {done[i]['trial'] for i in pareto_front(done)}
+    chosen = choose(done, args.tolerance)
+    best = min(done, key=lambda r: r['mae'])
+
+    print(f"\n{'':2}{'mode':<9}{'MAE':>7}{'trees':>7}{'nodes':>9}{'MiB':>7}{'1 row us':>10}{'batch us/row':>14}  params")
+    for r in sorted(done, key=lambda r: r['mae']):
+        mark = '*' if r['trial'] == chosen['trial'] else ('p' if r['trial'] in front else ' ')
+        print(f"{mark:<2}{r['mode']:<9}{r['mae']:7.2f}{r['trees']:7d}{r['nodes']:9d}"
+              f"{r['fastpath_bytes'] / 2 ** 20:7.1f}{r['row_us']:10.0f}{r['batch_us_per_row']:14.2f}  "
+              f"{describe(r['params'], r['mode'])}")
+    print(f"{len(results) - len(done)} of {len(results)} trials pruned; p = Pareto front (MAE, latency), "
+          f"* = chosen; {time.perf_counter() - start:.0f}s")
+    print(f"Best MAE {best['mae']:.2f}; chosen MAE {chosen['mae']:.2f} with {chosen['nodes']} nodes "
+          f"({chosen['row_us']:.0f} us per row vs {best['row_us']:.0f} us):")
+    flags = ' '.join(f"--{k.replace('_', '-')} {chosen['params'][k]}" for k in SPACE)
+    print(f"  python train.py --mode {chosen['mode']} {flags}")
+
+    os.makedirs(os.path.dirname(RUNS_LOG), exist_ok=True)
+    with open(RUNS_LOG, 'a') as f:
+        f.write(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'source': args.source,
+                            'tolerance': args.tolerance, 'chosen': chosen['trial'], 'trials': results}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
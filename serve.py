@@ -0,0 +1,169 @@
+"""Pre-fork launcher: one model in memory, many service.py workers.
+
+The parent loads the model bundle once, opens the listening socket and forks
+``--workers`` processes that each run ``service.Service`` on the inherited
+socket. The bundle arrays are memory-mapped from disk and the predictor's
+derived tables are built before the fork, so every worker shares the same
+physical pages (page cache and copy-on-write) instead of holding its own
+copy. Dead workers are restarted, after a growing delay when they die within
+``FAST_EXIT`` seconds of starting; after ``MAX_FAST_EXITS`` such deaths in a
+row (a worker that cannot start) the launcher stops. SIGINT/SIGTERM stop
+them all. Each worker keeps its own audit log buffer (segments are named by
+pid).
+
+Workers use the numpy predictor: forking after XGBoost's OpenMP threads have
+started is unsafe, and the bundle makes the booster unnecessary anyway.
+
+    python serve.py --workers 16 --port 8000
+    kill -USR1 <launcher pid>    # print the workers' summed RSS and PSS
+"""
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import audit
+import bundle
+from service import Service
+
+# A worker dying this soon after its start counts as failing to start
+FAST_EXIT = 5.0
+MAX_FAST_EXITS = 5
+# Restart delay after the n-th fast exit in a row: RESTART_DELAY * 2 ** (n - 1) seconds
+RESTART_DELAY = 0.5
+
+
+def run_worker(sock, model, max_batch, max_wait, audit_dir):
+    # SIGTERM exits through Python, so the audit buffer is flushed first
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Created after the fork: the flush thread does not survive one
+    log = audit.AuditLog(audit_dir, source='serve') if audit_dir else None
+    service = Service(model, max_batch, max_wait, log)
+    try:
+        asyncio.run(service.serve(sock=sock))
+    finally:
+        if log is not None:
+            log.flush()
+
+
+def spawn(sock, model, max_batch, max_wait, audit_dir):
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        run_worker(sock, model, max_batch, max_wait, audit_dir)
+    except SystemExit:
+        pass
+    except BaseException:
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def memory(pid):
+    """``(rss, pss)`` in KiB; PSS splits shared pages between the processes using them."""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss'):
+                values[name] = int(rest.split()[0])
+    return values['Rss'], values['Pss']
+
+
+def report(pids):
+    try:
+        usage = [memory(pid) for pid in pids]
+    except OSError:
+        return
+    rss = sum(u[0] for u in usage) / 1024
+    pss = sum(u[1] for u in usage) / 1024
+    print(f"{len(pids)} workers: RSS {rss:.0f} MiB summed, PSS {pss:.0f} MiB total "
+          f"({pss / len(pids):.0f} MiB per worker)", flush=True)
+
+
+class Stop(Exception):
+    pass
+
+
+def stop(signum, frame):
+    raise Stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve predictions from several worker processes.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--model', default=None, help='bundle directory (default Model/bundle) or .npz')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--audit-dir', default=audit.AUDIT_ROOT)
+    parser.add_argument('--no-audit', action='store_true', help='do not record scored states')
+    args = parser.parse_args()
+
+    path = args.model or bundle.default_model_path()
+    if not (os.path.isdir(path) or path.endswith('.npz')):
+        # A pickled pipeline would load sklearn and xgboost (and its threads) before the fork
+        parser.error(f"{path} is not a bundle directory or .npz; run `python bundle.py export` first")
+    start = time.perf_counter()
+    model = bundle.load_predictor(path)
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    # Objects created so far stay out of the collector's way, so its passes in
+    # the workers do not touch (and copy) the pages they live on
+    gc.freeze()
+    spawn_args = (sock, model, args.max_batch, args.max_wait_ms / 1000, None if args.no_audit else args.audit_dir)
+    # pid -> start time
+    workers = {spawn(*spawn_args): time.monotonic() for _ in range(args.workers)}
+    print(f"Model loaded in {time.perf_counter() - start:.2f}s; {args.workers} workers "
+          f"listening on http://{args.host}:{args.port}", flush=True)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: report(list(workers)))
+    fast_exits = 0
+    failed = False
+    try:
+        while True:
+            pid, status = os.wait()
+            if pid not in workers:
+                continue
+            started = workers.pop(pid)
+            fast_exits = fast_exits + 1 if time.monotonic() - started < FAST_EXIT else 0
+            if fast_exits >= MAX_FAST_EXITS:
+                print(f"Worker {pid} exited with status {status}; {fast_exits} workers in a row died within "
+                      f"{FAST_EXIT:.0f}s of starting, giving up", file=sys.stderr, flush=True)
+                failed = True
+                break
+            delay = RESTART_DELAY * 2 ** (fast_exits - 1) if fast_exits else 0.0
+            print(f"Worker {pid} exited with status {status}; restarting in {delay:.1f}s",
+                  file=sys.stderr, flush=True)
+            time.sleep(delay)
+            workers[spawn(*spawn_args)] = time.monotonic()
+    except Stop:
+        pass
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in workers:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sock.close()
+    if failed:
+        parser.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""JSON prediction service with request micro-batching.
+
+Loads the model once at startup and serves::
+
+    POST /predict   {"batting_team": "India", "bowling_team": "Australia",
+                     "city": "Mumbai", "current_score": 50, "overs": 8.0,
+                     "wickets": 2, "last_five": 35}
+                    -> {"predicted_score": 163, "runs_to_add": 113, "required_rate": 9.42,
+                        "interval": [148, 177]}   (P10/P90, calibrated bundles only)
+                    (a JSON array of states returns an array of results;
+                    optional "match_id" (Cricsheet id) and "innings" tag the
+                    audit record, see audit.py)
+    GET  /health    -> {"status": "ok", ...counters}
+
+Concurrent requests are coalesced into one model call: the batcher waits for
+at most ``--max-wait-ms`` after the first queued state, or until
+``--max-batch`` states are queued. Only the standard library is used for
+the server itself. Every scored state goes to the audit log (``--no-audit``
+turns it off).
+
+With ``--projections`` (tables from ``projection.py build`` for the served
+model) states of the tabled fixtures are answered by a table lookup, in
+constant time and without a model call; the rest are batched as usual.
+
+    python service.py --port 8000 --max-batch 64 --max-wait-ms 2
+    python service.py --projections Model/projections
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+import audit
+import bundle
+import predict
+
+MAX_BODY = 1 << 20
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class MicroBatcher:
+    """Coalesces states submitted from many coroutines into batched model calls."""
+
+    def __init__(self, model, max_batch=64, max_wait=0.002, audit=None):
+        self.model = model
+        self.audit = audit
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = []
+        self.ready = asyncio.Event()
+        self.full = asyncio.Event()
+        self.batches = 0
+        self.states = 0
+
+    async def submit(self, inputs):
+        """Queue one state (a dict over ``predict.INPUTS``) and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((inputs, future))
+        self.ready.set()
+        if len(self.pending) >= self.max_batch:
+            self.full.set()
+        return await future
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            # One timed wait per batch: until it fills up or max_wait passes
+            if len(self.pending) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self.full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            if not self.pending:
+                self.ready.clear()
+            if len(self.pending) < self.max_batch:
+                self.full.clear()
+            # Scored inline: a worker thread would only add GIL hand-offs, and
+            # requests arriving meanwhile simply form the next batch
+            try:
+                results = self._score([s for s, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _score(self, states):
+        inputs = {k: [s[k] for s in states] for k in predict.INPUTS}
+        start = time.perf_counter()
+        scores = self.model.score(inputs, check=False)
+        if self.audit is not None:
+            self.audit.record(predict.from_inputs(*(inputs[k] for k in predict.INPUTS)), scores['predicted_score'],
+                              time.perf_counter() - start, self.model.version,
+                              [s['match_id'] for s in states], [s['innings'] for s in states])
+        self.batches += 1
+        self.states += len(states)
+        results = [{'predicted_score': int(scores['predicted_score'][i]),
+                    'runs_to_add': int(scores['runs_to_add'][i]),
+                    'required_rate': round(float(scores['required_rate'][i]), 2)}
+                   for i in range(len(states))]
+        if 'low' in scores:
+            for i, result in enumerate(results):
+                result['interval'] = [int(scores['low'][i]), int(scores['high'][i])]
+        return results
+
+
+def parse_state(item, categories):
+    """Validate one JSON state up front, so a bad request cannot fail a batch."""
+    if not isinstance(item, dict):
+        raise ValueError('Each state must be a JSON object')
+    missing = [k for k in predict.INPUTS if k not in item]
+    if missing:
+        raise ValueError(f"Missing fields: {missing}")
+    try:
+        state = {k: item[k] if k in ('batting_team', 'bowling_team', 'city') else float(item[k])
+                 for k in predict.INPUTS}
+    except (TypeError, ValueError):
+        raise ValueError('current_score, overs, wickets and last_five must be numbers')
+    # NaN passes every range check below, so reject NaN and infinity first
+    if not all(math.isfinite(state[k]) for k in predict.INPUTS[3:]):
+        raise ValueError('current_score, overs, wickets and last_five must be finite')
+    if state['overs'] < 5 or state['overs'] > 20:
+        raise ValueError('overs must be between 5 and 20')
+    predict.validate(predict.from_inputs(*(state[k] for k in predict.INPUTS)), categories)
+    try:
+        state['match_id'] = int(item.get('match_id', -1))
+        state['innings'] = int(item.get('innings', 1))
+    except (TypeError, ValueError):
+        raise ValueError('match_id and innings must be integers')
+    return state
+
+
+class Service:
+    def __init__(self, model, max_batch=64, max_wait=0.002, audit=None, projections=None):
+        self.model = model
+        self.batcher = MicroBatcher(model, max_batch, max_wait, audit)
+        self.projections = projections
+        self.looked_up = 0
+        self.started = time.time()
+
+    def project(self, state):
+        """The result for ``state`` from the projection tables, or None if they do not cover it."""
+        tables = self.projections
+        if tables is None or not tables.covers(state['batting_team'], state['bowling_team'], state['city'],
+                                               state['current_score'], state['last_five']):
+            return None
+        value = tables.lookup_inputs(*(state[k] for k in predict.INPUTS))
+        predicted = int(value)
+        runs_to_add, required_rate = predict.projection(predicted, state['current_score'], state['overs'])
+        result = {'predicted_score': predicted, 'runs_to_add': int(runs_to_add),
+                  'required_rate': round(float(required_rate), 2)}
+        if self.model.intervals is not None:
+            columns = predict.from_inputs(*(state[k] for k in predict.INPUTS))
+            low, high = self.model.intervals.bounds(np.array([value]), columns['balls_left'], columns['current_score'])
+            result['interval'] = [int(low[0]), int(high[0])]
+        self.looked_up += 1
+        return result
+
+    async def answer(self, state):
+        result = self.project(state)
+        return result if result is not None else await self.batcher.submit(state)
+
+    async def handle(self, method, path, body):
+        if path == '/health':
+            return 200, {'status': 'ok', 'pid': os.getpid(), 'uptime': round(time.time() - self.started, 1),
+                         'batches': self.batcher.batches, 'states': self.batcher.states,
+                         'looked_up': self.looked_up}
+        if path != '/predict':
+            return 404, {'error': 'not found'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+        try:
+            payload = json.loads(body)
+            items = payload if isinstance(payload, list) else [payload]
+            states = [parse_state(item, self.model.categories) for item in items]
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        results = await asyncio.gather(*(self.answer(s) for s in states))
+        return 200, results if isinstance(payload, list) else results[0]
+
+    async def connection(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    status, result = 413, {'error': 'payload too large'}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    try:
+                        status, result = await self.handle(method, path.split('?')[0], body)
+                    except Exception as e:
+                        status, result = 500, {'error': f'{type(e).__name__}: {e}'}
+                    keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                data = json.dumps(result).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8000, sock=None):
+        batcher = asyncio.create_task(self.batcher.run())
+        if sock is not None:
+            server = await asyncio.start_server(self.connection, sock=sock)
+        else:
+            server = await asyncio.start_server(self.connection, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve T20 score predictions over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--model', default=None,
+                        help='a bundle directory (default Model/bundle if exported), Model/pipe.pkl '
+                             'or a fastpath.py export (.npz)')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--audit-dir', default=audit.AUDIT_ROOT)
+    parser.add_argument('--no-audit', action='store_true', help='do not record scored states')
+    parser.add_argument('--projections', metavar='DIR', default=None,
+                        help='answer the fixtures tabled in DIR (projection.py build) by lookup')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model = bundle.load_predictor(args.model)
+    projections = None
+    if args.projections:
+        import projection
+        try:
+            projections = projection.ProjectionTable(args.projections, model.version)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    print(f"Model loaded in {time.perf_counter() - start:.2f}s; listening on http://{args.host}:{args.port}")
+    log = None if args.no_audit else audit.AuditLog(args.audit_dir, source='service')
+    service = Service(model, args.max_batch, args.max_wait_ms / 1000, log, projections)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
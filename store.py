@@ -0,0 +1,308 @@
+"""Typed, columnar ball-by-ball store.
+
+Replaces the pickled ``dataset_level1.pkl`` / ``dataset_level2.pkl`` frames.
+A store is a directory holding one ``.npy`` file per column plus a small
+``meta.json``::
+
+    deliveries/
+        meta.json          schema, row count, category vocabularies
+        partitions.npy     (match_id, start, stop) for every match
+        match_id.npy  innings.npy  over.npy  ball.npy  runs.npy  wicket.npy
+        batting_team.npy  bowling_team.npy  city.npy  venue.npy
+
+Rows are sorted by ``match_id`` so every match is one contiguous partition.
+Text columns are stored as integer codes into a vocabulary kept in
+``meta.json``. Columns are opened with ``np.load(mmap_mode='r')``, so reading
+``runs`` and ``match_id`` only touches those two files.
+
+    python store.py Training/dataset_level2.pkl Training/deliveries
+"""
+import argparse
+import json
+import os
+import pickle
+
+import numpy as np
+
+META_FILE = 'meta.json'
+PARTITIONS_FILE = 'partitions.npy'
+
+# Column -> storage dtype. 'category' columns are stored as int16 codes.
+DELIVERY_SCHEMA = {
+    'match_id': 'int32',
+    'innings': 'int8',
+    'batting_team': 'category',
+    'bowling_team': 'category',
+    'city': 'category',
+    'venue': 'category',
+    'over': 'int16',
+    'ball': 'int16',
+    'runs': 'int16',
+    'wicket': 'bool',
+}
+
+# Persisted training table (see features.build_features(keys=True))
+FEATURE_SCHEMA = {
+    'match_id': 'int32',
+    'innings': 'int8',
+    'batting_team': 'category',
+    'bowling_team': 'category',
+    'city': 'category',
+    'current_score': 'int16',
+    'balls_left': 'int16',
+    'wickets_left': 'int8',
+    'crr': 'float64',
+    'last_five': 'int16',
+    'runs_x': 'int16',
+}
+CODE_DTYPE = 'int16'
+
+
+def split_ball(ball):
+    """Split Cricsheet ball keys (``12.3`` -> over 12, ball 3) without strings.
+
+    Matches the notebook's ``str(x).split('.')`` for up to two decimals, so an
+    eleventh delivery ``3.11`` stays ball 11 while ``3.1`` is ball 1.
+    """
+    ball = np.asarray(ball, dtype='float64')
+    over = np.floor(ball)
+    frac = np.rint((ball - over) * 100).astype('int16')
+    ball_no = np.where(frac % 10 == 0, frac // 10, frac)
+    return over.astype('int16'), ball_no.astype('int16')
+
+
+def _encode(values, categories=None):
+    # Factorize a column into codes, reusing (and extending) a vocabulary
+    import pandas as pd
+
+    values = pd.Series(values, copy=False)
+    categories = list(categories or [])
+    new = sorted(set(values.dropna().unique()) - set(categories))
+    categories.extend(new)
+    codes = pd.Categorical(values, categories=categories).codes.astype(CODE_DTYPE)
+    return codes, categories
+
+
+def write_store(df, root, schema=DELIVERY_SCHEMA, partition_by='match_id'):
+    """Persist ``df`` as a columnar store under ``root`` (replaced if present)."""
+    meta = {'version': 1, 'rows': 0, 'partition_by': partition_by, 'columns': {}}
+    for col, dtype in schema.items():
+        if dtype == 'category':
+            meta['columns'][col] = {'dtype': CODE_DTYPE, 'categorical': True, 'categories': []}
+        else:
+            meta['columns'][col] = {'dtype': dtype}
+    os.makedirs(root, exist_ok=True)
+    _write_columns(root, meta, _encode_frame(df, meta))
+    return meta
+
+
+def write_arrays(columns, root, schema, partition_by='match_id'):
+    """Persist ``{column: array}`` as a store under ``root`` using numpy only.
+
+    For writers that should not import pandas (the audit log in the serving
+    processes). Text columns get their own sorted vocabulary.
+    """
+    meta = {'version': 1, 'rows': 0, 'partition_by': partition_by, 'columns': {}}
+    order = np.argsort(np.asarray(columns[partition_by]), kind='stable')
+    encoded = {}
+    for col, dtype in schema.items():
+        values = np.asarray(columns[col])[order]
+        if dtype == 'category':
+            categories, values = np.unique(values.astype(str), return_inverse=True)
+            meta['columns'][col] = {'dtype': CODE_DTYPE, 'categorical': True, 'categories': categories.tolist()}
+        else:
+            meta['columns'][col] = {'dtype': dtype}
+        encoded[col] = values.astype(meta['columns'][col]['dtype'])
+    os.makedirs(root, exist_ok=True)
+    _write_columns(root, meta, encoded)
+    return meta
+
+
+def append_store(df, root, schema=DELIVERY_SCHEMA, partition_by='match_id', drop=()):
+    """Add the rows of ``df`` to the store at ``root``, creating it if needed.
+
+    Partitions of ``df`` that already exist in the store are replaced, and
+    the partitions listed in ``drop`` are removed. Category vocabularies are
+    extended, so existing codes stay valid. Each column is rewritten once, so
+    the cost is a sequential copy of the store rather than a rebuild.
+    """
+    if not os.path.exists(os.path.join(root, META_FILE)):
+        return write_store(df, root, schema, partition_by)
+    meta = read_meta(root)
+    partition_by = meta['partition_by']
+    old = read_columns(root)
+    new = _encode_frame(df, meta)
+
+    removed = np.union1d(new[partition_by], np.asarray(list(drop), dtype=old[partition_by].dtype))
+    keep = ~np.isin(old[partition_by], removed)
+    columns = {col: np.concatenate([old[col][keep], new[col]]) for col in meta['columns']}
+    keys = columns[partition_by]
+    if len(keys) and (keys[1:] < keys[:-1]).any():
+        order = np.argsort(keys, kind='stable')
+        columns = {col: values[order] for col, values in columns.items()}
+    _write_columns(root, meta, columns)
+    return meta
+
+
+def _encode_frame(df, meta):
+    # Frame -> {column: array in storage dtype}, sorted by the partition key;
+    # category vocabularies in ``meta`` are extended in place
+    order = np.argsort(df[meta['partition_by']].to_numpy(), kind='stable')
+    columns = {}
+    for col, entry in meta['columns'].items():
+        values = df[col].to_numpy()[order]
+        if entry.get('categorical'):
+            values, entry['categories'] = _encode(values, entry['categories'])
+        columns[col] = values.astype(entry['dtype'])
+    return columns
+
+
+def _write_columns(root, meta, columns):
+    # Every file goes through a temp name + os.replace, meta.json last, so
+    # readers never see a half-written column
+    def save(name, values):
+        tmp = os.path.join(root, f'.{name}.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, values)
+        os.replace(tmp, os.path.join(root, name))
+
+    for col, values in columns.items():
+        save(f'{col}.npy', values)
+    save(PARTITIONS_FILE, _partitions(columns[meta['partition_by']]))
+    meta['rows'] = int(len(columns[meta['partition_by']]))
+    tmp = os.path.join(root, f'.{META_FILE}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(tmp, os.path.join(root, META_FILE))
+
+
+def _partitions(keys):
+    # (key, start, stop) for every run of equal keys in a sorted array
+    if len(keys) == 0:
+        return np.empty((0, 3), dtype='int64')
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    stops = np.r_[starts[1:], len(keys)]
+    return np.column_stack([keys[starts], starts, stops]).astype('int64')
+
+
+def read_meta(root):
+    with open(os.path.join(root, META_FILE), 'r') as f:
+        return json.load(f)
+
+
+def read_partitions(root):
+    """Return the ``(match_id, start, stop)`` partition index of a store."""
+    return np.load(os.path.join(root, PARTITIONS_FILE))
+
+
+def read_columns(root, columns=None, mmap=True):
+    """Return ``{column: ndarray}`` of raw stored values (codes for categories).
+
+    With ``mmap=True`` the arrays are read-only memory maps, so nothing is
+    read from disk until it is used.
+    """
+    meta = read_meta(root)
+    columns = columns or list(meta['columns'])
+    mode = 'r' if mmap else None
+    return {col: np.load(os.path.join(root, f'{col}.npy'), mmap_mode=mode) for col in columns}
+
+
+def read_store(root, columns=None, match_ids=None, mmap=True):
+    """Load a store as a DataFrame with categorical text columns.
+
+    ``columns`` projects to a subset of columns and ``match_ids`` to a subset
+    of partitions; only the requested slices are read.
+    """
+    import pandas as pd
+
+    meta = read_meta(root)
+    columns = columns or list(meta['columns'])
+    arrays = read_columns(root, columns, mmap)
+
+    if match_ids is not None:
+        parts = read_partitions(root)
+        parts = parts[np.isin(parts[:, 0], list(match_ids))]
+        index = np.concatenate([np.arange(s, e) for _, s, e in parts]) if len(parts) else np.empty(0, 'int64')
+        arrays = {col: arr[index] for col, arr in arrays.items()}
+
+    data = {}
+    for col in columns:
+        entry = meta['columns'][col]
+        if entry.get('categorical'):
+            data[col] = pd.Categorical.from_codes(arrays[col], categories=entry['categories'])
+        else:
+            data[col] = arrays[col]
+    return pd.DataFrame(data, copy=False)
+
+
+def iter_chunks(root, matches_per_chunk, columns=None, match_ids=None):
+    """Yield the store as DataFrames of ``matches_per_chunk`` whole matches.
+
+    Matches are contiguous row ranges, so each chunk is a slice of the
+    memory-mapped columns and only that slice is read. ``match_ids``
+    restricts the chunks to those matches.
+    """
+    import pandas as pd
+
+    meta = read_meta(root)
+    columns = columns or list(meta['columns'])
+    arrays = read_columns(root, columns)
+    parts = read_partitions(root)
+    if match_ids is not None:
+        parts = parts[np.isin(parts[:, 0], list(match_ids))]
+    for i in range(0, len(parts), matches_per_chunk):
+        block = parts[i:i + matches_per_chunk]
+        contiguous = (block[1:, 1] == block[:-1, 2]).all()
+        if contiguous:
+            index = slice(block[0, 1], block[-1, 2])
+        else:
+            index = np.concatenate([np.arange(s, e) for _, s, e in block])
+        data = {}
+        for col in columns:
+            entry = meta['columns'][col]
+            values = np.asarray(arrays[col][index])
+            if entry.get('categorical'):
+                values = pd.Categorical.from_codes(values, categories=entry['categories'])
+            data[col] = values
+        yield pd.DataFrame(data, copy=False)
+
+
+def from_level2(df):
+    """Convert the notebook's ``dataset_level2`` frame to the store schema."""
+    over, ball = split_ball(df['ball'])
+    out = df[['match_id', 'batting_team', 'bowling_team', 'city', 'venue', 'runs']].copy()
+    out['innings'] = 1
+    out['over'] = over
+    out['ball'] = ball
+    out['wicket'] = (df['player_dismissed'] != '0').to_numpy()
+    return out
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    # dataset_level*.pkl were written with pandas 1.x, whose Int64Index no
+    # longer exists in pandas 2.x
+    def find_class(self, module, name):
+        if module == 'pandas.core.indexes.numeric':
+            import pandas as pd
+            return pd.Index
+        return super().find_class(module, name)
+
+
+def load_legacy_pickle(path):
+    """Load one of the notebook's pandas 1.x pickles under pandas 2.x."""
+    with open(path, 'rb') as f:
+        return _LegacyUnpickler(f).load()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert dataset_level2.pkl to a columnar delivery store.')
+    parser.add_argument('pickle', help='path to dataset_level2.pkl')
+    parser.add_argument('root', help='output store directory')
+    args = parser.parse_args()
+
+    meta = write_store(from_level2(load_legacy_pickle(args.pickle)), args.root)
+    print(f"Wrote {meta['rows']} deliveries to {args.root}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,464 @@
+"""Headless training pipeline extracted from Training/Training.ipynb.
+
+Stages, each keyed on a hash of its inputs and parameters::
+
+    ingest     parse the Cricsheet YAML files (ingest.py, cached per file)
+    flatten    one row per delivery (flatten.py)
+    features   the training table (features.build_features)
+    split      train_test_split(test_size=0.2, random_state=1), as the notebook,
+               or 20% of the matches held out whole (--split group|time)
+    fit        OneHotEncoder(drop='first') + StandardScaler + XGBRegressor
+    evaluate   R2 / MAE on the test split, model size and fast path latency
+    export     pipe.pkl and a bundle/ directory under .cache/model, or under
+               Model/ (the served model) with --publish; skipped when the
+               test R2 is below ``MIN_R2``
+
+A stage whose output is cached under ``.cache/train`` is loaded instead of
+recomputed, and stages are only run when a later stage needs them, so an
+unchanged dataset goes straight from the cache to export. Every stage prints
+its wall time, the peak traced allocation (Python and numpy, tracemalloc)
+and the peak RSS (which includes XGBoost's native memory). Each run is
+appended to ``Training/data/train_runs.jsonl`` to follow the cost as the
+data grows.
+
+Unlike the notebook, rows are not shuffled with an unseeded ``sample()``
+before the split, so the split (and ``fastpath.held_out_set``) is
+reproducible.
+
+``--mode native`` fits a cheaper model instead: the teams and city go to the
+``hist`` tree method as categorical features (OrdinalEncoder, no scaler, no
+one-hot columns), with shallower trees and early stopping on a validation
+set of whole matches carved out of the training rows. The test split is the same in both
+modes, so the printed R2 / MAE, fit time, model size and per-prediction
+latency compare directly.
+
+    python train.py                           # Dataset/t20s -> .cache/model
+    python train.py --publish                 # Dataset/t20s -> Model/, served from then on
+    python train.py --source level2 --out /tmp/model
+    python train.py --no-cache --intervals
+    python train.py --source level2 --mode native --out /tmp/native
+    python train.py --split time --mode native  # test on the most recent matches
+
+The notebook's row split leaks (see cv.py): its test rows share innings
+with training rows, so its R2 says little about a match the model has not
+seen. ``--split group`` and ``--split time`` report the honest figures.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import pickle
+import time
+import tracemalloc
+
+import numpy as np
+
+import ingest
+from schema import CATEGORICAL, FEATURES, NUMERIC, TARGET
+
+CACHE_DIR = os.path.join(ingest.ROOT, '.cache', 'train')
+RUNS_LOG = os.path.join(ingest.ROOT, 'Training', 'data', 'train_runs.jsonl')
+MODEL_DIR = os.path.join(ingest.ROOT, 'Model')
+# Where runs export unless told to replace the served model in MODEL_DIR
+SCRATCH_DIR = os.path.join(ingest.ROOT, '.cache', 'model')
+KEEP_CACHED = 3
+
+# The notebook's model and split
+MODEL_PARAMS = {'n_estimators': 1000, 'learning_rate': 0.2, 'max_depth': 12, 'random_state': 1}
+TEST_SIZE = 0.2
+RANDOM_STATE = 1
+SPLITS = ['rows', 'group', 'time']
+
+# Native categorical splits on the hist tree method; n_estimators is only a
+# cap, the validation split decides how many trees are kept
+NATIVE_PARAMS = {'n_estimators': 2000, 'learning_rate': 0.2, 'max_depth': 8, 'max_bin': 256,
+                 'max_cat_to_onehot': 1, 'early_stopping_rounds': 50, 'random_state': 1}
+VALIDATION_SIZE = 0.1
+MODES = {'notebook': MODEL_PARAMS, 'native': NATIVE_PARAMS}
+# A test R2 below this is a broken fit, not a weak model: grouped CV gives 0.3-0.45
+MIN_R2 = 0.2
+LATENCY_ROWS = 1000
+
+
+def make_pipeline(**params):
+    """The notebook's pipeline; ``sparse_output`` replaces the removed ``sparse``."""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+    from xgboost import XGBRegressor
+
+    trf = ColumnTransformer([
+        ('trf', OneHotEncoder(sparse_output=False, drop='first'), CATEGORICAL)
+    ], remainder='passthrough')
+    return Pipeline(steps=[
+        ('step1', trf),
+        ('step2', StandardScaler()),
+        ('step3', XGBRegressor(**{**MODEL_PARAMS, **params})),
+    ])
+
+
+def make_native_pipeline(**params):
+    """OrdinalEncoder codes for the categoricals, fed to XGBoost as categorical features."""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OrdinalEncoder
+    from xgboost import XGBRegressor
+
+    trf = ColumnTransformer([('trf', OrdinalEncoder(), CATEGORICAL)], remainder='passthrough')
+    native = {'tree_method': 'hist', 'enable_categorical': True,
+              'feature_types': ['c'] * len(CATEGORICAL) + ['q'] * len(NUMERIC)}
+    return Pipeline(steps=[
+        ('step1', trf),
+        ('step3', XGBRegressor(**{**native, **NATIVE_PARAMS, **params})),
+    ])
+
+
+def key(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def files_key(data_dir):
+    """Hash of the match files' names, sizes and mtimes."""
+    entries = []
+    for match_id, path in ingest.match_files(data_dir).items():
+        st = os.stat(path)
+        entries.append((match_id, st.st_size, st.st_mtime_ns))
+    return key(entries)
+
+
+def _reset_peak_rss():
+    # Linux resets the VmHWM high-water mark on "5"; elsewhere it keeps growing
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class Runner:
+    """Runs stages lazily with an on-disk cache and per-stage measurements."""
+
+    def __init__(self, cache_dir=CACHE_DIR, use_cache=True, trace=True):
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.trace = trace
+        self.results = {}
+        self.report = []
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def stage(self, name, stage_key, fn, *inputs, cache=True):
+        """Result of ``fn(*resolved inputs)``; ``inputs`` are callables for upstream stages."""
+        if name in self.results:
+            return self.results[name]
+        path = os.path.join(self.cache_dir, f'{name}-{stage_key}.pkl')
+        cached = cache and self.use_cache and os.path.exists(path)
+        # Upstream stages run (and are measured) before this one starts
+        values = [] if cached else [dep() for dep in inputs]
+        _reset_peak_rss()
+        if self.trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            if cached:
+                with open(path, 'rb') as f:
+                    result = pickle.load(f)
+            else:
+                result = fn(*values)
+            seconds = time.perf_counter() - start
+            traced = tracemalloc.get_traced_memory()[1] if self.trace else None
+        finally:
+            if self.trace:
+                tracemalloc.stop()
+        if cache and not cached:
+            self._save(name, path, result)
+        entry = {'stage': name, 'key': stage_key, 'seconds': round(seconds, 3), 'cached': cached,
+                 'peak_traced': traced, 'peak_rss': _peak_rss()}
+        self.report.append(entry)
+        print(format_entry(entry), flush=True)
+        self.results[name] = result
+        return result
+
+    def _save(self, name, path, result):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        # Keep the few most recent results of each stage
+        old = sorted(glob.glob(os.path.join(self.cache_dir, f'{name}-*.pkl')), key=os.path.getmtime)
+        for stale in old[:-KEEP_CACHED]:
+            os.remove(stale)
+
+
+def _mib(value):
+    return f'{value / 2 ** 20:7.0f} MiB' if value is not None else '      - MiB'
+
+
+def format_entry(entry):
+    note = 'cached' if entry['cached'] else ''
+    return (f"{entry['stage']:<9} {entry['seconds']:9.2f}s  peak traced {_mib(entry['peak_traced'])}  "
+            f"peak RSS {_mib(entry['peak_rss'])}  {note}").rstrip()
+
+
+def split(table, test_size=TEST_SIZE, random_state=RANDOM_STATE, by='rows', dates=None):
+    """``(X_train, X_test, y_train, y_test)``; ``by='group'`` or ``'time'`` holds out whole matches."""
+    from sklearn.model_selection import train_test_split
+
+    X = table[FEATURES]
+    y = table[TARGET]
+    if by == 'rows':
+        return train_test_split(X, y, test_size=test_size, random_state=random_state)
+    import cv
+    train_rows, test_rows = cv.holdout_split(table['match_id'].to_numpy(), test_size, dates, random_state)
+    return X.iloc[train_rows], X.iloc[test_rows], y.iloc[train_rows], y.iloc[test_rows]
+
+
+def fit_native(X, y, params, groups, validation_size=VALIDATION_SIZE, random_state=RANDOM_STATE,
+               categories=None):
+    """Fit ``make_native_pipeline``, early stopping on ``validation_size`` of the matches.
+
+    ``groups`` holds the match id of every row, so no innings has deliveries
+    on both sides of the validation split. ``categories`` fixes the encoder's
+    vocabularies (one list per categorical column) instead of taking them
+    from ``X``.
+    """
+    import cv
+
+    fit_rows, val_rows = cv.holdout_split(np.asarray(groups), validation_size, seed=random_state)
+    X_fit, X_val = X.iloc[fit_rows], X.iloc[val_rows]
+    y = np.asarray(y)
+    y_fit, y_val = y[fit_rows], y[val_rows]
+    pipe = make_native_pipeline(**params)
+    if categories is not None:
+        pipe.set_params(step1__trf__categories=categories)
+    # The encoder sees every training row so the validation rows have known codes
+    encoder = pipe.named_steps['step1'].fit(X)
+    start_from_mean(pipe.named_steps['step3'], y_fit)
+    pipe.named_steps['step3'].fit(encoder.transform(X_fit), y_fit,
+                                  eval_set=[(encoder.transform(X_val), y_val)], verbose=False)
+    return pipe
+
+
+def start_from_mean(model, y):
+    """Boost from the mean score rather than XGBoost's default base_score of 0.5.
+
+    With early stopping a few hundred trees may be all that is kept, and
+    climbing from 0.5 to ~160 runs would use up most of them.
+    """
+    if model.get_params().get('base_score') is None:
+        model.set_params(base_score=float(np.mean(y)))
+    return model
+
+
+def refit(pipe, X, y, groups):
+    """Fit a fresh copy of ``pipe`` (either mode) on ``X``, ``y`` of the matches in ``groups``."""
+    import fastpath
+    if fastpath.native_categorical(pipe):
+        return fit_native(X, y, pipe.named_steps['step3'].get_params(), groups)
+    from sklearn.base import clone
+    return clone(pipe).fit(X, y)
+
+
+def fit(data, params, mode='notebook', match_ids=None):
+    """``(pipe, seconds)``; the time is kept so a cached fit still reports it.
+
+    ``match_ids`` is the table's match_id column; the split keeps the table's
+    index, so it gives the match of every training row.
+    """
+    X_train, X_test, y_train, y_test = data
+    start = time.perf_counter()
+    if mode == 'native':
+        pipe = fit_native(X_train, y_train, params, match_ids.loc[X_train.index])
+    else:
+        pipe = make_pipeline(**params)
+        pipe.fit(X_train, y_train)
+    return pipe, round(time.perf_counter() - start, 3)
+
+
+def latency(fn, rows, repeat):
+    fn(rows)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(rows)
+    return (time.perf_counter() - start) / repeat
+
+
+def profile(pipe, X):
+    """Size of the booster and fast path latency, single rows and a batch."""
+    import fastpath
+
+    booster = pipe.named_steps['step3'].get_booster()
+    fast = fastpath.FastPredictor.from_pipeline(pipe)
+    batch = X.iloc[:LATENCY_ROWS]
+    return {'trees': int(len(fast.roots)), 'depth': fast.depth, 'nodes': int(len(fast.feature)),
+            'booster_bytes': len(booster.save_raw('ubj')),
+            'fastpath_bytes': int(sum(np.asarray(a).nbytes for a in fast.arrays.values())),
+            'row_us': round(latency(lambda rows: fast.predict(rows, check=False), X.iloc[[0]], 200) * 1e6, 1),
+            'batch_us_per_row': round(latency(lambda rows: fast.predict(rows, check=False), batch, 5)
+                                      / len(batch) * 1e6, 2)}
+
+
+def evaluate(fitted, data):
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    pipe, fit_seconds = fitted
+    X_train, X_test, y_train, y_test = data
+    y_pred = pipe.predict(X_test)
+    return {'r2': round(float(r2_score(y_test, y_pred)), 6), 'mae': round(float(mean_absolute_error(y_test, y_pred)), 6),
+            'train_rows': int(len(X_train)), 'test_rows': int(len(X_test)), 'fit_seconds': fit_seconds,
+            **profile(pipe, X_test)}
+
+
+def export(pipe, metrics, out_dir, training_key, data_hash=None, intervals=False):
+    import bundle
+
+    os.makedirs(out_dir, exist_ok=True)
+    model_path = os.path.join(out_dir, 'pipe.pkl')
+    tmp = model_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(pipe, f)
+    os.replace(tmp, model_path)
+    bundle_path = os.path.join(out_dir, 'bundle')
+    manifest = bundle.save_bundle(pipe, bundle_path, data_hash, metrics)
+    extra = {'training_key': training_key}
+    arrays = {}
+    if intervals:
+        import intervals as calibration
+        calibrated, extra['intervals'] = calibration.calibrate(pipe, fit=lambda X, y, groups: refit(pipe, X, y, groups))
+        arrays = calibrated.arrays()
+    bundle.add_arrays(bundle_path, arrays, **extra)
+    return manifest['model_version']
+
+
+def exported_key(out_dir):
+    try:
+        with open(os.path.join(out_dir, 'bundle', 'manifest.json'), 'r') as f:
+            return json.load(f).get('training_key')
+    except (OSError, ValueError):
+        return None
+
+
+def run(source='yaml', data_dir=ingest.DATA_DIR, out_dir=SCRATCH_DIR, params=None, use_cache=True,
+        trace=True, intervals=False, workers=None, mode='notebook', by='rows', min_r2=MIN_R2):
+    """Run the pipeline; returns ``(metrics, report)``.
+
+    Nothing is exported when the test R2 is below ``min_r2``
+    (``metrics['exported']``).
+    """
+    import features
+    import flatten
+    import store
+
+    params = {**MODES[mode], **(params or {})}
+    runner = Runner(use_cache=use_cache, trace=trace)
+    if source == 'level2':
+        import bundle
+        data_hash = bundle.file_hash(features.LEVEL2_PKL)
+        ingest_key = key('level2', data_hash)
+        matches = lambda: runner.stage('ingest', ingest_key,
+                                       lambda: store.load_legacy_pickle(features.LEVEL2_PKL), cache=False)
+        flat = lambda: runner.stage('flatten', key(ingest_key), store.from_level2, matches)
+    else:
+        data_hash = files_key(data_dir)
+        ingest_key = key('yaml', data_hash)
+        # ingest.py keeps its own per-file cache, so this stage is not pickled again
+        matches = lambda: runner.stage('ingest', ingest_key,
+                                       lambda: ingest.load_matches(data_dir, workers=workers), cache=False)
+        flat = lambda: runner.stage('flatten', key(ingest_key),
+                                    lambda m: flatten.to_store_frame(flatten.flatten_matches(m)), matches)
+    features_key = key(ingest_key, 'features', 'keys')
+    table = lambda: runner.stage('features', features_key, lambda d: features.build_features(d, keys=True), flat)
+    if by == 'rows':
+        split_key = key(features_key, TEST_SIZE, RANDOM_STATE)
+        data = lambda: runner.stage('split', split_key, split, table)
+    else:
+        import cv
+        split_key = key(features_key, TEST_SIZE, RANDOM_STATE, by)
+        dates = lambda t: cv.match_dates(t['match_id'].to_numpy(), data_dir) if by == 'time' else None
+        data = lambda: runner.stage('split', split_key,
+                                    lambda t: split(t, TEST_SIZE, RANDOM_STATE, by, dates(t)), table)
+    fit_key = key(split_key, mode, params, 'match-validation')
+    fitted = lambda: runner.stage('fit', fit_key, lambda d, t: fit(d, params, mode, t['match_id']), data, table)
+    model = lambda: fitted()[0]
+    metrics = runner.stage('evaluate', key(fit_key), evaluate, fitted, data)
+    metrics['exported'] = bool(out_dir) and metrics['r2'] >= min_r2
+    if out_dir and not metrics['exported']:
+        print(f"export    skipped: test R2 {metrics['r2']:.4f} is below {min_r2}, {out_dir} is unchanged")
+    elif out_dir:
+        training_key = key(fit_key, intervals)
+        if use_cache and exported_key(out_dir) == training_key:
+            print(f"export    {out_dir} is up to date")
+        else:
+            runner.stage('export', training_key, lambda pipe: export(pipe, metrics, out_dir, training_key, data_hash, intervals),
+                         model, cache=False)
+    return metrics, runner.report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the score model headlessly, stage by stage.')
+    parser.add_argument('--source', choices=['yaml', 'level2'], default='yaml',
+                        help='Dataset/t20s YAML files, or Training/dataset_level2.pkl')
+    parser.add_argument('--data-dir', default=ingest.DATA_DIR)
+    parser.add_argument('--out', default=None,
+                        help="directory for pipe.pkl and bundle/ (default: .cache/model; '' to skip)")
+    parser.add_argument('--publish', action='store_true', help='export to Model/, replacing the served model')
+    parser.add_argument('--min-r2', type=float, default=MIN_R2, help='lowest test R2 that is exported')
+    parser.add_argument('--mode', choices=sorted(MODES), default='notebook',
+                        help='notebook: one-hot + depth-12 trees; native: categorical hist trees, early stopping')
+    parser.add_argument('--split', choices=SPLITS, default='rows',
+                        help="rows: the notebook's (leaky) row shuffle; group: random matches; time: latest matches")
+    parser.add_argument('--n-estimators', type=int, default=None, help='default 1000 (notebook), 2000 cap (native)')
+    parser.add_argument('--learning-rate', type=float, default=None)
+    parser.add_argument('--max-depth', type=int, default=None)
+    parser.add_argument('--early-stopping-rounds', type=int, default=None, help='native mode only')
+    parser.add_argument('--intervals', action='store_true', help='calibrate P10/P90 intervals into the bundle')
+    parser.add_argument('--no-cache', action='store_true', help='recompute every stage')
+    parser.add_argument('--no-trace', action='store_true', help='skip tracemalloc (it slows Python-heavy stages)')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    given = {'n_estimators': args.n_estimators, 'learning_rate': args.learning_rate, 'max_depth': args.max_depth,
+             'early_stopping_rounds': args.early_stopping_rounds}
+    if args.mode == 'notebook' and args.early_stopping_rounds is not None:
+        parser.error('--early-stopping-rounds needs --mode native')
+    if args.publish and args.out is not None:
+        parser.error('--publish writes Model/; drop --out')
+    out_dir = MODEL_DIR if args.publish else (SCRATCH_DIR if args.out is None else args.out)
+    params = {**MODES[args.mode], **{k: v for k, v in given.items() if v is not None}}
+    start = time.perf_counter()
+    metrics, report = run(args.source, args.data_dir, out_dir, params, not args.no_cache, not args.no_trace,
+                          args.intervals, args.workers, args.mode, args.split, args.min_r2)
+    total = time.perf_counter() - start
+    print(f"Test R2 {metrics['r2']:.4f}, MAE {metrics['mae']:.2f} on {metrics['test_rows']} rows "
+          f"({args.split} split); "
+          f"total {total:.1f}s")
+    print(f"Model: fit {metrics['fit_seconds']:.1f}s, {metrics['trees']} trees of depth {metrics['depth']} "
+          f"({metrics['nodes']} nodes), booster {metrics['booster_bytes'] / 2 ** 20:.1f} MiB, "
+          f"fast path {metrics['fastpath_bytes'] / 2 ** 20:.1f} MiB; {metrics['row_us']:.0f} us per single-row "
+          f"prediction, {metrics['batch_us_per_row']:.1f} us per row in batches of {LATENCY_ROWS}")
+
+    os.makedirs(os.path.dirname(RUNS_LOG), exist_ok=True)
+    with open(RUNS_LOG, 'a') as f:
+        f.write(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'source': args.source, 'mode': args.mode,
+                            'split': args.split, 'params': params,
+                            'metrics': metrics, 'seconds': round(total, 3), 'stages': report}) + '\n')
+    if out_dir and not metrics['exported']:
+        parser.exit(1)
+    if out_dir and not args.publish:
+        print(f"Exported to {out_dir}; Model/ is unchanged (serve it with "
+              f"T20_MODEL={os.path.relpath(os.path.join(out_dir, 'bundle'), ingest.ROOT)}, or rerun with --publish)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Deferred loading and startup timings for the Streamlit apps.
+
+The apps render their widgets before anything heavy is touched: the model
+(whose unpickling pulls in sklearn, xgboost and pandas) and plotly's trace
+classes are loaded on background threads started on the first run, and the
+script only waits for them where a prediction or chart is actually drawn.
+Every load and every wait is logged to stderr and kept in ``TIMINGS``.
+
+    python warmup.py    # cold-start cost of each piece, one fresh interpreter each
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+TIMINGS = {}
+
+
+def record(name, seconds):
+    TIMINGS[name] = seconds
+    print(f"[startup] {name}: {seconds * 1000:.0f} ms", file=sys.stderr)
+
+
+class Background:
+    """Runs ``factory()`` on a daemon thread; ``result()`` waits for its value."""
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.value = self.error = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(factory,), name=f'warmup-{name}', daemon=True)
+        self.thread.start()
+
+    def _run(self, factory):
+        start = time.perf_counter()
+        try:
+            self.value = factory()
+        except BaseException as e:
+            self.error = e
+        finally:
+            record(f'{self.name} load', time.perf_counter() - start)
+            self.done.set()
+
+    def ready(self):
+        return self.done.is_set()
+
+    def result(self, timeout=None):
+        if not self.done.is_set():
+            start = time.perf_counter()
+            if not self.done.wait(timeout):
+                raise TimeoutError(f"{self.name} still loading after {timeout}s")
+            record(f'{self.name} wait', time.perf_counter() - start)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def import_plotly():
+    import plotly.graph_objects as go
+    # plotly imports its trace classes and validators on first use
+    go.Figure([go.Indicator(), go.Pie(), go.Bar(), go.Scatter()])
+    return go
+
+
+# Statements timed by ``main``, each in a fresh interpreter
+COLD_STEPS = {
+    'streamlit': 'import streamlit',
+    'plotly': 'import warmup; warmup.import_plotly()',
+    'predcache': 'import predcache',
+    'model': 'import predcache; predcache.PredictionCache()',
+}
+
+
+def main():
+    for name, statement in COLD_STEPS.items():
+        code = (f"import time; start = time.perf_counter(); {statement}; "
+                f"print(time.perf_counter() - start)")
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        print(f"{name:>10}: {float(out.stdout.split()[-1]) * 1000:7.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
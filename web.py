@@ -1,11 +1,10 @@
 import streamlit as st
-import pickle
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from datetime import datetime
-import os
-import json
+from predcache import PredictionCache
+import audit
+import warmup
+import charts
+import uuid
+from history import History
 
 # Page config
 st.set_page_config(
@@ -15,29 +14,24 @@ st.set_page_config(
 )
 
 
-HISTORY_FILE = "history.json"
+HISTORY_PAGE_SIZE = 10
 
-# Helper function to load prediction history from file
+# Prediction history database, shared by every session of this server
+@st.cache_resource
 def load_history():
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, "r") as f:
-                return json.load(f)
-        except Exception:
-            return []
-    return []
-
-# Helper function to save prediction history to file
-def save_history(history):
-    try:
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(history, f)
-    except Exception:
-        pass
-
-# Initialize session state for history
-if 'prediction_history' not in st.session_state:
-    st.session_state.prediction_history = load_history()
+    history = History()
+    history.migrate_json()
+    return history
+
+history = load_history()
+
+# Each browser session gets its own view of the shared history
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Pagination cursors of the history column (ids of the pages above the current one)
+if 'history_cursors' not in st.session_state:
+    st.session_state.history_cursors = []
 
 # Initialize session state for showing prediction
 if 'show_prediction' not in st.session_state:
@@ -80,10 +74,9 @@ if 'clear_form_action' in st.session_state and st.session_state.clear_form_actio
 
 # Handle load history action (must happen before widgets render)
 if 'load_history_action' in st.session_state and st.session_state.load_history_action is not None:
-    idx = st.session_state.load_history_action
+    item = history.get(st.session_state.load_history_action)
     st.session_state.load_history_action = None
-    if idx < len(st.session_state.prediction_history):
-        item = st.session_state.prediction_history[idx]
+    if item is not None:
         # Set widget values directly
         st.session_state.batting_team = item['batting_team']
         st.session_state.bowling_team = item['bowling_team']
@@ -96,10 +89,9 @@ if 'load_history_action' in st.session_state and st.session_state.load_history_a
         st.session_state.last_prediction = item['predicted_score']
         st.rerun()
 
-# Function to save to history and persist to file
+# Function to append a prediction to this session's history
 def save_to_history(batting_team, bowling_team, city, current_score, overs, wickets, last_five, predicted_score):
-    # Add to history (limit to 10 items)
-    history_item = {
+    history.add(st.session_state.session_id, {
         'batting_team': batting_team,
         'bowling_team': bowling_team,
         'city': city,
@@ -108,12 +100,9 @@ def save_to_history(batting_team, bowling_team, city, current_score, overs, wick
         'wickets': wickets,
         'last_five': last_five,
         'predicted_score': predicted_score,
-        'timestamp': datetime.now().strftime("%H:%M:%S")
-    }
-    st.session_state.prediction_history.insert(0, history_item)
-    if len(st.session_state.prediction_history) > 10:
-        st.session_state.prediction_history.pop()
-    save_history(st.session_state.prediction_history)
+    })
+    # Show the newest page again
+    st.session_state.history_cursors = []
 
 # Custom CSS with cricket-themed background
 st.markdown("""
@@ -285,12 +274,20 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Load model
+# Load model behind a prediction cache shared by every session in this process.
+# Model and plotly load on background threads so the page renders first;
+# charts.py imports plotly itself, waiting on the warm-up if it is still running.
 @st.cache_resource
 def load_model():
-    return pickle.load(open('./Model/pipe.pkl', 'rb'))
+    return warmup.Background('model', lambda: PredictionCache(audit=audit.AuditLog(source='web')))
 
-pipe = load_model()
+@st.cache_resource
+def load_plotly():
+    # Nothing to warm when the lightweight SVG charts are used
+    return warmup.Background('plotly', warmup.import_plotly) if charts.RENDERER == 'plotly' else None
+
+model = load_model()
+load_plotly()
 
 teams = ['Australia', 'India', 'Bangladesh', 'New Zealand', 'South Africa',
          'England', 'West Indies', 'Afghanistan', 'Pakistan', 'Sri Lanka']
@@ -378,18 +375,13 @@ overs_left = (120 - balls_faced) / 6
 teams_valid = batting_team != '-- Select Team --' and bowling_team != '-- Select Team --' and batting_team != bowling_team
 city_valid = city != '-- Select City --'
 valid_input = teams_valid and city_valid and overs >= 5 and wickets <= 10
-if valid_input:
-    input_df = pd.DataFrame({
-        'batting_team': [batting_team],
-        'bowling_team': [bowling_team],
-        'city': [city],
-        'current_score': [current_score],
-        'balls_left': [balls_left],
-        'wickets_left': [wickets_left],
-        'crr': [crr],
-        'last_five': [last_five]
-    })
-    predicted_score = int(pipe.predict(input_df)[0])
+# The model is only needed once a prediction is requested or on show
+if valid_input and (predict_clicked or st.session_state.show_prediction):
+    predicted, low, high = model.result().predict_interval_one(batting_team, bowling_team, city, current_score,
+                                                               balls_left, wickets_left, crr, last_five)
+    predicted_score = int(predicted)
+    # Calibrated P10/P90 of the final score (None for a model without intervals)
+    score_range = (int(low), predicted_score, int(high)) if low is not None else None
     runs_to_add = predicted_score - current_score
     required_rate = runs_to_add / overs_left if overs_left > 0 else 0
     
@@ -400,6 +392,7 @@ if valid_input:
         st.session_state.last_prediction = predicted_score
 else:
     predicted_score = None
+    score_range = None
     runs_to_add = None
     required_rate = None
 
@@ -407,17 +400,24 @@ else:
 with history_col:
     st.markdown("## Prediction History")
     
-    if st.button("Clear All History", key="clear_history_btn", type="secondary"):
-        st.session_state.prediction_history = []
-        save_history(st.session_state.prediction_history)
+    view = st.radio("Show", ["This session", "All sessions"], key="history_view", horizontal=True,
+                    on_change=lambda: st.session_state.history_cursors.clear())
+    session = st.session_state.session_id if view == "This session" else None
+    
+    if st.button("Clear My History", key="clear_history_btn", type="secondary"):
+        # Other sessions' predictions are kept; this one just stops seeing its own
+        history.clear(st.session_state.session_id)
+        st.session_state.history_cursors = []
         st.rerun()
     
     st.divider()
     
-    if len(st.session_state.prediction_history) == 0:
+    cursors = st.session_state.history_cursors
+    items, older = history.page(session, HISTORY_PAGE_SIZE, cursors[-1] if cursors else None)
+    if len(items) == 0:
         st.info("No predictions yet. Click 'Predict Score' to add predictions here.")
     else:
-        for idx, item in enumerate(st.session_state.prediction_history):
+        for item in items:
             # Create a clickable container for each history item
             with st.container():
                 st.markdown(f"""
@@ -429,9 +429,19 @@ with history_col:
                 </div>
                 """, unsafe_allow_html=True)
                 
-                if st.button(f"Load", key=f"load_{idx}", use_container_width=True):
-                    st.session_state.load_history_action = idx
+                if st.button(f"Load", key=f"load_{item['id']}", use_container_width=True):
+                    st.session_state.load_history_action = item['id']
                     st.rerun()
+    
+    newer_col, older_col = st.columns(2)
+    with newer_col:
+        if st.button("Newer", key="history_newer", disabled=not cursors, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with older_col:
+        if st.button("Older", key="history_older", disabled=older is None, use_container_width=True):
+            cursors.append(older)
+            st.rerun()
 
 # Dashboard Column (Sidebar)
 with dashboard_col:
@@ -523,139 +533,25 @@ with main_col:
         
         with chart_col1:
             # Run Rate Comparison Chart
-            fig_rr = go.Figure()
-            
-            fig_rr.add_trace(go.Indicator(
-                mode="gauge+number+delta",
-                value=crr,
-                delta={'reference': required_rate, 'relative': False},
-                title={'text': "Current Run Rate", 'font': {'size': 16, 'color': 'white'}},
-                gauge={
-                    'axis': {'range': [0, 15], 'tickwidth': 1, 'tickcolor': "white"},
-                    'bar': {'color': "#32CD32"},
-                    'bgcolor': "rgba(0,0,0,0)",
-                    'borderwidth': 2,
-                    'bordercolor': "#228B22",
-                    'steps': [
-                        {'range': [0, 6], 'color': 'rgba(255,0,0,0.3)'},
-                        {'range': [6, 10], 'color': 'rgba(255,255,0,0.3)'},
-                        {'range': [10, 15], 'color': 'rgba(0,255,0,0.3)'}
-                    ],
-                    'threshold': {
-                        'line': {'color': "#FFD700", 'width': 4},
-                        'thickness': 0.75,
-                        'value': required_rate
-                    }
-                }
-            ))
-            
-            fig_rr.update_layout(
-                paper_bgcolor='rgba(0,0,0,0)',
-                font={'color': "white"},
-                height=250,
-                margin=dict(l=20, r=20, t=50, b=20)
-            )
-            st.plotly_chart(fig_rr, use_container_width=True)
+            charts.show('gauge', 'classic', crr, required_rate)
         
         with chart_col2:
             # Score Projection Bar Chart
-            scenarios = ['Conservative', 'Predicted', 'Aggressive']
-            scores = [int(predicted_score * 0.9), predicted_score, int(predicted_score * 1.1)]
-            colors = ['#FF6B6B', '#32CD32', '#4ECDC4']
-            
-            fig_proj = go.Figure(data=[
-                go.Bar(
-                    x=scenarios,
-                    y=scores,
-                    marker_color=colors,
-                    text=scores,
-                    textposition='outside',
-                    textfont={'color': 'white', 'size': 14}
-                )
-            ])
-            
-            fig_proj.update_layout(
-                title={'text': 'Score Projections', 'font': {'color': 'white', 'size': 16}},
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                font={'color': 'white'},
-                height=250,
-                margin=dict(l=20, r=20, t=50, b=20),
-                yaxis={'gridcolor': 'rgba(255,255,255,0.1)', 'showgrid': True},
-                xaxis={'showgrid': False}
-            )
-            st.plotly_chart(fig_proj, use_container_width=True)
+            if score_range:
+                charts.show('bars', 'classic', score_range)
+            else:
+                st.caption("Score range needs a calibrated model (python intervals.py calibrate)")
         
         # Second row of charts
         chart_col3, chart_col4 = st.columns(2)
         
         with chart_col3:
             # Innings Progress Pie Chart
-            fig_pie = go.Figure(data=[go.Pie(
-                labels=['Runs Scored', 'Runs to Add'],
-                values=[current_score, runs_to_add],
-                hole=0.6,
-                marker_colors=['#32CD32', '#0f3460'],
-                textinfo='label+value',
-                textfont={'color': 'white'}
-            )])
-            
-            fig_pie.update_layout(
-                title={'text': 'Score Breakdown', 'font': {'color': 'white', 'size': 16}},
-                paper_bgcolor='rgba(0,0,0,0)',
-                font={'color': 'white'},
-                height=250,
-                margin=dict(l=20, r=20, t=50, b=20),
-                showlegend=False,
-                annotations=[{
-                    'text': f'{predicted_score}',
-                    'x': 0.5, 'y': 0.5,
-                    'font_size': 24,
-                    'font_color': '#FFD700',
-                    'showarrow': False
-                }]
-            )
-            st.plotly_chart(fig_pie, use_container_width=True)
+            charts.show('donut', 'classic', current_score, runs_to_add, predicted_score)
         
         with chart_col4:
             # Projected Over-by-Over Run Rate
-            remaining_overs = int(20 - overs)
-            over_numbers = list(range(int(overs) + 1, 21))
-            
-            # Simulate projected run rates
-            projected_rr = [required_rate * (1 + (i - int(overs)) * 0.05) for i in range(int(overs) + 1, 21)]
-            
-            fig_line = go.Figure()
-            
-            # Current run rate line
-            fig_line.add_hline(y=crr, line_dash="dash", line_color="#32CD32", 
-                              annotation_text=f"Current RR: {crr:.2f}")
-            
-            # Required run rate line
-            fig_line.add_hline(y=required_rate, line_dash="dot", line_color="#FFD700",
-                              annotation_text=f"Required RR: {required_rate:.2f}")
-            
-            fig_line.add_trace(go.Scatter(
-                x=over_numbers,
-                y=projected_rr,
-                mode='lines+markers',
-                name='Projected RR',
-                line={'color': '#4ECDC4', 'width': 2},
-                marker={'size': 6}
-            ))
-            
-            fig_line.update_layout(
-                title={'text': 'Projected Run Rate Trend', 'font': {'color': 'white', 'size': 16}},
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                font={'color': 'white'},
-                height=250,
-                margin=dict(l=20, r=20, t=50, b=20),
-                xaxis={'title': 'Overs', 'gridcolor': 'rgba(255,255,255,0.1)'},
-                yaxis={'title': 'Run Rate', 'gridcolor': 'rgba(255,255,255,0.1)'},
-                showlegend=False
-            )
-            st.plotly_chart(fig_line, use_container_width=True)
+            charts.show('trend', 'classic', overs, crr, required_rate)
     else:
         st.info("Enter valid match data to see analytics")
 
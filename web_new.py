@@ -1,10 +1,10 @@
 import streamlit as st
-import os
-import json
-import pickle
-import pandas as pd
-import plotly.graph_objects as go
-from datetime import datetime
+import uuid
+from history import History
+from predcache import PredictionCache
+import audit
+import warmup
+import charts
 
 # Page config
 st.set_page_config(
@@ -14,17 +14,22 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Prediction history, shared by every session of this server
+HIST_PAGE = 6
+
+@st.cache_resource
+def load_history():
+    history = History()
+    history.migrate_json()
+    return history
+
+history = load_history()
+
 # Initialize session state
-HIST_FILE = 'history.json'
-if 'prediction_history' not in st.session_state:
-    if os.path.exists(HIST_FILE):
-        try:
-            with open(HIST_FILE, 'r') as f:
-                st.session_state.prediction_history = json.load(f)
-        except Exception:
-            st.session_state.prediction_history = []
-    else:
-        st.session_state.prediction_history = []
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'history_cursors' not in st.session_state:
+    st.session_state.history_cursors = []
 if 'show_prediction' not in st.session_state:
     st.session_state.show_prediction = False
 if 'last_prediction' not in st.session_state:
@@ -47,10 +52,9 @@ if st.session_state.get('clear_form_action'):
 
 # Load history action handler
 if st.session_state.get('load_history_action') is not None:
-    idx = st.session_state.load_history_action
+    item = history.get(st.session_state.load_history_action)
     st.session_state.load_history_action = None
-    if idx < len(st.session_state.prediction_history):
-        item = st.session_state.prediction_history[idx]
+    if item is not None:
         for key in ['batting_team', 'bowling_team', 'city', 'current_score', 'overs', 'wickets', 'last_five']:
             st.session_state[key] = item[key]
         st.session_state.show_prediction = True
@@ -59,15 +63,8 @@ if st.session_state.get('load_history_action') is not None:
 
 # Save to history function
 def save_to_history(data, score):
-    item = {**data, 'predicted_score': score, 'timestamp': datetime.now().strftime("%H:%M")}
-    st.session_state.prediction_history.insert(0, item)
-    if len(st.session_state.prediction_history) > 8:
-        st.session_state.prediction_history.pop()
-    try:
-        with open(HIST_FILE, 'w') as f:
-            json.dump(st.session_state.prediction_history, f)
-    except Exception:
-        pass
+    history.add(st.session_state.session_id, {**data, 'predicted_score': score})
+    st.session_state.history_cursors = []
 
 # ── PREMIUM CSS ───────────────────────────────────────────────
 st.markdown("""
@@ -410,12 +407,20 @@ div[data-testid="stWidgetLabel"] {
 </style>
 """, unsafe_allow_html=True)
 
-# Load model
+# Load model behind a prediction cache shared by every session in this process.
+# Model and plotly load on background threads so the page renders first;
+# charts.py imports plotly itself, waiting on the warm-up if it is still running.
 @st.cache_resource
 def load_model():
-    return pickle.load(open('./Model/pipe.pkl', 'rb'))
+    return warmup.Background('model', lambda: PredictionCache(audit=audit.AuditLog(source='web')))
 
-pipe = load_model()
+@st.cache_resource
+def load_plotly():
+    # Nothing to warm when the lightweight SVG charts are used
+    return warmup.Background('plotly', warmup.import_plotly) if charts.RENDERER == 'plotly' else None
+
+model = load_model()
+load_plotly()
 
 teams = ['Australia', 'India', 'Bangladesh', 'New Zealand', 'South Africa',
          'England', 'West Indies', 'Afghanistan', 'Pakistan', 'Sri Lanka']
@@ -496,14 +501,14 @@ valid = (batting_team not in ['-- Select --'] and
          city != '-- Select --' and overs >= 5)
 
 # Prediction
-predicted_score = runs_to_add = required_rate = None
-if valid:
-    input_df = pd.DataFrame({
-        'batting_team': [batting_team], 'bowling_team': [bowling_team], 'city': [city],
-        'current_score': [current_score], 'balls_left': [balls_left],
-        'wickets_left': [wickets_left], 'crr': [crr], 'last_five': [last_five]
-    })
-    predicted_score = int(pipe.predict(input_df)[0])
+predicted_score = runs_to_add = required_rate = score_range = None
+# The model is only needed once a prediction is requested or on show
+if valid and (predict or st.session_state.show_prediction):
+    predicted, low, high = model.result().predict_interval_one(batting_team, bowling_team, city, current_score,
+                                                               balls_left, wickets_left, crr, last_five)
+    predicted_score = int(predicted)
+    # Calibrated P10/P90 of the final score (None for a model without intervals)
+    score_range = (int(low), predicted_score, int(high)) if low is not None else None
     runs_to_add = predicted_score - current_score
     required_rate = runs_to_add / overs_left if overs_left > 0 else 0
 
@@ -556,93 +561,16 @@ with col_result:
             with st.container():
                 chart1, chart2, chart3 = st.columns([1, 1, 1])
                 with chart1:
-                    fig_gauge = go.Figure(go.Indicator(
-                        mode="gauge+number",
-                        value=crr,
-                        title={'text': "Current RR", 'font': {'size': 11, 'color': '#8a9ba8'}},
-                        number={'font': {'size': 22, 'color': '#00c95d'}},
-                        gauge={
-                            'axis': {'range': [0, 15], 'tickcolor': 'rgba(255,255,255,0.2)',
-                                     'tickfont': {'color': '#8a9ba8', 'size': 7}},
-                            'bar': {'color': '#00c95d', 'thickness': 0.25},
-                            'bgcolor': 'rgba(0,0,0,0)',
-                            'borderwidth': 0,
-                            'steps': [
-                                {'range': [0, 6],   'color': 'rgba(255,59,59,0.15)'},
-                                {'range': [6, 10],  'color': 'rgba(245,200,66,0.15)'},
-                                {'range': [10, 15], 'color': 'rgba(0,201,93,0.15)'}
-                            ],
-                            'threshold': {
-                                'line': {'color': '#f5c842', 'width': 3},
-                                'thickness': 0.8,
-                                'value': required_rate
-                            }
-                        }
-                    ))
-                    fig_gauge.update_layout(
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        font={'color': '#c8d8e0'},
-                        height=180,
-                        margin=dict(l=10, r=10, t=35, b=5)
-                    )
-                    st.plotly_chart(fig_gauge, use_container_width=True, config={'displayModeBar': False})
+                    charts.show('gauge', 'pitch', crr, required_rate)
 
                 with chart2:
-                    percent_complete = int(current_score / predicted_score * 100) if predicted_score else 0
-                    fig_donut = go.Figure(data=[go.Pie(
-                        labels=['Scored', 'To Add'],
-                        values=[current_score, max(0, runs_to_add)],
-                        hole=0.65,
-                        marker=dict(
-                            colors=['#00c95d', 'rgba(255,255,255,0.05)'],
-                            line=dict(color='rgba(0,0,0,0)', width=0)
-                        ),
-                        textinfo='none',
-                        hovertemplate='%{label}: %{value}<extra></extra>'
-                    )])
-                    fig_donut.update_layout(
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        font={'color': '#c8d8e0'},
-                        height=180,
-                        margin=dict(l=10, r=10, t=10, b=10),
-                        showlegend=False,
-                        annotations=[{
-                            'text': f'<b>{percent_complete}%</b><br><span style="font-size:9px">Complete</span>',
-                            'x': 0.5, 'y': 0.5,
-                            'font_size': 16,
-                            'font_color': '#00c95d',
-                            'showarrow': False
-                        }]
-                    )
-                    st.plotly_chart(fig_donut, use_container_width=True, config={'displayModeBar': False})
+                    charts.show('donut', 'pitch', current_score, runs_to_add, predicted_score)
 
                 with chart3:
-                    conservative = int(predicted_score * 0.92)
-                    aggressive = int(predicted_score * 1.08)
-                    fig_bar = go.Figure(data=[go.Bar(
-                        x=['Conservative', 'Predicted', 'Aggressive'],
-                        y=[conservative, predicted_score, aggressive],
-                        marker=dict(
-                            color=['rgba(255,59,59,0.8)', 'rgba(0,201,93,0.9)', 'rgba(59,130,246,0.8)'],
-                            line=dict(width=0)
-                        ),
-                        text=[conservative, predicted_score, aggressive],
-                        textposition='outside',
-                        textfont={'color': '#c8d8e0', 'size': 10},
-                        width=0.5
-                    )])
-                    fig_bar.update_layout(
-                        title={'text': 'Score Projections', 'font': {'color': '#8a9ba8', 'size': 11}, 'x': 0.5},
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        font={'color': '#c8d8e0'},
-                        height=180,
-                        margin=dict(l=10, r=10, t=35, b=25),
-                        yaxis={'visible': False, 'range': [0, aggressive * 1.18]},
-                        xaxis={'tickfont': {'size': 8, 'color': '#8a9ba8'}},
-                        bargap=0.4
-                    )
-                    st.plotly_chart(fig_bar, use_container_width=True, config={'displayModeBar': False})
+                    if score_range:
+                        charts.show('bars', 'pitch', score_range)
+                    else:
+                        st.caption("Score range needs a calibrated model")
 
         else:
             st.markdown("""
@@ -665,29 +593,41 @@ with col_history:
     st.markdown('<div class="glass-card">', unsafe_allow_html=True)
     st.markdown('<p class="card-header">Recent Predictions</p>', unsafe_allow_html=True)
 
+    everyone = st.toggle("All sessions", key="hist_all",
+                         on_change=lambda: st.session_state.history_cursors.clear())
+
     if st.button("Clear History", key="clear_hist", use_container_width=True):
-        st.session_state.prediction_history = []
-        try:
-            with open(HIST_FILE, 'w') as f:
-                json.dump([], f)
-        except Exception:
-            pass
+        # Hides this session's predictions from its view; the shared log keeps them
+        history.clear(st.session_state.session_id)
+        st.session_state.history_cursors = []
         st.rerun()
 
-    if not st.session_state.prediction_history:
+    cursors = st.session_state.history_cursors
+    items, older = history.page(None if everyone else st.session_state.session_id, HIST_PAGE,
+                                cursors[-1] if cursors else None)
+    if not items:
         st.markdown('<p style="color:rgba(138,155,168,0.5);font-size:0.75rem;text-align:center;padding:1rem 0;">No history yet</p>', unsafe_allow_html=True)
     else:
-        for idx, item in enumerate(st.session_state.prediction_history[:6]):
+        for item in items:
             st.markdown(f"""
             <div class="history-item">
                 <span class="history-teams">{item['batting_team'][:3].upper()} v {item['bowling_team'][:3].upper()}</span>
                 <span class="history-score">{item['predicted_score']}</span>
             </div>
             """, unsafe_allow_html=True)
-            if st.button(f"Load", key=f"load_{idx}", use_container_width=True):
-                st.session_state.load_history_action = idx
+            if st.button(f"Load", key=f"load_{item['id']}", use_container_width=True):
+                st.session_state.load_history_action = item['id']
                 st.rerun()
 
+    if cursors or older is not None:
+        newer_col, older_col = st.columns(2)
+        if newer_col.button("‹ Newer", key="hist_newer", disabled=not cursors, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+        if older_col.button("Older ›", key="hist_older", disabled=older is None, use_container_width=True):
+            cursors.append(older)
+            st.rerun()
+
     st.markdown('</div>', unsafe_allow_html=True)
 
     # Quick Stats Card with Progress Indicators